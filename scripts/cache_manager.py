@@ -11,24 +11,29 @@ from src.services.flight_cache import flight_cache
 from src.services.parse_cache import parse_cache
 from src.services.redis_client import redis_client
 
+def print_cache_stats(stats: dict):
+    """Печатает статистику одного кэша"""
+    print(f"   Записей: {stats.get('total_entries', 0)}")
+    print(f"   Размер: {stats.get('total_size_bytes', 0)} байт")
+    print(f"   TTL: {stats.get('ttl_seconds', 0) // 3600} часов")
+    print(f"   Попаданий/промахов: {stats.get('hits', 0)}/{stats.get('misses', 0)} (hit ratio {stats.get('hit_ratio', 0)})")
+    print(f"   Истекло по TTL: {stats.get('evictions', 0)}")
+    histogram = stats.get('ttl_histogram') or {}
+    if histogram:
+        print("   Оставшийся TTL: " + ", ".join(f"{label}: {count}" for label, count in histogram.items()))
+
 def show_cache_stats():
-    """Показывает статистику всех кэшей"""
+    """Показывает статистику всех кэшей (счётчики ведутся инкрементально, ключи не обходятся)"""
     print("📊 Статистика кэшей Redis:")
     print("=" * 50)
     
     # Статистика кэша рейсов
-    flight_stats = flight_cache.get_stats()
     print(f"✈️  Кэш рейсов:")
-    print(f"   Записей: {flight_stats.get('total_entries', 0)}")
-    print(f"   Размер: {flight_stats.get('total_size_bytes', 0)} байт")
-    print(f"   TTL: {flight_stats.get('ttl_seconds', 0) // 3600} часов")
+    print_cache_stats(flight_cache.get_stats())
     
     # Статистика кэша парсинга
-    parse_stats = parse_cache.get_stats()
     print(f"🔍 Кэш парсинга:")
-    print(f"   Записей: {parse_stats.get('total_entries', 0)}")
-    print(f"   Размер: {parse_stats.get('total_size_bytes', 0)} байт")
-    print(f"   TTL: {parse_stats.get('ttl_seconds', 0) // 3600} часов")
+    print_cache_stats(parse_cache.get_stats())
     
     # Общая статистика Redis
     try:
@@ -75,8 +80,8 @@ def show_redis_keys():
         print("🔑 Ключи в Redis:")
         print("=" * 50)
         
-        # Получаем все ключи
-        all_keys = redis_client.keys("*")
+        # Получаем все ключи курсором SCAN, не блокируя Redis
+        all_keys = list(redis_client.scan_iter(match="*", count=1000))
         
         if not all_keys:
             print("📭 Redis пуст")
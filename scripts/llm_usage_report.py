@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+"""
+Отчёт по вызовам LLM за последние N дней (по умолчанию 7):
+вызовы, попадания в кэш парсинга, ошибки/таймауты, токены и средняя задержка по модели и endpoint.
+
+    python scripts/llm_usage_report.py [дней]
+"""
+
+import sys
+import os
+from datetime import date, timedelta
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.llm_usage import USAGE_FIELDS, load_usage
+
+
+def print_row(label: str, totals: dict):
+    calls = totals.get("calls", 0)
+    llm_calls = calls - totals.get("cache_hits", 0)
+    hit_ratio = totals.get("cache_hits", 0) / calls if calls else 0
+    avg_latency = totals.get("latency_ms", 0) / llm_calls if llm_calls else 0
+    print(
+        f"{label:<40} {calls:>7} {hit_ratio:>8.1%} {totals.get('errors', 0):>7} "
+        f"{totals.get('prompt_tokens', 0):>10} {totals.get('completion_tokens', 0):>11} {avg_latency:>9.0f}"
+    )
+
+
+def main():
+    days_count = int(sys.argv[1]) if len(sys.argv) > 1 else 7
+    days = [(date.today() - timedelta(days=i)).isoformat() for i in range(days_count)]
+    try:
+        usage = load_usage(days)
+    except Exception as e:
+        print(f"❌ Не удалось прочитать статистику из Redis: {e}")
+        sys.exit(1)
+
+    print(f"🤖 Вызовы LLM за {days_count} дн.")
+    print("=" * 98)
+    print(f"{'модель | endpoint':<40} {'вызовы':>7} {'кэш':>8} {'ошибки':>7} {'prompt':>10} {'completion':>11} {'ср. мс':>9}")
+    totals_by_source = {}
+    for day in days:
+        for source, values in usage[day].items():
+            totals = totals_by_source.setdefault(source, {})
+            for field in USAGE_FIELDS:
+                totals[field] = totals.get(field, 0) + values.get(field, 0)
+    if not totals_by_source:
+        print("📭 Нет данных")
+        return
+    for source, totals in sorted(totals_by_source.items()):
+        print_row(source.replace("|", " | "), totals)
+
+    print()
+    print("📅 По дням:")
+    for day in days:
+        day_totals = {}
+        for values in usage[day].values():
+            for field in USAGE_FIELDS:
+                day_totals[field] = day_totals.get(field, 0) + values.get(field, 0)
+        if day_totals.get("calls"):
+            print_row(day, day_totals)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+"""
+Обновляет снапшот городов для локального индекса IATA (src/data/cities.json)
+из справочников Travelpayouts (cities.json + countries.json).
+Ручные алиасы (Питер, Бали, ...) из текущего снапшота сохраняются.
+"""
+
+import sys
+import os
+import json
+import requests
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.city_index import CITY_INDEX_PATH
+
+CITIES_URL = "https://api.travelpayouts.com/data/ru/cities.json"
+COUNTRIES_URL = "https://api.travelpayouts.com/data/ru/countries.json"
+
+
+def load_current_aliases(path: str) -> dict:
+    try:
+        with open(path, encoding="utf-8") as f:
+            return {city["code"]: city.get("aliases", []) for city in json.load(f)}
+    except Exception:
+        return {}
+
+
+def build_snapshot() -> list:
+    cities = requests.get(CITIES_URL, timeout=60).json()
+    countries = requests.get(COUNTRIES_URL, timeout=60).json()
+    country_names = {c.get("code"): c.get("name") for c in countries}
+    aliases = load_current_aliases(CITY_INDEX_PATH)
+    snapshot = []
+    for city in cities:
+        # Только города с аэропортами
+        if not city.get("code") or not city.get("name") or city.get("has_flightable_airport") is False:
+            continue
+        entry = {
+            "code": city["code"],
+            "name": city["name"],
+            "name_en": (city.get("name_translations") or {}).get("en"),
+            "country_name": country_names.get(city.get("country_code")),
+        }
+        cases = sorted({v for v in (city.get("cases") or {}).values() if v and v != city["name"]})
+        if cases:
+            entry["cases"] = cases
+        if aliases.get(city["code"]):
+            entry["aliases"] = aliases[city["code"]]
+        snapshot.append(entry)
+    return snapshot
+
+
+def main():
+    path = sys.argv[1] if len(sys.argv) > 1 else CITY_INDEX_PATH
+    try:
+        snapshot = build_snapshot()
+    except Exception as e:
+        print(f"❌ Не удалось загрузить справочники Travelpayouts: {e}")
+        sys.exit(1)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("[\n" + ",\n".join("  " + json.dumps(c, ensure_ascii=False) for c in snapshot) + "\n]\n")
+    print(f"✅ Снапшот обновлён: {len(snapshot)} городов -> {path}")
+
+
+if __name__ == "__main__":
+    main()
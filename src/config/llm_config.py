@@ -1,18 +1,65 @@
 import os
+import time
+import asyncio
+from typing import Optional
 from langchain.chat_models import ChatOpenAI
+from src.services.llm_usage import arecord_llm_call
+
+# Жёсткий таймаут на вызов LLM (включая ожидание свободного слота) и лимит одновременных вызовов на процесс
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", 8))
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", 8))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", 1))
+LLM_PARSER_MODEL = os.getenv("LLM_PARSER_MODEL", "gpt-3.5-turbo-1106")
+LLM_DIALOG_MODEL = os.getenv("LLM_DIALOG_MODEL", "gpt-4o")
+
+# Модели создаются один раз на процесс: их клиент OpenAI держит пул соединений
+_parser_llm = None
+_dialog_llm = None
+_llm_semaphore = asyncio.Semaphore(LLM_MAX_CONCURRENCY)
 
 def get_parser_llm():
     """Cheap JSON extractor"""
-    return ChatOpenAI(
-        model      = os.getenv("LLM_PARSER_MODEL", "gpt-3.5-turbo-1106"),
-        temperature= 0,
-        max_tokens = int(os.getenv("LLM_PARSER_MAXTOK", 300)),
-    )
+    global _parser_llm
+    if _parser_llm is None:
+        _parser_llm = ChatOpenAI(
+            model      = LLM_PARSER_MODEL,
+            temperature= 0,
+            max_tokens = int(os.getenv("LLM_PARSER_MAXTOK", 300)),
+            request_timeout = LLM_TIMEOUT,
+            max_retries = LLM_MAX_RETRIES,
+        )
+    return _parser_llm
 
 def get_dialog_llm():
     """Main reasoning model"""
-    return ChatOpenAI(
-        model      = os.getenv("LLM_DIALOG_MODEL", "gpt-4o"),
-        temperature= 0.3,
-        max_tokens = int(os.getenv("LLM_DIALOG_MAXTOK", 800)),
-    )
+    global _dialog_llm
+    if _dialog_llm is None:
+        _dialog_llm = ChatOpenAI(
+            model      = LLM_DIALOG_MODEL,
+            temperature= 0.3,
+            max_tokens = int(os.getenv("LLM_DIALOG_MAXTOK", 800)),
+            request_timeout = LLM_TIMEOUT,
+            max_retries = LLM_MAX_RETRIES,
+        )
+    return _dialog_llm
+
+async def ainvoke_llm(llm, prompt: str, timeout: float = LLM_TIMEOUT, endpoint: str = "parser", system: Optional[str] = None) -> str:
+    """Неблокирующий вызов модели с учётом токенов и задержки. system — статичная инструкция
+    отдельным системным сообщением (общий префикс кэшируется провайдером).
+    asyncio.TimeoutError — если ответа нет за timeout секунд"""
+    messages = [("system", system), ("human", prompt)] if system else prompt
+    async def invoke():
+        async with _llm_semaphore:
+            return await llm.ainvoke(messages)
+    model = getattr(llm, "model_name", None) or "unknown"
+    started = time.perf_counter()
+    try:
+        response = await asyncio.wait_for(invoke(), timeout)
+    except asyncio.TimeoutError:
+        await arecord_llm_call(model, endpoint, "timeout", prompt, latency=time.perf_counter() - started, system=system)
+        raise
+    except Exception:
+        await arecord_llm_call(model, endpoint, "error", prompt, latency=time.perf_counter() - started, system=system)
+        raise
+    await arecord_llm_call(model, endpoint, "ok", prompt, response.content, time.perf_counter() - started, system)
+    return response.content
@@ -0,0 +1,79 @@
+# Служебные эндпоинты: профилирование процесса по запросу
+import os
+import hmac
+import asyncio
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, HTTPException
+from fastapi.responses import FileResponse
+from dotenv import load_dotenv
+from src.services.profiling import profiler, ProfilerBusy
+
+load_dotenv()
+# Без ADMIN_TOKEN служебные эндпоинты не подключаются
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+
+def require_admin(x_admin_token: Optional[str] = Header(None)):
+    if not ADMIN_TOKEN or not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+
+app = APIRouter(dependencies=[Depends(require_admin)])
+
+
+def _busy(e: ProfilerBusy):
+    return HTTPException(status_code=409, detail=str(e))
+
+
+@app.post("/profile/cpu")
+async def profile_cpu(seconds: float = 10):
+    """Семплирование стеков всех потоков процесса в течение seconds секунд"""
+    try:
+        return await asyncio.to_thread(profiler.cpu, seconds)
+    except ProfilerBusy as e:
+        raise _busy(e)
+
+
+@app.post("/profile/heap/start")
+async def profile_heap_start():
+    return profiler.heap_start()
+
+
+@app.post("/profile/heap/snapshot")
+async def profile_heap_snapshot():
+    try:
+        return await asyncio.to_thread(profiler.heap_snapshot)
+    except ProfilerBusy as e:
+        raise _busy(e)
+
+
+@app.post("/profile/heap/stop")
+async def profile_heap_stop():
+    return profiler.heap_stop()
+
+
+@app.post("/profile/loop-lag")
+async def profile_loop_lag(seconds: float = 30):
+    try:
+        return await profiler.loop_lag(seconds)
+    except ProfilerBusy as e:
+        raise _busy(e)
+
+
+@app.get("/profile/jobs")
+async def profile_jobs():
+    """Память и длительность фоновых задач процесса (пики по tracemalloc — пока он включён)"""
+    return profiler.jobs
+
+
+@app.get("/profile/files")
+async def profile_files():
+    return profiler.files()
+
+
+@app.get("/profile/files/{name}")
+async def profile_file(name: str):
+    path = profiler.file_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(path, filename=name)
@@ -1,97 +1,32 @@
 # Для работы с Telegram Bot API
 from fastapi import APIRouter, Request
-import httpx
 import os
 from typing import Optional, Tuple, Union, Dict
 from dotenv import load_dotenv
 from src.core.openai_agent import extract_flight_query
-from datetime import datetime, timedelta
-import re
-from src.core.dialog_memory import save_message_to_memory, get_memory
+from datetime import datetime
 from src.core.conversation_state import get_conversation_state
-from src.services.flight_cache import flight_cache
-from src.services.price_tracker_db import add_tracked_flights, delete_tracked_flight, delete_all_tracked_flights
+from src.services.price_tracker_db import add_tracked_flights, delete_tracked_flights, delete_all_tracked_flights
 import json
-from src.services.redis_client import redis_client
+from src.services.redis_client import async_redis_client
+from src.services.http_clients import get_http_client, AUTOCOMPLETE
+from src.services.telegram_outbox import telegram_outbox, PRIORITY_INTERACTIVE
+from src.services.flight_search import search_flights
+from src.services.city_index import city_index, aremember_city
+from src.services.update_queue import WEBHOOK_QUEUE_ENABLED, enqueue_update, is_valid_update, mark_update_seen
+from src.services.metrics import metrics
 
 app = APIRouter()
 
 load_dotenv()
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
 AVIASALES_TOKEN = os.getenv("AVIASALES_TOKEN")
 
 # --- Сохраняем flights в Redis после отправки пользователю ---
 TRACK_FLIGHTS_KEY = "track_flights:{}"
 
 async def search_top_flights(origin: str, destination: str, date: Optional[Union[str, dict]] = None, currency: str = "rub", transfers: str = "any") -> str:
-    # --- КЭШИРОВАНИЕ ---
-    params_for_cache = {
-        "origin": origin,
-        "destination": destination,
-        "date": date,
-        "currency": currency,
-        "transfers": transfers
-    }
-    cached = flight_cache.get(params_for_cache)
-    if cached:
-        print(f"[CACHE] Found flights in Redis for {params_for_cache}")
-        all_flights = cached
-    else:
-        print(f"[CACHE] No flights in Redis for {params_for_cache}, requesting Aviasales API...")
-        url = "https://api.travelpayouts.com/aviasales/v3/prices_for_dates"
-        headers = {}
-        all_flights = []
-        date_list = []
-        if isinstance(date, dict) and "from" in date and "to" in date:
-            date_str = f"{date['from']} - {date['to']}"
-        elif isinstance(date, str):
-            date_str = date
-        else:
-            date_str = None
-        if date_str and date_str != "any":
-            match = re.match(r"(\d{4}-\d{2}-\d{2})\s*-\s*(\d{4}-\d{2}-\d{2})", date_str)
-            if match:
-                start = datetime.strptime(match.group(1), "%Y-%m-%d")
-                end = datetime.strptime(match.group(2), "%Y-%m-%d")
-                delta = (end - start).days
-                date_list = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(delta + 1)]
-            else:
-                date_list = [d.strip() for d in re.split(r",|;| ", date_str) if re.match(r"\d{4}-\d{2}-\d{2}", d.strip())]
-                if not date_list and re.match(r"\d{4}-\d{2}", date_str):
-                    date_list = [f"{date_str}-{str(day).zfill(2)}" for day in range(1, 32)]
-                if not date_list:
-                    date_list = [date_str]
-        else:
-            date_list = [None]
-        for d in date_list:
-            params = {
-                "origin": origin,
-                "destination": destination,
-                "one_way": "true",
-                "currency": currency,
-                "token": AVIASALES_TOKEN,
-                "limit": 5,
-                "sorting": "price"
-            }
-            if d:
-                params["departure_at"] = d
-            if transfers == 0 or transfers == "0":
-                params["direct"] = "true"
-            try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(url, params=params, headers=headers)
-                    data = resp.json()
-                    if origin == "MOW" and destination == "NHA":
-                        print(f"[DEBUG] Aviasales raw data for {d}: {data.get('data')}")
-                    if data.get("success") and data.get("data"):
-                        all_flights.extend(data["data"])
-            except Exception as e:
-                print(f"[ERROR] Ошибка при поиске билетов на дату {d}: {e}")
-        # --- Сохраняем в кэш ---
-        if all_flights:
-            flight_cache.save(params_for_cache, all_flights)
-            print(f"[CACHE] Saved {len(all_flights)} flights for {params_for_cache}")
+    # --- Поиск с кэшированием по дням ---
+    all_flights = await search_flights(origin, destination, date, currency=currency, transfers=transfers)
     if not all_flights:
         return "Билеты не найдены."
     # --- Новая логика фильтрации по пересадкам ---
@@ -209,39 +144,80 @@ async def search_top_flights(origin: str, destination: str, date: Optional[Union
     return "\n".join(result)
 
 async def get_iata_code(city_name: str) -> Tuple[Optional[str], Optional[str], Optional[str]]:
-    """Пытается получить IATA-код города через Aviasales API. Если найден город — возвращает его код, имя и страну. Если страна — возвращает код самого популярного города страны."""
+    """Ищет IATA-код города сначала в локальном индексе (точные формы), затем через автокомплит Aviasales, а если он недоступен — по опечатке в локальном индексе. Если найден город — возвращает его код, имя и страну. Если страна — возвращает код самого популярного города страны."""
+    local = city_index.lookup(city_name)
+    if local:
+        print(f"[IATA] Локальный индекс: '{city_name}' -> {local[0]}")
+        return local
     url = "https://autocomplete.travelpayouts.com/places2"
     params = {"term": city_name, "locale": "ru", "types[]": "city"}
     try:
-        async with httpx.AsyncClient() as client:
-            resp = await client.get(url, params=params)
-            data = resp.json()
-            print(f"[IATA] Autocomplete response for '{city_name}':", data)
-            if data and isinstance(data, list):
-                # Пробуем найти точное совпадение по названию города
-                for item in data:
-                    if item.get("name", "").lower() == city_name.lower():
-                        print(f"[IATA] Точное совпадение: {item.get('name')} -> {item.get('code')}")
-                        return item.get("code"), item.get("name"), item.get("country_name")
-                # Если не найдено точного совпадения, ищем по стране
-                # Берём первый город из списка и возвращаем его код
-                if data:
-                    first_city = data[0]
-                    print(f"[IATA] Нет точного совпадения, беру первый город страны: {first_city.get('name')} ({first_city.get('country_name')}) -> {first_city.get('code')}")
-                    return first_city.get("code"), first_city.get("name"), first_city.get("country_name")
-                else:
-                    print(f"[IATA] Нет результатов для '{city_name}'")
+        client = get_http_client(AUTOCOMPLETE)
+        resp = await client.get(url, params=params)
+        data = resp.json()
+        print(f"[IATA] Autocomplete response for '{city_name}':", data)
+        if data and isinstance(data, list):
+            # Пробуем найти точное совпадение по названию города
+            for item in data:
+                if item.get("name", "").lower() == city_name.lower():
+                    print(f"[IATA] Точное совпадение: {item.get('name')} -> {item.get('code')}")
+                    await aremember_city(city_name, item.get("code"), item.get("name"), item.get("country_name"))
+                    return item.get("code"), item.get("name"), item.get("country_name")
+            # Если не найдено точного совпадения, ищем по стране
+            # Берём первый город из списка и возвращаем его код
+            if data:
+                first_city = data[0]
+                print(f"[IATA] Нет точного совпадения, беру первый город страны: {first_city.get('name')} ({first_city.get('country_name')}) -> {first_city.get('code')}")
+                return first_city.get("code"), first_city.get("name"), first_city.get("country_name")
+            else:
+                print(f"[IATA] Нет результатов для '{city_name}'")
     except Exception as e:
         print(f"[IATA ERROR] {e}")
+        # Автокомплит недоступен — пробуем угадать опечатку по локальному индексу
+        suggested = city_index.suggest(city_name)
+        if suggested:
+            print(f"[IATA] Локальный индекс (опечатка): '{city_name}' -> {suggested[0]}")
+            return suggested
     return None, None, None
 
 # SYSTEM_PROMPT: Сначала вызывай flight_cache. Если вернулся null — AviasalesSearchTool, потом flight_cache с новым списком.
 
 @app.post("/webhook")
 async def telegram_webhook(request: Request):
+    """Принимает обновление, кладёт его в очередь и сразу отвечает Telegram"""
     try:
         data = await request.json()
-        print("[WEBHOOK] Incoming data:", data)
+    except Exception as e:
+        print(f"[WEBHOOK ERROR] Invalid JSON: {e}")
+        return {"ok": True}
+    print("[WEBHOOK] Incoming data:", data)
+    if not is_valid_update(data):
+        print("[WEBHOOK] Нет update_id или chat_id в обновлении, пропускаем")
+        metrics.inc("telegram_updates_total", status="invalid")
+        return {"ok": True}
+    try:
+        if not await mark_update_seen(data["update_id"]):
+            print(f"[WEBHOOK] Повтор update_id={data['update_id']}, пропускаем")
+            metrics.inc("telegram_updates_total", status="duplicate")
+            return {"ok": True}
+    except Exception as e:
+        # Без Redis дедупликация невозможна — лучше обработать повтор, чем потерять обновление
+        print(f"[WEBHOOK ERROR] Failed to check update_id: {e}")
+    metrics.inc("telegram_updates_total", status="accepted")
+    if not WEBHOOK_QUEUE_ENABLED:
+        await process_update(data)
+        return {"ok": True}
+    try:
+        await enqueue_update(data)
+    except Exception as e:
+        # Redis недоступен — не теряем обновление, обрабатываем сразу
+        print(f"[QUEUE ERROR] Failed to enqueue update, processing inline: {e}")
+        await process_update(data)
+    return {"ok": True}
+
+async def process_update(data: dict):
+    """Обрабатывает одно обновление Telegram (вызывается воркерами очереди)"""
+    try:
         # --- Обработка callback-кнопки ---
         if "callback_query" in data:
             callback = data["callback_query"]
@@ -250,7 +226,7 @@ async def telegram_webhook(request: Request):
             data_str = callback["data"]
             if data_str == "track_price":
                 # Получаем flights из Redis
-                flights_json = redis_client.get(TRACK_FLIGHTS_KEY.format(chat_id))
+                flights_json = await async_redis_client.get(TRACK_FLIGHTS_KEY.format(chat_id))
                 flights = None
                 if isinstance(flights_json, bytes):
                     flights = json.loads(flights_json.decode('utf-8'))
@@ -276,7 +252,7 @@ async def telegram_webhook(request: Request):
                 add_tracked_flights(chat_id, flights_for_db)
                 await send_message(chat_id, "Вы подписались на уведомления о снижении цены по этим рейсам!")
             elif data_str == "unsubscribe_flight":
-                flights_json = redis_client.get(TRACK_FLIGHTS_KEY.format(chat_id))
+                flights_json = await async_redis_client.get(TRACK_FLIGHTS_KEY.format(chat_id))
                 flights = []
                 if isinstance(flights_json, bytes):
                     try:
@@ -289,7 +265,7 @@ async def telegram_webhook(request: Request):
                     except Exception:
                         flights = []
                 if flights and isinstance(flights, list):
-                    deleted = False
+                    keys = []
                     for f in flights:
                         flight_number = f.get("flight_number")
                         if not flight_number:
@@ -299,9 +275,10 @@ async def telegram_webhook(request: Request):
                         date_str = f.get("departure_at", "")
                         date = date_str[:10] if date_str else ""
                         if flight_number and date:
-                            delete_tracked_flight(chat_id, flight_number, date)
-                            deleted = True
-                    if deleted:
+                            keys.append((flight_number, date))
+                    # Все рейсы сообщения удаляются одной транзакцией
+                    delete_tracked_flights(chat_id, keys)
+                    if keys:
                         await send_message(chat_id, "Подписка на выбранные рейсы удалена успешно.")
                     else:
                         await send_message(chat_id, "Не удалось найти рейсы для отмены подписки.")
@@ -317,32 +294,24 @@ async def telegram_webhook(request: Request):
         chat_id = data.get("message", {}).get("chat", {}).get("id")
         text = data.get("message", {}).get("text", "")
         if chat_id and text:
-            # Сохраняем сообщение пользователя в память (контекст)
-            save_message_to_memory(chat_id, text, k=10)
-            
-            # Получаем состояние разговора
+            # Сохраняем сообщение в память и получаем состояние разговора одним запросом
+            # (в LLM передаём только сжатое состояние и текущее сообщение)
             conv_state = get_conversation_state(chat_id)
-            current_state = conv_state.get_state()
+            history, current_state = await conv_state.asave_message_and_get_context(text, k=10, history_k=1)
             
             # Проверяем, не является ли это новым запросом (содержит города)
             # Если текущее сообщение содержит города, а состояние уже заполнено - это новый запрос
             if current_state.get("is_complete") and any(city_word in text.lower() for city_word in ["москва", "банкок", "хошимин", "сочи", "париж", "лондон", "нью-йорк"]):
                 print("[NEW CONVERSATION] Detected new city request, clearing state")
-                conv_state.clear_state()
-                current_state = conv_state.get_state()
+                current_state = await conv_state.aclear_state()
             
-            # Получаем историю для передачи в LLM (только последние 3 сообщения для контекста)
-            history = get_memory(chat_id, k=3)
-            if not isinstance(history, list):
-                history = []
-            else:
-                history = [msg.decode('utf-8') if isinstance(msg, bytes) else str(msg) for msg in history]
+            history = [msg.decode('utf-8') if isinstance(msg, bytes) else str(msg) for msg in history]
             
             print(f"[CONVERSATION STATE] Current: {current_state}")
             print(f"[HISTORY] {history}")
             
-            # --- Обработка через OpenAI-агента с историей ---
-            parsed = await extract_flight_query(text, history=history)
+            # --- Обработка через OpenAI-агента: состояние разговора + текущее сообщение ---
+            parsed = await extract_flight_query(text, history=history, state=current_state)
             origin_city = parsed.get("from")
             dest_city = parsed.get("to")
             date = parsed.get("date")
@@ -359,12 +328,12 @@ async def telegram_webhook(request: Request):
                 "date": date if date != "any" else None,
                 "transfers": transfers
             }
-            updated_state = conv_state.update_state(new_params)
+            updated_state = await conv_state.aupdate_state(new_params)
             
             print(f"[UPDATED STATE] {updated_state}")
             
             # Проверяем, есть ли все необходимые параметры
-            missing_params = conv_state.get_missing_params()
+            missing_params = await conv_state.aget_missing_params(updated_state)
             
             if missing_params:
                 clarification_messages = []
@@ -459,11 +428,11 @@ async def telegram_webhook(request: Request):
             if reply:
                 # Если есть рейсы, отправляем с кнопкой
                 if flights:
-                    redis_client.setex(TRACK_FLIGHTS_KEY.format(chat_id), 3600, json.dumps(flights, ensure_ascii=False))
+                    await async_redis_client.setex(TRACK_FLIGHTS_KEY.format(chat_id), 3600, json.dumps(flights, ensure_ascii=False))
                     await send_message(chat_id, reply, reply_markup=get_track_price_button())
                 else:
                     await send_message(chat_id, reply)  # reply всегда строка
-                conv_state.clear_state()
+                await conv_state.aclear_state()
                 print("[CONVERSATION CLEARED] State cleared after successful search")
             else:
                 await send_message(chat_id, "❌ Не удалось найти билеты по вашему запросу.")
@@ -475,15 +444,12 @@ async def telegram_webhook(request: Request):
         print(f"[WEBHOOK ERROR] {e}")
     return {"ok": True}
 
-async def send_message(chat_id: int, text: Optional[str] = "", reply_markup: Optional[Dict] = None):
+async def send_message(chat_id: int, text: Optional[str] = "", reply_markup: Optional[Dict] = None, priority: int = PRIORITY_INTERACTIVE):
+    # Отправка идёт через общую очередь с лимитами Telegram; уведомления планировщика передают PRIORITY_NOTIFICATION
     payload = {"chat_id": chat_id, "text": str(text) if text is not None else "", "parse_mode": "Markdown"}
     if reply_markup is not None:
         payload["reply_markup"] = reply_markup
-    async with httpx.AsyncClient() as client:
-        await client.post(
-            TELEGRAM_API_URL,
-            json=payload
-        )
+    await telegram_outbox.send(chat_id, payload, priority)
 
 # --- Новый хелпер для формирования inline-кнопок ---
 def get_track_price_button():
@@ -512,72 +478,7 @@ async def search_top_flights_with_flights(origin: str, destination: str, date: O
     # Гарантируем, что origin_name и dest_name всегда строки
     origin_name = str(origin_name) if origin_name else str(origin)
     dest_name = str(dest_name) if dest_name else str(destination)
-    params_for_cache = {
-        "origin": origin,
-        "destination": destination,
-        "date": date,
-        "currency": currency,
-        "transfers": transfers
-    }
-    cached = flight_cache.get(params_for_cache)
-    if cached:
-        print(f"[CACHE] Found flights in Redis for {params_for_cache}")
-        all_flights = cached
-    else:
-        print(f"[CACHE] No flights in Redis for {params_for_cache}, requesting Aviasales API...")
-        url = "https://api.travelpayouts.com/aviasales/v3/prices_for_dates"
-        headers = {}
-        all_flights = []
-        date_list = []
-        if isinstance(date, dict) and "from" in date and "to" in date:
-            date_str = f"{date['from']} - {date['to']}"
-        elif isinstance(date, str):
-            date_str = date
-        else:
-            date_str = None
-        if date_str and date_str != "any":
-            match = re.match(r"(\d{4}-\d{2}-\d{2})\s*-\s*(\d{4}-\d{2}-\d{2})", date_str)
-            if match:
-                start = datetime.strptime(match.group(1), "%Y-%m-%d")
-                end = datetime.strptime(match.group(2), "%Y-%m-%d")
-                delta = (end - start).days
-                date_list = [(start + timedelta(days=i)).strftime("%Y-%m-%d") for i in range(delta + 1)]
-            else:
-                date_list = [d.strip() for d in re.split(r",|;| ", date_str) if re.match(r"\d{4}-\d{2}-\d{2}", d.strip())]
-                if not date_list and re.match(r"\d{4}-\d{2}", date_str):
-                    date_list = [f"{date_str}-{str(day).zfill(2)}" for day in range(1, 32)]
-                if not date_list:
-                    date_list = [date_str]
-        else:
-            date_list = [None]
-        for d in date_list:
-            params = {
-                "origin": origin,
-                "destination": destination,
-                "one_way": "true",
-                "currency": currency,
-                "token": AVIASALES_TOKEN,
-                "limit": 5,
-                "sorting": "price"
-            }
-            if d:
-                params["departure_at"] = d
-            if transfers == 0 or transfers == "0":
-                params["direct"] = "true"
-            try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(url, params=params, headers=headers)
-                    data = resp.json()
-                    if origin == "MOW" and destination == "NHA":
-                        print(f"[DEBUG] Aviasales raw data for {d}: {data.get('data')}")
-                    if data.get("success") and data.get("data"):
-                        all_flights.extend(data["data"])
-            except Exception as e:
-                print(f"[ERROR] Ошибка при поиске билетов на дату {d}: {e}")
-        # --- Сохраняем в кэш ---
-        if all_flights:
-            flight_cache.save(params_for_cache, all_flights)
-            print(f"[CACHE] Saved {len(all_flights)} flights for {params_for_cache}")
+    all_flights = await search_flights(origin, destination, date, currency=currency, transfers=transfers)
     if not all_flights:
         return [], "Билеты не найдены."
     # --- Новая логика фильтрации по пересадкам ---
@@ -1,22 +1,74 @@
 import json
-from typing import Dict, Optional, Any
-from src.services.redis_client import redis_client
+from typing import Dict, List, Optional, Any, Tuple
+from src.services.redis_client import redis_client, async_redis_client
+from src.core.dialog_memory import MEMORY_TTL, memory_key
 
 CONVERSATION_TTL = 60 * 60 * 24  # 1 день
 
+# Состояние хранится хэшем: поле -> JSON-значение. Старый формат (JSON-строка целиком)
+# читается как есть и переводится в хэш при первом обновлении.
+_READ_STATE_LUA = """
+local kind = redis.call('TYPE', KEYS[1])['ok']
+if kind == 'string' then
+    return {'__legacy__', redis.call('GET', KEYS[1])}
+end
+return redis.call('HGETALL', KEYS[1])
+"""
+
+# Одним вызовом: сохранить сообщение в историю, прочитать последние сообщения и состояние
+# KEYS: dialog, state; ARGV: message, k, memory_ttl, history_k
+_LOAD_CONTEXT_LUA = """
+redis.call('LPUSH', KEYS[1], ARGV[1])
+redis.call('LTRIM', KEYS[1], 0, tonumber(ARGV[2]) - 1)
+redis.call('EXPIRE', KEYS[1], ARGV[3])
+local history = redis.call('LRANGE', KEYS[1], 0, tonumber(ARGV[4]) - 1)
+local state
+if redis.call('TYPE', KEYS[2])['ok'] == 'string' then
+    state = {'__legacy__', redis.call('GET', KEYS[2])}
+else
+    state = redis.call('HGETALL', KEYS[2])
+end
+return {history, state}
+"""
+
+# Атомарное обновление отдельных полей; is_complete считается на сервере
+# KEYS: state; ARGV: ttl, field1, json1, field2, json2, ...
+_UPDATE_STATE_LUA = """
+local key = KEYS[1]
+if redis.call('TYPE', key)['ok'] == 'string' then
+    local legacy = cjson.decode(redis.call('GET', key))
+    redis.call('DEL', key)
+    for _, field in ipairs({'from', 'to', 'date', 'transfers'}) do
+        local value = legacy[field]
+        if value ~= nil and value ~= cjson.null and value ~= 'any' then
+            redis.call('HSET', key, field, cjson.encode(value))
+        end
+    end
+end
+for i = 2, #ARGV, 2 do
+    redis.call('HSET', key, ARGV[i], ARGV[i + 1])
+end
+local complete = redis.call('HEXISTS', key, 'from') == 1
+    and redis.call('HEXISTS', key, 'to') == 1
+    and redis.call('HEXISTS', key, 'date') == 1
+redis.call('HSET', key, 'is_complete', complete and 'true' or 'false')
+redis.call('EXPIRE', key, ARGV[1])
+return redis.call('HGETALL', key)
+"""
+
+_read_state = redis_client.register_script(_READ_STATE_LUA)
+_update_state = redis_client.register_script(_UPDATE_STATE_LUA)
+_aread_state = async_redis_client.register_script(_READ_STATE_LUA)
+_aload_context = async_redis_client.register_script(_LOAD_CONTEXT_LUA)
+_aupdate_state = async_redis_client.register_script(_UPDATE_STATE_LUA)
+
 class ConversationState:
     def __init__(self, chat_id: int):
         self.chat_id = chat_id
         self.key = f"conversation_state:{chat_id}"
-    
-    def get_state(self) -> Dict[str, Any]:
-        """Get current conversation state"""
-        state_data = redis_client.get(self.key)
-        if state_data:
-            if isinstance(state_data, bytes):
-                return json.loads(state_data.decode('utf-8'))
-            elif isinstance(state_data, str):
-                return json.loads(state_data)
+
+    @staticmethod
+    def _empty_state() -> Dict[str, Any]:
         return {
             "from": None,
             "to": None,
@@ -24,50 +76,79 @@ class ConversationState:
             "transfers": "any",
             "is_complete": False
         }
-    
-    def update_state(self, new_params: Dict[str, Any]):
-        """Update conversation state with new parameters"""
-        current_state = self.get_state()
-        
+
+    def _decode_state(self, fields: Optional[List[Any]]) -> Dict[str, Any]:
+        """Плоский ответ HGETALL (или старая JSON-строка) -> словарь состояния"""
+        state = self._empty_state()
+        if not fields:
+            return state
+        if fields[0] == "__legacy__":
+            state.update(json.loads(fields[1]))
+            return state
+        for field, value in zip(fields[::2], fields[1::2]):
+            state[field] = json.loads(value)
+        return state
+
+    @staticmethod
+    def _update_args(new_params: Dict[str, Any]) -> List[Any]:
         # Update only non-None values
+        args = [CONVERSATION_TTL]
         for key, value in new_params.items():
             if value is not None and value != "any":
-                current_state[key] = value
-        
-        # Check if we have all required parameters
-        current_state["is_complete"] = (
-            current_state.get("from") is not None and 
-            current_state.get("to") is not None and 
-            current_state.get("date") is not None
-        )
-        
-        # Save to Redis
-        redis_client.setex(
-            self.key, 
-            CONVERSATION_TTL, 
-            json.dumps(current_state)
-        )
-        
-        return current_state
-    
-    def clear_state(self):
-        """Clear conversation state"""
-        redis_client.delete(self.key)
-    
-    def get_missing_params(self) -> list[str]:
-        """Get list of missing parameters"""
-        state = self.get_state()
+                args.extend([key, json.dumps(value, ensure_ascii=False)])
+        return args
+
+    @staticmethod
+    def _missing_params(state: Dict[str, Any]) -> list[str]:
         missing = []
-        
         if not state.get("from"):
             missing.append("from")
         if not state.get("to"):
             missing.append("to")
         if not state.get("date"):
             missing.append("date")
-        
         return missing
 
+    def get_state(self) -> Dict[str, Any]:
+        """Get current conversation state"""
+        return self._decode_state(_read_state(keys=[self.key]))
+
+    def update_state(self, new_params: Dict[str, Any]):
+        """Update conversation state with new parameters"""
+        return self._decode_state(_update_state(keys=[self.key], args=self._update_args(new_params)))
+
+    def clear_state(self):
+        """Clear conversation state"""
+        redis_client.delete(self.key)
+
+    def get_missing_params(self, state: Optional[Dict[str, Any]] = None) -> list[str]:
+        """Get list of missing parameters (без запроса в Redis, если состояние уже известно)"""
+        return self._missing_params(state if state is not None else self.get_state())
+
+    # --- Асинхронные варианты для обработчиков бота ---
+
+    async def aget_state(self) -> Dict[str, Any]:
+        return self._decode_state(await _aread_state(keys=[self.key]))
+
+    async def asave_message_and_get_context(self, message: str, k: int = 10, history_k: int = 3) -> Tuple[List[str], Dict[str, Any]]:
+        """Сохраняет сообщение в историю и возвращает (последние history_k сообщений, состояние) за один запрос"""
+        history, fields = await _aload_context(
+            keys=[memory_key(self.chat_id), self.key],
+            args=[message, k, MEMORY_TTL, history_k],
+        )
+        return list(reversed(history or [])), self._decode_state(fields)
+
+    async def aupdate_state(self, new_params: Dict[str, Any]):
+        return self._decode_state(await _aupdate_state(keys=[self.key], args=self._update_args(new_params)))
+
+    async def aclear_state(self) -> Dict[str, Any]:
+        """Очищает состояние и возвращает пустое"""
+        await async_redis_client.delete(self.key)
+        return self._empty_state()
+
+    async def aget_missing_params(self, state: Optional[Dict[str, Any]] = None) -> list[str]:
+        return self._missing_params(state if state is not None else await self.aget_state())
+
 def get_conversation_state(chat_id: int) -> ConversationState:
     """Get conversation state for a chat"""
-    return ConversationState(chat_id) 
\ No newline at end of file
+    return ConversationState(chat_id)
@@ -1,10 +1,13 @@
 import json
 import os
+import asyncio
 from typing import Dict, Any, Optional
 from dotenv import load_dotenv
-from src.config.llm_config import get_parser_llm
-from langchain.chains import LLMChain
-from langchain.prompts import PromptTemplate
+from src.config.llm_config import get_parser_llm, ainvoke_llm, LLM_PARSER_MODEL
+from src.services.llm_usage import arecord_llm_call
+from src.services.parse_cache import parse_cache, build_cache_query, seconds_until_midnight
+from src.services.metrics import metrics
+from src.core.rule_parser import parse_query
 
 load_dotenv()
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
@@ -16,7 +19,7 @@ PROMPT = """
 ⦿ Твоя цель: из сообщения пользователя выделить ▸ from (город/аэропорт вылета) ▸ to (город/аэропорт назначения) ▸ date ▸ transfers (количество пересадок)
    – date может быть:
      • одна точная дата → формат "YYYY-MM-DD"
-     • диапазон → объект {{ "from": "YYYY-MM-DD", "to": "YYYY-MM-DD" }}
+     • диапазон → объект { "from": "YYYY-MM-DD", "to": "YYYY-MM-DD" }
      • неизвестна → строка "any"
    – transfers может быть:
      • 0 — только прямые рейсы (без пересадок)
@@ -26,16 +29,16 @@ PROMPT = """
    1) Если текущее сообщение содержит города - используй их
    2) Если текущее сообщение содержит дату - используй её
    3) Если текущее сообщение содержит информацию о пересадках - используй её
-   4) История используется ТОЛЬКО для контекста, если текущее сообщение неполное
+   4) Состояние (уже известные параметры диалога) используй ТОЛЬКО если текущее сообщение неполное
 
-⦿ ПРАВИЛО: Если текущее сообщение содержит новые города - игнорируй старые из истории
+⦿ ПРАВИЛО: Если текущее сообщение содержит новые города - игнорируй старые из состояния
 
 ⦿ ОСОБОЕ ВНИМАНИЕ на даты:
-   • "Июль-Август" → {{"from":"2025-07-01","to":"2025-08-31"}}
-   • "Июль" → {{"from":"2025-07-01","to":"2025-07-31"}}
-   • "Август" → {{"from":"2025-08-01","to":"2025-08-31"}}
-   • "конец августа" → {{"from":"2025-08-16","to":"2025-08-31"}}
-   • "начало июля" → {{"from":"2025-07-01","to":"2025-07-15"}}
+   • "Июль-Август" → {"from":"2025-07-01","to":"2025-08-31"}
+   • "Июль" → {"from":"2025-07-01","to":"2025-07-31"}
+   • "Август" → {"from":"2025-08-01","to":"2025-08-31"}
+   • "конец августа" → {"from":"2025-08-16","to":"2025-08-31"}
+   • "начало июля" → {"from":"2025-07-01","to":"2025-07-15"}
 
 ⦿ ВАЖНО: В ответе используй правильные падежи для городов:
    – для города отправления (откуда) — родительный падеж (например, 'из Москвы', 'из Санкт-Петербурга')
@@ -45,59 +48,78 @@ PROMPT = """
    Ответ: Из Москвы в Мурманск
 
 ⦿ Формат ответа – СТРОГО JSON **одной строкой**:
-{{
+{
   "from": "<город|IATA|any>",
   "to": "<город|IATA|any>",
   "date": "<строка или объект диапазона>",
   "transfers": <0|"any">,
   "need_clarify": []
-}}
+}
 
 ⦿ Никаких пояснений, лишних слов и перевода строк.
 
 ⦿ Примеры
 -----------
-История: ["Москва Бангкок", "вторая половина августа"]
+Состояние: from=Москва; to=Бангкок; date=2025-08-16..2025-08-31; transfers=any
 Текущее: "москва хошимин"
-→ {{"from":"Москва","to":"Хошимин","date":"any","transfers":"any","need_clarify":["date"]}}
+→ {"from":"Москва","to":"Хошимин","date":"any","transfers":"any","need_clarify":["date"]}
 
-История: ["москва хошимин"]
+Состояние: from=Москва; to=Хошимин; date=?; transfers=any
 Текущее: "конец августа"
-→ {{"from":"Москва","to":"Хошимин","date":{{"from":"2025-08-16","to":"2025-08-31"}},"transfers":"any","need_clarify":[]}}
+→ {"from":"Москва","to":"Хошимин","date":{"from":"2025-08-16","to":"2025-08-31"},"transfers":"any","need_clarify":[]}
 
-История: []
+Состояние: пусто
 Текущее: "Москва Бангкок Июль-Август"
-→ {{"from":"Москва","to":"Бангкок","date":{{"from":"2025-07-01","to":"2025-08-31"}},"transfers":"any","need_clarify":[]}}
+→ {"from":"Москва","to":"Бангкок","date":{"from":"2025-07-01","to":"2025-08-31"},"transfers":"any","need_clarify":[]}
 
-История: []
+Состояние: пусто
 Текущее: "Билеты в Сочи?"
-→ {{"from":"any","to":"Сочи","date":"any","transfers":"any","need_clarify":["from","date"]}}
+→ {"from":"any","to":"Сочи","date":"any","transfers":"any","need_clarify":["from","date"]}
 """
 
-PROMPT_TEMPLATE = PromptTemplate(
-    input_variables=["history", "user_text"],
-    template=PROMPT + "\nИстория: {history}\nТекущее: {user_text}"
-)
-
-def build_openai_messages(user_text: str, history: Optional[list[str]] = None):
-    messages = [
-        {"role": "system", "content": PROMPT}
-    ]
-    if history:
-        for msg in history:
-            messages.append({"role": "user", "content": msg})
-    messages.append({"role": "user", "content": user_text})
-    return messages
-
-async def extract_flight_query(user_text: str, history: Optional[list[str]] = None) -> dict:
-    llm = get_parser_llm()
-    
-    # Format history for the prompt
-    history_text = str(history) if history else "[]"
-    
-    chain = LLMChain(llm=llm, prompt=PROMPT_TEMPLATE)
+# Статичная часть (PROMPT) идёт системным сообщением и одинакова для всех вызовов, поэтому
+# кэшируется провайдером как префикс; переменная часть — короткое состояние и одно сообщение
+def format_state(state: Optional[Dict[str, Any]] = None) -> str:
+    """Сжатое состояние диалога для LLM: from=Москва; to=?; date=?; transfers=any"""
+    state = state or {}
+    if not any(state.get(key) for key in ("from", "to", "date")) and state.get("transfers", "any") == "any":
+        return "пусто"
+    date = state.get("date")
+    if isinstance(date, dict):
+        date = f"{date.get('from')}..{date.get('to')}"
+    transfers = state.get("transfers")
+    return "; ".join([
+        f"from={state.get('from') or '?'}",
+        f"to={state.get('to') or '?'}",
+        f"date={date or '?'}",
+        f"transfers={'any' if transfers is None else transfers}",
+    ])
+
+def build_user_prompt(user_text: str, state: Optional[Dict[str, Any]] = None) -> str:
+    return f"Состояние: {format_state(state)}\nТекущее: {user_text}"
+
+async def extract_flight_query(user_text: str, history: Optional[list[str]] = None, state: Optional[Dict[str, Any]] = None) -> dict:
+    """Параметры поиска из сообщения. В LLM уходит только состояние диалога (state) и само сообщение;
+    history нужна лишь запасному разбору"""
+    # Типовые запросы ("Город Город дата") разбираем локально, LLM — только для неоднозначных
+    parsed = parse_query(user_text)
+    if parsed is not None:
+        print(f"[RULE PARSED] {parsed}")
+        metrics.inc("query_parser_total", parser="rules")
+        return parsed
+
+    # Одинаковые запросы (с учётом состояния диалога) разбираем через LLM один раз
+    context = format_state(state)
+    cache_query, relative_dates = build_cache_query(user_text, context)
+    cached = await parse_cache.aget(cache_query)
+    if cached is not None:
+        print(f"[PARSE CACHE] Hit for: {cache_query[:40]}")
+        metrics.inc("query_parser_total", parser="cache")
+        await arecord_llm_call(LLM_PARSER_MODEL, "parser", "cache_hit")
+        return cached
+
     try:
-        answer = chain.run(history=history_text, user_text=user_text)
+        answer = await ainvoke_llm(get_parser_llm(), build_user_prompt(user_text, state), system=PROMPT)
         print(f"[LLM RAW ANSWER] {answer}")
         # Clean the answer to extract only JSON
         answer = answer.strip()
@@ -108,10 +130,19 @@ async def extract_flight_query(user_text: str, history: Optional[list[str]] = No
         
         parsed = json.loads(answer)
         print(f"[LLM PARSED] {parsed}")
+        metrics.inc("query_parser_total", parser="llm")
+        # Записи с "завтра"/"сегодня" живут до конца дня
+        await parse_cache.asave(cache_query, parsed, ttl=seconds_until_midnight() if relative_dates else None)
+    except asyncio.TimeoutError:
+        print("[LLM TIMEOUT] No answer in time, using local parser")
+        metrics.inc("llm_timeouts_total")
+        parsed = parse_query(user_text, strict=False) or fallback_parsing(user_text, history)
+        metrics.inc("query_parser_total", parser="fallback")
     except Exception as e:
         print(f"[LLM PARSE ERROR] {e}")
-        # Fallback parsing for common patterns
-        parsed = fallback_parsing(user_text, history)
+        # Fallback: нестрогий локальный разбор, затем простые шаблоны
+        parsed = parse_query(user_text, strict=False) or fallback_parsing(user_text, history)
+        metrics.inc("query_parser_total", parser="fallback")
     
     return parsed
 
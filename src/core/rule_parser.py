@@ -0,0 +1,257 @@
+import re
+import calendar
+from datetime import date, datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+from src.services.city_index import CityIndex, city_index
+
+# Детерминированный разбор типовых запросов ("Москва Сочи 15.08", "из Питера в Бали в августе").
+# Если понято каждое слово сообщения, результат используется вместо LLM; иначе возвращается None.
+
+DateValue = Union[str, Dict[str, str]]
+
+_MONTH_RE = (
+    r"(январ[ьяею]|феврал[ьяею]|март[ае]?|апрел[ьяею]|ма[йяею]|июн[ьяею]|июл[ьяею]|"
+    r"август[ае]?|сентябр[ьяею]|октябр[ьяею]|ноябр[ьяею]|декабр[ьяею])"
+)
+_MONTH_STEMS = ["январ", "феврал", "март", "апрел", "ма", "июн", "июл", "август", "сентябр", "октябр", "ноябр", "декабр"]
+
+_WEEKDAYS = {
+    "понедельник": 0, "вторник": 1, "среда": 2, "среду": 2, "четверг": 3,
+    "пятница": 4, "пятницу": 4, "суббота": 5, "субботу": 5, "воскресенье": 6,
+}
+_RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+# Части месяца — те же границы, что в примерах промпта LLM
+_MONTH_PARTS = {
+    "начало": (1, 15), "начале": (1, 15),
+    "середина": (10, 20), "середине": (10, 20),
+    "конец": (16, 31), "конце": (16, 31),
+    "первая половина": (1, 15), "первой половине": (1, 15),
+    "вторая половина": (16, 31), "второй половине": (16, 31),
+}
+
+_FROM_PREPOSITIONS = {"из", "изо", "от", "с", "со"}
+_TO_PREPOSITIONS = {"в", "во", "до", "на", "к", "ко"}
+# Слова, которые не несут параметров поиска
+_FILLER = {
+    "билет", "билеты", "билетов", "авиабилет", "авиабилеты", "авиабилетов", "рейс", "рейсы", "рейсов",
+    "перелет", "перелеты", "перелетов", "самолет", "самолетом", "хочу", "хотим", "хотел", "хотела", "нужен",
+    "нужны", "нужно", "надо", "найди", "найдите", "найти", "поищи", "покажи", "покажите", "подбери", "есть",
+    "ли", "мне", "нам", "пожалуйста", "плиз", "лететь", "полететь", "улететь", "слетать", "летим", "туда",
+    "дешево", "дешевые", "дешевый", "дешевле", "недорого", "подешевле", "и", "а", "по", "же", "бы", "как",
+    "можно", "рейсом", "вылет", "вылетом", "год", "года", "этом", "следующем", "месяце",
+}
+
+_TRANSFER_PATTERNS = [
+    (re.compile(r"\b(?:без\s+пересад\w*|прям\w*(?:\s+рейс\w*)?|direct)\b"), 0),
+    (re.compile(r"\b(?:можно\s+)?(?:с\s+пересадк\w*|любые\s+пересадк\w*)\b"), "any"),
+]
+
+
+def _month_number(word: str) -> int:
+    for number, stem in enumerate(_MONTH_STEMS, start=1):
+        if stem == "ма":
+            if word in ("май", "мая", "мае", "маю"):
+                return number
+        elif word.startswith(stem):
+            return number
+    raise ValueError(f"Unknown month: {word}")
+
+
+def _month_year(month: int, today: date) -> int:
+    """Год для месяца без года: прошедшие месяцы относятся к следующему году"""
+    return today.year + 1 if month < today.month else today.year
+
+
+def _month_range(month: int, today: date, first_day: int = 1, last_day: int = 31) -> Tuple[date, date]:
+    year = _month_year(month, today)
+    last = calendar.monthrange(year, month)[1]
+    start = date(year, month, min(first_day, last))
+    end = date(year, month, min(last_day, last))
+    if start <= today <= end:
+        start = today
+    return start, end
+
+
+def _day_month(day: int, month: int, year: Optional[int], today: date) -> date:
+    if year is not None:
+        return date(year + 2000 if year < 100 else year, month, day)
+    value = date(today.year, month, day)
+    return value if value >= today else date(today.year + 1, month, day)
+
+
+def _date_value(start: date, end: Optional[date] = None) -> DateValue:
+    if end is None or end == start:
+        return start.isoformat()
+    return {"from": start.isoformat(), "to": end.isoformat()}
+
+
+def _iso(m, today):
+    return _date_value(date(int(m[1]), int(m[2]), int(m[3])))
+
+
+def _day_range(m, today):
+    month = _month_number(m[3])
+    year = _month_year(month, today)
+    # Как и для одной даты: диапазон, уже закончившийся в этом месяце, относится к следующему году
+    if date(year, month, int(m[2])) < today:
+        year += 1
+    # Начавшийся диапазон ищем с сегодняшнего дня, как и месяц в _month_range
+    start, end = date(year, month, int(m[1])), date(year, month, int(m[2]))
+    return _date_value(max(start, today), end)
+
+
+def _numeric(m, today):
+    return _date_value(_day_month(int(m[1]), int(m[2]), int(m[3]) if m[3] else None, today))
+
+
+def _day_with_month(m, today):
+    return _date_value(_day_month(int(m[1]), _month_number(m[2]), None, today))
+
+
+def _month_part(m, today):
+    first_day, last_day = _MONTH_PARTS[re.sub(r"\s+", " ", m[1])]
+    return _date_value(*_month_range(_month_number(m[2]), today, first_day, last_day))
+
+
+def _months(m, today):
+    start, _ = _month_range(_month_number(m[1]), today)
+    end_month = _month_number(m[2])
+    end_year = start.year if end_month >= start.month else start.year + 1
+    return _date_value(start, date(end_year, end_month, calendar.monthrange(end_year, end_month)[1]))
+
+
+def _month(m, today):
+    return _date_value(*_month_range(_month_number(m[1]), today))
+
+
+def _relative(m, today):
+    return _date_value(today + timedelta(days=_RELATIVE_DAYS[m[1]]))
+
+
+def _weekend(m, today):
+    saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+    return _date_value(saturday, saturday + timedelta(days=1))
+
+
+def _weekday(m, today):
+    # "в пятницу", сказанное в пятницу, — это следующая неделя
+    days_ahead = (_WEEKDAYS[m[1]] - today.weekday()) % 7 or 7
+    return _date_value(today + timedelta(days=days_ahead))
+
+
+# Порядок важен: более длинные конструкции разбираются раньше вложенных в них коротких
+_DATE_RULES: List[Tuple[re.Pattern, Callable[[Any, date], DateValue]]] = [
+    (re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b"), _iso),
+    (re.compile(r"(?:\bс\s+)?\b(\d{1,2})\s*(?:-|по|до)\s*(\d{1,2})\s+" + _MONTH_RE + r"\b"), _day_range),
+    (re.compile(r"(?:\bна\s+)?\b(\d{1,2})[./](\d{1,2})(?:[./](\d{2}|\d{4}))?\b"), _numeric),
+    (re.compile(r"(?:\bна\s+)?\b(\d{1,2})\s+" + _MONTH_RE + r"\b"), _day_with_month),
+    (re.compile(r"(?:\b(?:в|на)\s+)?\b(" + "|".join(sorted(_MONTH_PARTS, key=len, reverse=True)) + r")\s+" + _MONTH_RE + r"\b"), _month_part),
+    (re.compile(r"(?:\bс\s+)?\b" + _MONTH_RE + r"\s*(?:-|по|и)\s*" + _MONTH_RE + r"\b"), _months),
+    (re.compile(r"(?:\b(?:в|на)\s+)?\b" + _MONTH_RE + r"\b"), _month),
+    (re.compile(r"(?:\bна\s+)?\b(сегодня|завтра|послезавтра)\b"), _relative),
+    (re.compile(r"\b(?:на|в)\s+(?:эти\s+|ближайшие\s+)?выходн\w*"), _weekend),
+    (re.compile(r"(?:\b(?:в|во|на)\s+)?\b(" + "|".join(_WEEKDAYS) + r")\b"), _weekday),
+]
+
+
+def _clean(text: str) -> str:
+    text = (text or "").lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s.\-/]", " ", text)
+    # Точки и слэши оставляем только внутри дат ("15.08", "15/08")
+    return re.sub(r"(?<!\d)[./]|[./](?!\d)", " ", text)
+
+
+def _assign_cities(found: List[Tuple[Optional[str], Tuple]]) -> Optional[Dict[str, Tuple]]:
+    """Раскладывает города по ролям: предлоги ("из", "в") важнее порядка слов"""
+    if not found or len(found) > 2:
+        return None
+    roles: Dict[str, Tuple] = {}
+    for role, match in found:
+        if role:
+            if role in roles:
+                return None
+            roles[role] = match
+    free = [match for role, match in found if not role]
+    if len(found) == 2 and free:
+        if len(free) == 2:
+            roles["from"], roles["to"] = free
+        else:
+            roles["to" if "from" in roles else "from"] = free[0]
+    elif len(found) == 1 and free:
+        # Одно название без предлога ("Сочи") может быть и ответом на "откуда?" — решает LLM с историей
+        return None
+    if roles.get("from") and roles.get("to") and roles["from"][0] == roles["to"][0]:
+        return None
+    return roles
+
+
+def parse_query(text: str, today: Optional[date] = None, index: Optional[CityIndex] = None, strict: bool = True) -> Optional[Dict[str, Any]]:
+    """Разбирает запрос без LLM. strict=True: None, если хоть одно слово не распознано.
+    Формат ответа совпадает с LLM: from, to, date, transfers, need_clarify"""
+    today = today or datetime.now().date()
+    index = index or city_index
+    text = _clean(text)
+
+    dates: List[DateValue] = []
+    for pattern, handler in _DATE_RULES:
+        def consume_date(match, handler=handler):
+            dates.append(handler(match, today))
+            return " "
+        try:
+            text = pattern.sub(consume_date, text)
+        except ValueError:
+            return None  # несуществующая дата ("31.02")
+    transfers_found: List[Any] = []
+    for pattern, value in _TRANSFER_PATTERNS:
+        def consume_transfers(match, value=value):
+            transfers_found.append(value)
+            return " "
+        text = pattern.sub(consume_transfers, text)
+    if len(dates) > 1 or len(set(map(str, transfers_found))) > 1:
+        return None
+
+    tokens = [t for t in text.split() if t.strip("-")]
+    found: List[Tuple[Optional[str], Tuple]] = []
+    role: Optional[str] = None
+    i = 0
+    while i < len(tokens):
+        token = tokens[i]
+        if token in _FROM_PREPOSITIONS:
+            role, i = "from", i + 1
+            continue
+        if token in _TO_PREPOSITIONS:
+            role, i = "to", i + 1
+            continue
+        for length in (3, 2, 1):
+            if i + length > len(tokens):
+                continue
+            match = index.exact(" ".join(tokens[i:i + length]))
+            if match:
+                found.append((role, match))
+                role, i = None, i + length
+                break
+        else:
+            if "-" in token:
+                # "Москва-Сочи": пробуем части по отдельности
+                tokens[i:i + 1] = [part for part in token.split("-") if part]
+                continue
+            if token not in _FILLER and strict:
+                return None
+            i += 1
+
+    roles = _assign_cities(found) if found else {}
+    if roles is None:
+        if strict:
+            return None
+        roles = {}
+    if not roles and not dates and not transfers_found:
+        return None
+
+    parsed = {
+        "from": roles["from"][1] if roles.get("from") else "any",
+        "to": roles["to"][1] if roles.get("to") else "any",
+        "date": dates[0] if dates else "any",
+        "transfers": transfers_found[0] if transfers_found else "any",
+    }
+    parsed["need_clarify"] = [key for key in ("from", "to", "date") if parsed[key] == "any"]
+    return parsed
@@ -1,19 +1,60 @@
 import uvicorn
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import PlainTextResponse
 from fastapi.middleware.cors import CORSMiddleware
 import os
 from dotenv import load_dotenv
 
 # Import from new structure
-from src.core.bot import app as bot_app
-from src.services.price_tracker_scheduler import start_scheduler
+from src.core.bot import app as bot_app, process_update
+from src.core.admin import app as admin_app, ADMIN_TOKEN
+from src.services.price_tracker_scheduler import LeaderScheduler
+from src.services.http_clients import init_http_clients, close_http_clients
+from src.services.telegram_outbox import telegram_outbox
+from src.services.city_index import aload_learned_cities
+from src.services.redis_client import close_async_redis
+from src.services.price_tracker_db import close_db
+from src.services.update_queue import UpdateWorkerPool, WEBHOOK_QUEUE_ENABLED
+from src.services.metrics import metrics
+from src.services.llm_usage import aload_encoding
+from src.config.llm_config import LLM_PARSER_MODEL, LLM_DIALOG_MODEL
 
 load_dotenv()
+ENABLE_METRICS = os.getenv("ENABLE_METRICS", "true").lower() == "true"
+# false — цены проверяют отдельные воркеры (python -m src.tracker_worker)
+SCHEDULER_ENABLED = os.getenv("SCHEDULER_ENABLED", "true").lower() == "true"
 
-app = FastAPI(title="Flight Tracker Bot API", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Общие пулы HTTP-соединений (Telegram, Aviasales, autocomplete) на всё время жизни приложения
+    await init_http_clients()
+    # Города, выученные из автокомплита другими процессами и до рестарта
+    await aload_learned_cities()
+    # Словари tiktoken для учёта токенов: загружаются (а при первом запуске скачиваются) до приёма запросов
+    for model in (LLM_PARSER_MODEL, LLM_DIALOG_MODEL):
+        await aload_encoding(model)
+    # Исходящие сообщения Telegram с учётом лимитов; при остановке досылаются после воркеров вебхуков
+    await telegram_outbox.start()
+    # Проверка цен идёт в event loop приложения, на его пулах соединений, и только в процессе-лидере
+    scheduler = LeaderScheduler() if SCHEDULER_ENABLED else None
+    if scheduler:
+        await scheduler.start()
+    # Воркеры очереди вебхуков: при остановке дорабатывают текущие обновления
+    update_workers = UpdateWorkerPool(process_update) if WEBHOOK_QUEUE_ENABLED else None
+    if update_workers:
+        await update_workers.start()
+    yield
+    if scheduler:
+        await scheduler.stop()
+    if update_workers:
+        await update_workers.stop()
+    await telegram_outbox.stop()
+    await close_http_clients()
+    await close_async_redis()
+    close_db()
 
-# Запуск шедулера при старте приложения
-start_scheduler()
+app = FastAPI(title="Flight Tracker Bot API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware
 app.add_middleware(
@@ -29,9 +70,19 @@ app.add_middleware(
 async def health_check():
     return {"status": "healthy", "service": "flytracker-bot"}
 
+# Метрики процесса в формате Prometheus
+if ENABLE_METRICS:
+    @app.get("/metrics", response_class=PlainTextResponse)
+    async def metrics_endpoint():
+        return metrics.render_prometheus()
+
 # Include the bot routes
 app.include_router(bot_app, prefix="/tg")
 
+# Профилирование по запросу (заголовок X-Admin-Token); результаты в PROFILE_DIR
+if ADMIN_TOKEN:
+    app.include_router(admin_app, prefix="/admin")
+
 if __name__ == "__main__":
     port = int(os.getenv("PORT", 8000))
     uvicorn.run(app, host="0.0.0.0", port=port)
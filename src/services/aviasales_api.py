@@ -0,0 +1,111 @@
+import os
+import asyncio
+from typing import Dict, List, NamedTuple, Optional, Any
+from dotenv import load_dotenv
+from src.services.http_clients import get_http_client, AVIASALES
+from src.services.query_planner import PlannedQuery, filter_to_window
+from src.services.rate_limiter import TokenBucket, backoff_delay
+from src.services.metrics import metrics
+
+load_dotenv()
+AVIASALES_TOKEN = os.getenv("AVIASALES_TOKEN")
+PRICES_FOR_DATES_URL = "https://api.travelpayouts.com/aviasales/v3/prices_for_dates"
+
+# Сколько запросов к /v3/prices_for_dates одного поиска выполняется одновременно
+AVIASALES_CONCURRENCY = int(os.getenv("AVIASALES_CONCURRENCY", 8))
+
+# Квота Travelpayouts для фоновых проверок цен: запросов в секунду, размер всплеска и повторы после 429
+AVIASALES_RATE_LIMIT = float(os.getenv("AVIASALES_RATE_LIMIT", 5))
+AVIASALES_RATE_BURST = float(os.getenv("AVIASALES_RATE_BURST", 10))
+AVIASALES_MAX_RETRIES = int(os.getenv("AVIASALES_MAX_RETRIES", 3))
+
+# Общий лимитер процесса для запросов планировщика
+aviasales_limiter = TokenBucket(AVIASALES_RATE_LIMIT, AVIASALES_RATE_BURST)
+
+
+def is_direct_only(transfers: Any) -> bool:
+    return transfers == 0 or transfers == "0"
+
+
+def build_prices_params(origin: str, destination: str, departure_at: Optional[str] = None, currency: str = "rub", transfers: Any = "any", limit: int = 5) -> Dict[str, Any]:
+    params = {
+        "origin": origin,
+        "destination": destination,
+        "one_way": "true",
+        "currency": currency,
+        "token": AVIASALES_TOKEN,
+        "limit": limit,
+        "sorting": "price"
+    }
+    if departure_at:
+        params["departure_at"] = departure_at
+    if is_direct_only(transfers):
+        params["direct"] = "true"
+    return params
+
+
+async def fetch_prices_for_date(origin: str, destination: str, departure_at: Optional[str] = None, currency: str = "rub", transfers: Any = "any", limit: int = 5, limiter: Optional[TokenBucket] = None, max_retries: int = 0) -> List[Dict]:
+    """Один запрос к /v3/prices_for_dates. Ошибки сети, ответы не 200 и success=false пробрасываются вызывающему.
+
+    С limiter запрос ждёт токен, а на 429 повторяется до max_retries раз с паузой
+    из Retry-After (или экспоненциальной), на время которой лимитер останавливает всех.
+    """
+    params = build_prices_params(origin, destination, departure_at, currency, transfers, limit)
+    client = get_http_client(AVIASALES)
+    for attempt in range(max_retries + 1):
+        if limiter is not None:
+            await limiter.acquire()
+        resp = await client.get(PRICES_FOR_DATES_URL, params=params)
+        if resp.status_code != 429 or attempt == max_retries:
+            break
+        delay = backoff_delay(attempt, retry_after=resp.headers.get("Retry-After"))
+        print(f"[AVIASALES] 429 for {origin}->{destination} {departure_at}, retry in {delay:.1f}s")
+        metrics.inc("aviasales_throttled_total")
+        if limiter is not None:
+            limiter.pause(delay)
+        else:
+            await asyncio.sleep(delay)
+    try:
+        data = resp.json()
+    except ValueError:
+        data = {}
+    # Ошибка квоты или сервера — не «рейсов нет»: пустой ответ кэшировался бы как отсутствие билетов
+    if resp.status_code != 200 or not isinstance(data, dict) or not data.get("success"):
+        error = data.get("error") if isinstance(data, dict) else None
+        raise RuntimeError(f"Aviasales {resp.status_code} for {origin}->{destination} {departure_at}: {error}")
+    return data.get("data") or []
+
+
+class PlanResult(NamedTuple):
+    query: PlannedQuery
+    flights: List[Dict]  # рейсы внутри окна запроса
+    ok: bool             # False, если запрос упал
+    complete: bool       # ответ не упёрся в limit, т.е. пустые дни окна действительно пустые
+
+
+async def execute_plan(origin: str, destination: str, plan: List[PlannedQuery], currency: str = "rub", transfers: Any = "any", concurrency: Optional[int] = None, limiter: Optional[TokenBucket] = None, max_retries: int = 0) -> List[PlanResult]:
+    """Параллельно выполняет запланированные запросы (не больше concurrency одновременно).
+
+    Ошибка одного запроса не влияет на остальные. Ответ каждого запроса обрезается до его окна дат,
+    результаты возвращаются в порядке плана, поэтому итог не зависит от того, какой запрос завершился первым.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency or AVIASALES_CONCURRENCY))
+
+    async def fetch_one(query: PlannedQuery) -> PlanResult:
+        async with semaphore:
+            try:
+                flights = await fetch_prices_for_date(origin, destination, query.departure_at, currency, transfers, query.limit, limiter, max_retries)
+            except Exception as e:
+                print(f"[ERROR] Ошибка при поиске билетов на дату {query.departure_at}: {e}")
+                return PlanResult(query, [], False, False)
+        return PlanResult(query, filter_to_window(flights, query.start, query.end), True, len(flights) < query.limit)
+
+    return list(await asyncio.gather(*(fetch_one(q) for q in plan)))
+
+
+async def fetch_prices_for_plan(origin: str, destination: str, plan: List[PlannedQuery], currency: str = "rub", transfers: Any = "any", concurrency: Optional[int] = None) -> List[Dict]:
+    """Выполняет план и склеивает рейсы в порядке запросов"""
+    all_flights = []
+    for result in await execute_plan(origin, destination, plan, currency, transfers, concurrency):
+        all_flights.extend(result.flights)
+    return all_flights
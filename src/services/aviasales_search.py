@@ -4,6 +4,7 @@ import json
 from typing import Dict, List, Optional, Any
 from datetime import datetime
 from src.services.flight_cache import flight_cache
+from src.services.city_index import city_index, remember_city
 
 class AviasalesSearchTool:
     """Поиск авиабилетов через Aviasales API с кэшированием"""
@@ -15,7 +16,10 @@ class AviasalesSearchTool:
         self.base_url = "https://api.travelpayouts.com/aviasales"
     
     def _get_iata_code(self, city_name: str) -> Optional[str]:
-        """Получает IATA код города через API Aviasales"""
+        """Получает IATA код города из локального индекса, при промахе — через API Aviasales (при его недоступности — по опечатке)"""
+        local = city_index.lookup(city_name)
+        if local:
+            return local[0]
         try:
             url = f"{self.base_url}/places.json"
             params = {
@@ -28,11 +32,14 @@ class AviasalesSearchTool:
             response.raise_for_status()
             places = response.json()
             if places and len(places) > 0:
+                remember_city(city_name, places[0].get('code'), places[0].get('name'), places[0].get('country_name'))
                 return places[0].get('code')
             return None
         except Exception as e:
             print(f"[IATA ERROR] Failed to get IATA code for {city_name}: {e}")
-            return None
+            # API недоступен — пробуем угадать опечатку по локальному индексу
+            suggested = city_index.suggest(city_name)
+            return suggested[0] if suggested else None
     
     def _search_flights(self, params: Dict[str, Any]) -> List[Dict]:
         """Выполняет поиск рейсов через API Aviasales"""
@@ -0,0 +1,194 @@
+import time
+from typing import Any, Dict, List, Optional
+from src.services.redis_client import redis_client, async_redis_client
+from src.services.metrics import metrics
+
+# Статистика кэшей ведётся инкрементально при записи, чтении и удалении,
+# поэтому stats не обходит ключи (KEYS + MEMORY USAGE) и не блокирует Redis.
+# Ключи статистики лежат вне пространства имён кэша, чтобы SCAN по префиксу их не задевал:
+#   cache_stats:{name}:expiry   — ZSET ключ -> время истечения (число записей, гистограмма TTL)
+#   cache_stats:{name}:sizes    — HASH ключ -> размер значения в байтах
+#   cache_stats:{name}:counters — HASH bytes / writes / hits / misses / evictions
+STATS_PREFIX = "cache_stats:"
+REAP_BATCH = 100   # сколько истёкших записей списывать за один вызов
+SCAN_BATCH = 500   # размер пачки SCAN/UNLINK при полной очистке
+TTL_BUCKETS = (300, 1800, 3600, 6 * 3600, 24 * 3600)  # границы гистограммы оставшегося TTL, секунды
+
+# Списывает истёкшие записи: уменьшает bytes и считает их вытесненными
+_REAP_LUA = """
+local function reap(expiry, sizes, counters, now, batch)
+    local expired = redis.call('ZRANGEBYSCORE', expiry, '-inf', now, 'LIMIT', 0, batch)
+    if #expired == 0 then
+        return
+    end
+    local freed = 0
+    for _, key in ipairs(expired) do
+        freed = freed + (tonumber(redis.call('HGET', sizes, key)) or 0)
+        redis.call('HDEL', sizes, key)
+        redis.call('ZREM', expiry, key)
+    end
+    redis.call('HINCRBY', counters, 'bytes', -freed)
+    redis.call('HINCRBY', counters, 'evictions', #expired)
+end
+"""
+
+# KEYS: expiry, sizes, counters, key1..keyN; ARGV: ttl, now, reap_batch, value1..valueN
+_SET_MANY_LUA = _REAP_LUA + """
+local ttl, now = tonumber(ARGV[1]), tonumber(ARGV[2])
+reap(KEYS[1], KEYS[2], KEYS[3], now, tonumber(ARGV[3]))
+local delta = 0
+for i = 4, #KEYS do
+    local size = string.len(ARGV[i])
+    delta = delta + size - (tonumber(redis.call('HGET', KEYS[2], KEYS[i])) or 0)
+    redis.call('SET', KEYS[i], ARGV[i], 'EX', ttl)
+    redis.call('HSET', KEYS[2], KEYS[i], size)
+    redis.call('ZADD', KEYS[1], now + ttl, KEYS[i])
+end
+redis.call('HINCRBY', KEYS[3], 'bytes', delta)
+redis.call('HINCRBY', KEYS[3], 'writes', #KEYS - 3)
+return #KEYS - 3
+"""
+
+# KEYS: counters, key1..keyN
+_GET_MANY_LUA = """
+local values = redis.call('MGET', unpack(KEYS, 2))
+local hits = 0
+for i = 1, #values do
+    if values[i] then
+        hits = hits + 1
+    end
+end
+if hits > 0 then
+    redis.call('HINCRBY', KEYS[1], 'hits', hits)
+end
+if #values > hits then
+    redis.call('HINCRBY', KEYS[1], 'misses', #values - hits)
+end
+return values
+"""
+
+# KEYS: expiry, sizes, counters, key1..keyN
+_DELETE_MANY_LUA = """
+local freed = 0
+for i = 4, #KEYS do
+    freed = freed + (tonumber(redis.call('HGET', KEYS[2], KEYS[i])) or 0)
+    redis.call('HDEL', KEYS[2], KEYS[i])
+    redis.call('ZREM', KEYS[1], KEYS[i])
+    redis.call('UNLINK', KEYS[i])
+end
+redis.call('HINCRBY', KEYS[3], 'bytes', -freed)
+return #KEYS - 3
+"""
+
+# KEYS: expiry, sizes, counters; ARGV: now, reap_batch, bucket1..bucketN
+_STATS_LUA = _REAP_LUA + """
+local now = tonumber(ARGV[1])
+reap(KEYS[1], KEYS[2], KEYS[3], now, tonumber(ARGV[2]))
+local buckets = {}
+local low = now
+for i = 3, #ARGV do
+    local high = now + tonumber(ARGV[i])
+    table.insert(buckets, redis.call('ZCOUNT', KEYS[1], '(' .. low, high))
+    low = high
+end
+table.insert(buckets, redis.call('ZCOUNT', KEYS[1], '(' .. low, '+inf'))
+return {redis.call('ZCOUNT', KEYS[1], '(' .. now, '+inf'), redis.call('HGETALL', KEYS[3]), buckets}
+"""
+
+_set_many = redis_client.register_script(_SET_MANY_LUA)
+_get_many = redis_client.register_script(_GET_MANY_LUA)
+_delete_many = redis_client.register_script(_DELETE_MANY_LUA)
+_stats = redis_client.register_script(_STATS_LUA)
+_aset_many = async_redis_client.register_script(_SET_MANY_LUA)
+_aget_many = async_redis_client.register_script(_GET_MANY_LUA)
+
+
+def _bucket_label(seconds: int) -> str:
+    if seconds % 3600 == 0:
+        return f"<={seconds // 3600}h"
+    return f"<={seconds // 60}m"
+
+
+TTL_BUCKET_LABELS = [_bucket_label(b) for b in TTL_BUCKETS] + [f">{_bucket_label(TTL_BUCKETS[-1])[2:]}"]
+
+
+class TrackedCache:
+    """Строковые значения в Redis с инкрементальной статистикой (общий слой для кэшей рейсов и парсинга)"""
+
+    def __init__(self, name: str, prefix: str):
+        self.name = name
+        self.prefix = prefix
+        self.expiry_key = f"{STATS_PREFIX}{name}:expiry"
+        self.sizes_key = f"{STATS_PREFIX}{name}:sizes"
+        self.counters_key = f"{STATS_PREFIX}{name}:counters"
+
+    @property
+    def _stats_keys(self) -> List[str]:
+        return [self.expiry_key, self.sizes_key, self.counters_key]
+
+    def _set_args(self, items: Dict[str, str], ttl: int):
+        return self._stats_keys + list(items.keys()), [ttl, int(time.time()), REAP_BATCH] + list(items.values())
+
+    def _record_lookups(self, values: List[Optional[str]]) -> List[Optional[str]]:
+        hits = sum(1 for value in values if value is not None)
+        if hits:
+            metrics.inc("cache_lookups_total", hits, cache=self.name, result="hit")
+        if len(values) > hits:
+            metrics.inc("cache_lookups_total", len(values) - hits, cache=self.name, result="miss")
+        return values
+
+    def _parse_stats(self, raw: List[Any]) -> Dict[str, Any]:
+        entries, counters, buckets = raw
+        counters = dict(zip(counters[::2], counters[1::2])) if isinstance(counters, list) else counters
+        counters = {k: int(v) for k, v in (counters or {}).items()}
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "total_entries": int(entries),
+            "total_size_bytes": max(counters.get("bytes", 0), 0),
+            "hits": hits,
+            "misses": misses,
+            "hit_ratio": round(hits / (hits + misses), 3) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "writes": counters.get("writes", 0),
+            "ttl_histogram": dict(zip(TTL_BUCKET_LABELS, (int(b) for b in buckets))),
+        }
+
+    def set_many(self, items: Dict[str, str], ttl: int) -> int:
+        if not items:
+            return 0
+        keys, args = self._set_args(items, ttl)
+        return _set_many(keys=keys, args=args)
+
+    async def aset_many(self, items: Dict[str, str], ttl: int) -> int:
+        if not items:
+            return 0
+        keys, args = self._set_args(items, ttl)
+        return await _aset_many(keys=keys, args=args)
+
+    def get_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return self._record_lookups(_get_many(keys=[self.counters_key] + keys))
+
+    async def aget_many(self, keys: List[str]) -> List[Optional[str]]:
+        if not keys:
+            return []
+        return self._record_lookups(await _aget_many(keys=[self.counters_key] + keys))
+
+    def delete(self, keys: List[str]) -> int:
+        if not keys:
+            return 0
+        return _delete_many(keys=self._stats_keys + keys)
+
+    def clear(self) -> int:
+        """Удаляет все ключи кэша пачками через SCAN + UNLINK, не блокируя Redis"""
+        removed, batch = 0, []
+        for key in redis_client.scan_iter(match=f"{self.prefix}*", count=SCAN_BATCH):
+            batch.append(key)
+            if len(batch) >= SCAN_BATCH:
+                removed += self.delete(batch)
+                batch = []
+        return removed + self.delete(batch)
+
+    def stats(self) -> Dict[str, Any]:
+        return self._parse_stats(_stats(keys=self._stats_keys, args=[int(time.time()), REAP_BATCH, *TTL_BUCKETS]))
@@ -0,0 +1,304 @@
+import os
+import re
+import json
+from typing import Dict, List, Optional, Set, Tuple
+
+# Пустое значение (CITY_INDEX_PATH= в .env) означает путь по умолчанию
+CITY_INDEX_PATH = os.getenv("CITY_INDEX_PATH") or os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "cities.json"
+)
+LEARNED_CITIES_KEY = "city_index:learned"
+# Минимальная похожесть (коэффициент Дайса по триграммам) для нечёткого совпадения.
+# Нечёткий поиск — только запасной вариант, когда автокомплит недоступен, поэтому порог строгий
+FUZZY_THRESHOLD = float(os.getenv("CITY_INDEX_FUZZY_THRESHOLD", 0.7))
+# Опечатка не меняет первую букву и длину больше чем на столько символов
+FUZZY_MAX_LENGTH_DIFF = 2
+
+CityMatch = Tuple[str, str, Optional[str]]  # (IATA, название, страна)
+
+_PREPOSITIONS = {"в", "во", "из", "изо", "до", "на", "с", "со", "от", "к", "ко", "для", "to", "from", "in"}
+
+_RU_TO_LAT = {
+    "а": "a", "б": "b", "в": "v", "г": "g", "д": "d", "е": "e", "ж": "zh", "з": "z", "и": "i",
+    "й": "y", "к": "k", "л": "l", "м": "m", "н": "n", "о": "o", "п": "p", "р": "r", "с": "s",
+    "т": "t", "у": "u", "ф": "f", "х": "kh", "ц": "ts", "ч": "ch", "ш": "sh", "щ": "shch",
+    "ъ": "", "ы": "y", "ь": "", "э": "e", "ю": "yu", "я": "ya",
+}
+# Обратная транслитерация: сначала длинные сочетания
+_LAT_TO_RU = [
+    ("shch", "щ"), ("sch", "щ"), ("zh", "ж"), ("kh", "х"), ("ts", "ц"), ("ch", "ч"), ("sh", "ш"),
+    ("yu", "ю"), ("ya", "я"), ("yo", "е"), ("ye", "е"), ("iy", "ий"), ("a", "а"), ("b", "б"),
+    ("c", "к"), ("d", "д"), ("e", "е"), ("f", "ф"), ("g", "г"), ("h", "х"), ("i", "и"), ("j", "дж"),
+    ("k", "к"), ("l", "л"), ("m", "м"), ("n", "н"), ("o", "о"), ("p", "п"), ("q", "к"), ("r", "р"),
+    ("s", "с"), ("t", "т"), ("u", "у"), ("v", "в"), ("w", "в"), ("x", "кс"), ("y", "й"), ("z", "з"),
+]
+
+
+def normalize(text: str) -> str:
+    """Нижний регистр, ё -> е, без пунктуации и предлогов ("в Сочи" -> "сочи")"""
+    text = (text or "").lower().replace("ё", "е")
+    text = re.sub(r"[^\w\s-]", " ", text)
+    words = [w for w in re.split(r"\s+", text.strip()) if w]
+    while len(words) > 1 and words[0] in _PREPOSITIONS:
+        words = words[1:]
+    return re.sub(r"\s*-\s*", "-", " ".join(words))
+
+
+def is_latin(text: str) -> bool:
+    return bool(re.search(r"[a-z]", text)) and not re.search(r"[а-я]", text)
+
+
+def ru_to_lat(text: str) -> str:
+    return "".join(_RU_TO_LAT.get(ch, ch) for ch in text)
+
+
+def lat_to_ru(text: str) -> str:
+    result = []
+    i = 0
+    while i < len(text):
+        for lat, ru in _LAT_TO_RU:
+            if text.startswith(lat, i):
+                result.append(ru)
+                i += len(lat)
+                break
+        else:
+            result.append(text[i])
+            i += 1
+    return "".join(result)
+
+
+def _decline_word(word: str) -> List[str]:
+    """Падежные формы одного слова по типовым окончаниям (Москва -> Москвы, Москве, Москву...)"""
+    if len(word) < 3:
+        return []
+    last = word[-1]
+    stem = word[:-1]
+    if last == "а":
+        genitive = stem + ("и" if stem[-1] in "гкхжшщч" else "ы")
+        return [genitive, stem + "е", stem + "у", stem + "ой"]
+    if last == "я":
+        if word.endswith("ия"):
+            return [stem + "и", stem + "ю", stem + "ей"]
+        return [stem + "и", stem + "е", stem + "ю", stem + "ей"]
+    if last == "ь":
+        return [stem + "и", stem + "ью", stem + "я", stem + "ю", stem + "е", stem + "ем"]
+    if last == "й":
+        return [stem + "я", stem + "ю", stem + "е", stem + "ем"]
+    if last in "оиуеюэы":
+        # Сочи, Тбилиси, Баку — не склоняются
+        return []
+    return [word + "а", word + "у", word + "е", word + "ом"]
+
+
+def declensions(name: str) -> List[str]:
+    """Падежные формы названия: склоняется последнее слово, у "X-на-Y" — первое"""
+    name = normalize(name)
+    match = re.fullmatch(r"([^\s-]+)(-на-.+)", name)
+    if match:
+        return [form + match.group(2) for form in _decline_word(match.group(1))]
+    head, sep, tail = name.rpartition("-") if "-" in name else name.rpartition(" ")
+    return [head + sep + form for form in _decline_word(tail)]
+
+
+_PHONETIC = str.maketrans({"о": "а", "я": "а", "е": "и", "э": "и", "ы": "и", "й": "и"})
+
+
+def phonetic_key(text: str) -> str:
+    """Ключ для опечаток "на слух": безударные гласные (Масква/Москва) и двойные буквы (Талин/Таллин)"""
+    return re.sub(r"(.)\1+", r"\1", text.translate(_PHONETIC))
+
+
+def _trigrams(text: str) -> Set[str]:
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class CityIndex:
+    """Локальный индекс городов и аэропортов: точные формы, падежи, транслит и нечёткий поиск по триграммам"""
+
+    def __init__(self):
+        self._cities: Dict[str, Dict[str, Optional[str]]] = {}
+        self._forms: Dict[str, str] = {}
+        self._phonetic: Dict[str, List[str]] = {}
+        self._trigram_index: Dict[str, Set[str]] = {}
+
+    @classmethod
+    def from_snapshot(cls, path: str = CITY_INDEX_PATH) -> "CityIndex":
+        index = cls()
+        try:
+            with open(path, encoding="utf-8") as f:
+                for city in json.load(f):
+                    index.add_city(city)
+            print(f"[CITY INDEX] Loaded {len(index)} cities from {path}")
+        except Exception as e:
+            print(f"[CITY INDEX ERROR] Failed to load snapshot {path}: {e}")
+        return index
+
+    def __len__(self) -> int:
+        return len(self._cities)
+
+    def _add_form(self, form: str, code: str):
+        form = normalize(form)
+        if not form or form in self._forms:
+            return
+        self._forms[form] = code
+        self._phonetic.setdefault(phonetic_key(form), []).append(form)
+        for trigram in _trigrams(form):
+            self._trigram_index.setdefault(trigram, set()).add(form)
+
+    def add_city(self, city: Dict):
+        """Добавляет город: {"code", "name", "name_en", "country_name", "cases": [...], "aliases": [...]}"""
+        code = (city.get("code") or "").upper()
+        name = city.get("name")
+        if not code or not name:
+            return
+        self._cities.setdefault(code, {"name": name, "country_name": city.get("country_name")})
+        names = [name] + list(city.get("aliases") or [])
+        for ru_name in names:
+            self._add_form(ru_name, code)
+            self._add_form(ru_to_lat(normalize(ru_name)), code)
+            for form in declensions(ru_name):
+                self._add_form(form, code)
+        for form in city.get("cases") or []:
+            self._add_form(form, code)
+        if city.get("name_en"):
+            self._add_form(city["name_en"], code)
+        self._add_form(code, code)
+
+    def learn(self, term: str, code: str, name: Optional[str] = None, country_name: Optional[str] = None):
+        """Запоминает ответ внешнего автокомплита, чтобы следующий запрос решился локально"""
+        code = (code or "").upper()
+        if not code:
+            return
+        if code not in self._cities:
+            self.add_city({"code": code, "name": name or term, "country_name": country_name})
+        self._add_form(term, code)
+
+    def _match(self, code: str) -> CityMatch:
+        city = self._cities[code]
+        return code, city["name"], city["country_name"]
+
+    def _fuzzy(self, term: str) -> Optional[Tuple[float, str]]:
+        query = _trigrams(term)
+        shared: Dict[str, int] = {}
+        for trigram in query:
+            for form in self._trigram_index.get(trigram, ()):
+                shared[form] = shared.get(form, 0) + 1
+        best = None
+        for form, count in shared.items():
+            if not self._close_enough(term, form):
+                continue
+            score = 2 * count / (len(query) + len(_trigrams(form)))
+            if best is None or score > best[0] or (score == best[0] and form < best[1]):
+                best = (score, form)
+        return best
+
+    def exact(self, text: str) -> Optional[CityMatch]:
+        """Только точное совпадение с известной формой (название, падеж, алиас, код) — без транслита и опечаток"""
+        code = self._forms.get(normalize(text))
+        return self._match(code) if code else None
+
+    @staticmethod
+    def _candidates(text: str) -> List[str]:
+        term = normalize(text)
+        if not term:
+            return []
+        return [term, lat_to_ru(term) if is_latin(term) else ru_to_lat(term)]
+
+    @staticmethod
+    def _close_enough(term: str, form: str) -> bool:
+        return term[:1] == form[:1] and abs(len(term) - len(form)) <= FUZZY_MAX_LENGTH_DIFF
+
+    def lookup(self, text: str) -> Optional[CityMatch]:
+        """(IATA, название, страна) по названию, падежу, алиасу, коду или транслиту; None, если такой формы нет.
+        Опечатки здесь не угадываются: незнакомое название (в том числе страну) решает автокомплит"""
+        for candidate in self._candidates(text):
+            code = self._forms.get(candidate)
+            if code:
+                return self._match(code)
+        return None
+
+    def suggest(self, text: str) -> Optional[CityMatch]:
+        """Город по опечатке (Масква, Санкт-Петрбург) — запасной вариант, когда автокомплит недоступен.
+        Совпадение должно начинаться с той же буквы и почти совпадать по длине"""
+        candidates = self._candidates(text)
+        for candidate in candidates:
+            for form in self._phonetic.get(phonetic_key(candidate), ()):
+                if self._close_enough(candidate, form):
+                    return self._match(self._forms[form])
+        best = None
+        for candidate in candidates:
+            found = self._fuzzy(candidate)
+            if found and (best is None or found[0] > best[0]):
+                best = found
+        if best and best[0] >= FUZZY_THRESHOLD:
+            return self._match(self._forms[best[1]])
+        return None
+
+
+def _is_exact(term: str, name: Optional[str]) -> bool:
+    """Запоминаются только ответы автокомплита, совпавшие с запросом по названию: догадка
+    («первый город страны») навсегда стала бы точным совпадением для локального разбора"""
+    return bool(name) and normalize(term) == normalize(name)
+
+
+def _learn_from_redis(learned: Dict[str, str]):
+    loaded = 0
+    for term, value in learned.items():
+        city = json.loads(value)
+        # Записи-догадки, сохранённые раньше, не загружаются
+        if _is_exact(term, city.get("name")):
+            city_index.learn(term, city.get("code"), city.get("name"), city.get("country_name"))
+            loaded += 1
+    print(f"[CITY INDEX] Loaded {loaded} of {len(learned)} learned terms from Redis")
+
+
+def _learned_value(code: str, name: Optional[str], country_name: Optional[str]) -> str:
+    return json.dumps({"code": code, "name": name, "country_name": country_name}, ensure_ascii=False)
+
+
+def load_learned_cities():
+    """Подгружает из Redis города, выученные из автокомплита"""
+    from src.services.redis_client import redis_client
+    try:
+        _learn_from_redis(redis_client.hgetall(LEARNED_CITIES_KEY))
+    except Exception as e:
+        print(f"[CITY INDEX ERROR] Failed to load learned cities: {e}")
+
+
+def remember_city(term: str, code: str, name: Optional[str] = None, country_name: Optional[str] = None):
+    """Добавляет ответ автокомплита в индекс и сохраняет его в Redis для других процессов и рестартов.
+    Ответ, не совпадающий с запросом по названию, не запоминается"""
+    from src.services.redis_client import redis_client
+    if not _is_exact(term, name):
+        return
+    city_index.learn(term, code, name, country_name)
+    try:
+        redis_client.hset(LEARNED_CITIES_KEY, normalize(term), _learned_value(code, name, country_name))
+    except Exception as e:
+        print(f"[CITY INDEX ERROR] Failed to persist learned city: {e}")
+
+
+async def aload_learned_cities():
+    """Асинхронный вариант load_learned_cities"""
+    from src.services.redis_client import async_redis_client
+    try:
+        _learn_from_redis(await async_redis_client.hgetall(LEARNED_CITIES_KEY))
+    except Exception as e:
+        print(f"[CITY INDEX ERROR] Failed to load learned cities: {e}")
+
+
+async def aremember_city(term: str, code: str, name: Optional[str] = None, country_name: Optional[str] = None):
+    """Асинхронный вариант remember_city"""
+    from src.services.redis_client import async_redis_client
+    if not _is_exact(term, name):
+        return
+    city_index.learn(term, code, name, country_name)
+    try:
+        await async_redis_client.hset(LEARNED_CITIES_KEY, normalize(term), _learned_value(code, name, country_name))
+    except Exception as e:
+        print(f"[CITY INDEX ERROR] Failed to persist learned city: {e}")
+
+
+# Глобальный экземпляр индекса
+city_index = CityIndex.from_snapshot()
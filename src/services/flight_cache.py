@@ -1,7 +1,7 @@
 import json
 import hashlib
 from typing import Dict, List, Optional, Any
-from src.services.redis_client import redis_client
+from src.services.cache_store import TrackedCache
 
 # Примитивный кэш для результатов поиска рейсов (можно заменить на Redis)
 class FlightCacheTool:
@@ -9,54 +9,110 @@ class FlightCacheTool:
     
     CACHE_TTL = 60 * 60 * 2  # 2 часа
     CACHE_PREFIX = "flight_cache:"
+    DAY_PREFIX = CACHE_PREFIX + "day:"
     
     def __init__(self):
         self.name = "FlightCacheTool"
         self.description = "Кэширует результаты поиска рейсов в Redis."
+        self._store = TrackedCache("flight", self.CACHE_PREFIX)
     
+    @staticmethod
+    def _canonical_params(params: Dict[str, Any]) -> Dict[str, Any]:
+        """Приводит параметры к каноническому виду: 0 и "0", дата-словарь и дата-строка дают один ключ"""
+        canonical = {}
+        for key, value in params.items():
+            if key == "transfers":
+                value = "direct" if value == 0 or value == "0" else "any"
+            elif key == "date":
+                if isinstance(value, dict) and "from" in value and "to" in value:
+                    value = f"{value['from']} - {value['to']}"
+                elif isinstance(value, str):
+                    value = " - ".join(part.strip() for part in value.split(" - "))
+            elif isinstance(value, str):
+                value = value.strip().lower()
+            canonical[key] = value
+        return canonical
+
     def _generate_key(self, params: Dict[str, Any]) -> str:
         """Генерирует ключ кэша на основе параметров поиска"""
         # Сортируем параметры для стабильного ключа
-        sorted_params = sorted(params.items())
+        sorted_params = sorted(self._canonical_params(params).items())
         params_str = json.dumps(sorted_params, sort_keys=True)
         hash_obj = hashlib.md5(params_str.encode())
         return f"{self.CACHE_PREFIX}{hash_obj.hexdigest()}"
     
+    @staticmethod
+    def _decode(cached_data) -> Optional[List[Dict]]:
+        if cached_data:
+            if isinstance(cached_data, bytes):
+                return json.loads(cached_data.decode('utf-8'))
+            elif isinstance(cached_data, str):
+                return json.loads(cached_data)
+        return None
+
     def get(self, params: Dict[str, Any]) -> Optional[List[Dict]]:
         """Получает кэшированные рейсы"""
         try:
             key = self._generate_key(params)
-            cached_data = redis_client.get(key)
-            
-            if cached_data:
-                if isinstance(cached_data, bytes):
-                    return json.loads(cached_data.decode('utf-8'))
-                elif isinstance(cached_data, str):
-                    return json.loads(cached_data)
-            
-            return None
+            return self._decode(self._store.get_many([key])[0])
         except Exception as e:
             print(f"[CACHE ERROR] Failed to get cached flights: {e}")
             return None
-    
+
     def save(self, params: Dict[str, Any], flights: List[Dict]) -> bool:
         """Сохраняет рейсы в кэш"""
         try:
             key = self._generate_key(params)
             flights_json = json.dumps(flights, ensure_ascii=False)
             
-            redis_client.setex(key, self.CACHE_TTL, flights_json)
+            self._store.set_many({key: flights_json}, self.CACHE_TTL)
             print(f"[CACHE] Saved {len(flights)} flights for key: {key[:20]}...")
             return True
         except Exception as e:
             print(f"[CACHE ERROR] Failed to save flights: {e}")
             return False
-    
+
+    def _day_key(self, origin: str, destination: str, day: str, direct_only: bool, currency: str = "rub") -> str:
+        """Канонический ключ для рейсов одного дня: (откуда, куда, день, только прямые, валюта)"""
+        mode = "direct" if direct_only else "any"
+        return f"{self.DAY_PREFIX}{origin.upper()}:{destination.upper()}:{day}:{mode}:{currency.lower()}"
+
+    def _day_items(self, origin: str, destination: str, flights_by_day: Dict[str, List[Dict]], direct_only: bool, currency: str) -> Dict[str, str]:
+        return {
+            self._day_key(origin, destination, day, direct_only, currency): json.dumps(flights, ensure_ascii=False)
+            for day, flights in flights_by_day.items()
+        }
+
+    async def aget_days(self, origin: str, destination: str, days: List[str], direct_only: bool, currency: str = "rub") -> Dict[str, Optional[List[Dict]]]:
+        """Рейсы по дням за один запрос. None — дня нет в кэше, [] — день закэширован пустым"""
+        result: Dict[str, Optional[List[Dict]]] = {day: None for day in days}
+        if not days:
+            return result
+        try:
+            keys = [self._day_key(origin, destination, day, direct_only, currency) for day in days]
+            for day, cached_data in zip(days, await self._store.aget_many(keys)):
+                result[day] = self._decode(cached_data)
+        except Exception as e:
+            print(f"[CACHE ERROR] Failed to get cached days: {e}")
+        return result
+
+    async def asave_days(self, origin: str, destination: str, flights_by_day: Dict[str, List[Dict]], direct_only: bool, currency: str = "rub") -> bool:
+        """Сохраняет рейсы по дням (включая пустые дни) за один запрос"""
+        if not flights_by_day:
+            return True
+        try:
+            await self._store.aset_many(self._day_items(origin, destination, flights_by_day, direct_only, currency), self.CACHE_TTL)
+            print(f"[CACHE] Saved {len(flights_by_day)} days for {origin}->{destination}")
+            return True
+        except Exception as e:
+            print(f"[CACHE ERROR] Failed to save days: {e}")
+            return False
+
     def clear(self, params: Dict[str, Any]) -> bool:
         """Очищает кэш для конкретных параметров"""
         try:
             key = self._generate_key(params)
-            redis_client.delete(key)
+            self._store.delete([key])
             print(f"[CACHE] Cleared cache for key: {key[:20]}...")
             return True
         except Exception as e:
@@ -66,12 +122,9 @@ class FlightCacheTool:
     def clear_all(self) -> bool:
         """Очищает весь кэш рейсов"""
         try:
-            pattern = f"{self.CACHE_PREFIX}*"
-            keys = redis_client.keys(pattern)
-            
-            if keys:
-                redis_client.delete(*keys)
-                print(f"[CACHE] Cleared {len(keys)} cached flight entries")
+            removed = self._store.clear()
+            if removed:
+                print(f"[CACHE] Cleared {removed} cached flight entries")
             else:
                 print("[CACHE] No cached flights found")
             
@@ -81,27 +134,15 @@ class FlightCacheTool:
             return False
     
     def get_stats(self) -> Dict[str, Any]:
-        """Получает статистику кэша"""
+        """Получает статистику кэша (счётчики ведутся при записи, без обхода ключей)"""
         try:
-            pattern = f"{self.CACHE_PREFIX}*"
-            keys = redis_client.keys(pattern)
-            
-            total_size = 0
-            for key in keys:
-                size = redis_client.memory_usage(key)
-                if size:
-                    total_size += size
-            
-            return {
-                "total_entries": len(keys),
-                "total_size_bytes": total_size,
-                "cache_prefix": self.CACHE_PREFIX,
-                "ttl_seconds": self.CACHE_TTL
-            }
+            stats = self._store.stats()
+            stats.update({"cache_prefix": self.CACHE_PREFIX, "ttl_seconds": self.CACHE_TTL})
+            return stats
         except Exception as e:
             print(f"[CACHE ERROR] Failed to get stats: {e}")
             return {"error": str(e)}
-    
+
     def __call__(self, params: Dict[str, Any]) -> Optional[List[Dict]]:
         """Совместимость с интерфейсом агента"""
         return self.get(params)
@@ -0,0 +1,74 @@
+from datetime import date as date_type
+from typing import Any, Dict, List, Optional, Set, Union
+from src.services.aviasales_api import PlanResult, execute_plan, fetch_prices_for_plan, is_direct_only
+from src.services.flight_cache import flight_cache
+from src.services.query_planner import PlannedQuery, days_in_range, parse_date_range, plan_days, plan_queries
+
+
+def _group_by_day(flights: List[Dict]) -> Dict[str, List[Dict]]:
+    by_day: Dict[str, List[Dict]] = {}
+    for flight in flights:
+        day = (flight.get("departure_at") or "")[:10]
+        if day:
+            by_day.setdefault(day, []).append(flight)
+    return by_day
+
+
+def _collect_results(results: List[PlanResult], wanted: Set[str], fetched: Dict[str, List[Dict]]) -> List[str]:
+    """Раскладывает ответы по дням в fetched. Дни полного ответа без рейсов записываются пустыми
+    (и кэшируются как «билетов нет»); возвращает пустые дни оборванных месячных запросов"""
+    refetch = []
+    for result in results:
+        if not result.ok:
+            continue
+        by_day = _group_by_day(result.flights)
+        window = [d.isoformat() for d in days_in_range(date_type.fromisoformat(result.query.start), date_type.fromisoformat(result.query.end))]
+        for day in window:
+            if day in by_day or day not in wanted:
+                continue
+            if result.complete:
+                by_day[day] = []
+            elif result.query.is_month:
+                refetch.append(day)
+        fetched.update(by_day)
+    return refetch
+
+
+async def search_flights(origin: str, destination: str, date: Optional[Union[str, dict]] = None, currency: str = "rub", transfers: Any = "any") -> List[Dict]:
+    """Рейсы за дату/диапазон: дни берутся из кэша, из Aviasales запрашиваются только недостающие"""
+    direct_only = is_direct_only(transfers)
+    date_range = parse_date_range(date)
+    if date_range is None:
+        # Без конкретных дней (any или нестандартный формат) кэшируем ответ целиком
+        label = "any" if date is None or date == "any" else str(date)
+        cached = (await flight_cache.aget_days(origin, destination, [label], direct_only, currency))[label]
+        if cached is not None:
+            print(f"[CACHE] Found flights in Redis for {origin}->{destination} date={label}")
+            return cached
+        flights = await fetch_prices_for_plan(origin, destination, plan_queries(date), currency=currency, transfers=transfers)
+        if flights:
+            await flight_cache.asave_days(origin, destination, {label: flights}, direct_only, currency)
+        return flights
+
+    days = [d.isoformat() for d in days_in_range(*date_range)]
+    cached_days = await flight_cache.aget_days(origin, destination, days, direct_only, currency)
+    missing = [day for day in days if cached_days[day] is None]
+    print(f"[CACHE] {len(days) - len(missing)}/{len(days)} days cached for {origin}->{destination} {days[0]}..{days[-1]}")
+
+    fetched: Dict[str, List[Dict]] = {}
+    if missing:
+        plan = plan_days(date_type.fromisoformat(day) for day in missing)
+        print(f"[PLANNER] {len(plan)} Aviasales requests for {len(missing)} missing days: {[q.departure_at for q in plan]}")
+        refetch = _collect_results(await execute_plan(origin, destination, plan, currency=currency, transfers=transfers), set(missing), fetched)
+        if refetch:
+            # Месячный запрос упёрся в limit (самые дешёвые билеты месяца вне окна): пустые дни — по одному
+            day_plan = [PlannedQuery(day, day, day) for day in sorted(refetch)]
+            print(f"[PLANNER] Month query truncated, {len(day_plan)} day requests for days without flights")
+            _collect_results(await execute_plan(origin, destination, day_plan, currency=currency, transfers=transfers), set(refetch), fetched)
+        await flight_cache.asave_days(origin, destination, fetched, direct_only, currency)
+
+    all_flights = []
+    for day in days:
+        day_flights = fetched[day] if day in fetched else cached_days[day]
+        all_flights.extend(day_flights or [])
+    return all_flights
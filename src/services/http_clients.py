@@ -0,0 +1,77 @@
+import os
+import importlib.util
+from typing import Dict
+import httpx
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Апстримы, для каждого держим свой пул соединений
+TELEGRAM = "telegram"
+AVIASALES = "aviasales"
+AUTOCOMPLETE = "autocomplete"
+UPSTREAMS = (TELEGRAM, AVIASALES, AUTOCOMPLETE)
+
+HTTP_TIMEOUT = float(os.getenv("HTTP_TIMEOUT", 15))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", 20))  # на один хост
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", 10))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", 30))
+HTTP2_ENABLED = os.getenv("HTTP2_ENABLED", "false").lower() == "true"
+
+_clients: Dict[str, httpx.AsyncClient] = {}
+
+
+def _upstream_limit(upstream: str, name: str, default: int) -> int:
+    """Лимит для конкретного апстрима, например HTTP_MAX_CONNECTIONS_TELEGRAM"""
+    return int(os.getenv(f"{name}_{upstream.upper()}", default))
+
+
+def _http2_available() -> bool:
+    if not HTTP2_ENABLED:
+        return False
+    if importlib.util.find_spec("h2") is None:
+        print("[HTTP] HTTP2_ENABLED=true, но пакет h2 не установлен (pip install httpx[http2]), используем HTTP/1.1")
+        return False
+    return True
+
+
+def _create_client(upstream: str) -> httpx.AsyncClient:
+    limits = httpx.Limits(
+        max_connections=_upstream_limit(upstream, "HTTP_MAX_CONNECTIONS", HTTP_MAX_CONNECTIONS),
+        max_keepalive_connections=_upstream_limit(upstream, "HTTP_MAX_KEEPALIVE", HTTP_MAX_KEEPALIVE),
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    )
+    return httpx.AsyncClient(
+        limits=limits,
+        timeout=httpx.Timeout(HTTP_TIMEOUT),
+        http2=_http2_available(),
+    )
+
+
+async def init_http_clients():
+    """Создаёт пулы соединений. Вызывается при старте приложения."""
+    for upstream in UPSTREAMS:
+        if upstream not in _clients:
+            _clients[upstream] = _create_client(upstream)
+    print(f"[HTTP] Initialized connection pools: {', '.join(UPSTREAMS)}")
+
+
+async def close_http_clients():
+    """Закрывает пулы соединений. Вызывается при остановке приложения."""
+    clients = list(_clients.values())
+    _clients.clear()
+    for client in clients:
+        try:
+            await client.aclose()
+        except Exception as e:
+            print(f"[HTTP ERROR] Failed to close client: {e}")
+    print("[HTTP] Connection pools closed")
+
+
+def get_http_client(upstream: str) -> httpx.AsyncClient:
+    """Возвращает общий клиент для апстрима (создаёт лениво, если пулы ещё не инициализированы)"""
+    client = _clients.get(upstream)
+    if client is None:
+        client = _create_client(upstream)
+        _clients[upstream] = client
+    return client
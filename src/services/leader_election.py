@@ -0,0 +1,55 @@
+import os
+import socket
+import asyncio
+from typing import Awaitable, Callable, Optional
+from src.services.redis_lease import RedisLease
+from src.services.metrics import metrics
+
+LEADER_LEASE_TTL_MS = int(os.getenv("LEADER_LEASE_TTL_MS", 15000))
+
+
+class LeaderElection:
+    """Выборы лидера через аренду ключа в Redis.
+
+    Процесс, захвативший аренду, становится лидером (on_elected) и продлевает её каждую треть TTL.
+    Не смог продлить — сразу перестаёт быть лидером (on_demoted), чтобы не работать параллельно
+    с новым лидером. Если лидер умер, аренда истекает сама и её подхватывает другой процесс.
+    """
+
+    def __init__(self, key: str, on_elected: Callable[[], Awaitable[None]], on_demoted: Callable[[], Awaitable[None]],
+                 ttl_ms: int = LEADER_LEASE_TTL_MS, owner: Optional[str] = None):
+        self.lease = RedisLease(key, ttl_ms, owner or f"{socket.gethostname()}:{os.getpid()}")
+        self.on_elected = on_elected
+        self.on_demoted = on_demoted
+        self.is_leader = False
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Перестаёт участвовать в выборах и освобождает аренду, чтобы лидер сменился без ожидания TTL"""
+        self._stopping.set()
+        if self._task:
+            await self._task
+        if self.lease.is_held:
+            await self.lease.release()
+        self.is_leader = False
+        metrics.set_gauge("leader", 0, key=self.lease.key)
+
+    async def _run(self):
+        while not self._stopping.is_set():
+            held = await self.lease.acquire()
+            if held != self.is_leader:
+                self.is_leader = held
+                metrics.set_gauge("leader", int(held), key=self.lease.key)
+                print(f"[LEADER] {self.lease.owner} {'became leader' if held else 'lost leadership'} of {self.lease.key}")
+                try:
+                    await (self.on_elected() if held else self.on_demoted())
+                except Exception as e:
+                    print(f"[LEADER ERROR] Leadership callback failed: {e}")
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=self.lease.ttl_ms / 3000)
+            except asyncio.TimeoutError:
+                pass
@@ -0,0 +1,120 @@
+import os
+import time
+import asyncio
+from typing import Any, Dict, List, Optional, Set, Tuple
+from src.services.metrics import metrics
+from src.services.redis_client import async_redis_client, redis_client
+
+# Учёт вызовов LLM: токены (считаются локально через tiktoken), задержка, попадания в кэш.
+# Процессные счётчики — в /metrics, суточные агрегаты по (модель, endpoint) — в Redis
+# для отчёта scripts/llm_usage_report.py
+USAGE_KEY = "llm_usage:{}"
+USAGE_TTL = int(os.getenv("LLM_USAGE_TTL_DAYS", 30)) * 24 * 60 * 60
+USAGE_FIELDS = ("calls", "cache_hits", "errors", "prompt_tokens", "completion_tokens", "latency_ms")
+
+_encodings: Dict[str, Any] = {}
+# Токены статичных системных промптов считаются один раз на (модель, промпт)
+_static_tokens: Dict[Tuple[str, str], int] = {}
+# Незавершённые записи в Redis: ссылки держим, чтобы задачи не собрал сборщик мусора
+_pending_writes: Set[asyncio.Task] = set()
+
+
+def _encoding(model: str):
+    if model not in _encodings:
+        try:
+            import tiktoken
+            try:
+                _encodings[model] = tiktoken.encoding_for_model(model)
+            except KeyError:
+                _encodings[model] = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Нет словаря (например, без доступа в интернет) — считаем приблизительно
+            print(f"[LLM USAGE] tiktoken unavailable for {model}, using estimate: {e}")
+            _encodings[model] = None
+    return _encodings[model]
+
+
+async def aload_encoding(model: str):
+    """Загружает словарь tiktoken вне event loop: при первом обращении он может скачиваться из сети"""
+    if model not in _encodings:
+        await asyncio.to_thread(_encoding, model)
+    return _encodings[model]
+
+
+def count_tokens(text: str, model: str) -> int:
+    if not text:
+        return 0
+    encoding = _encoding(model)
+    if encoding is None:
+        return max(1, len(text) // 4)
+    return len(encoding.encode(text))
+
+
+def count_static_tokens(text: str, model: str) -> int:
+    """count_tokens с запоминанием — для неизменных текстов вроде системного промпта"""
+    key = (model, text)
+    if key not in _static_tokens:
+        _static_tokens[key] = count_tokens(text, model)
+    return _static_tokens[key]
+
+
+def _usage_fields(model: str, endpoint: str, values: Dict[str, float]) -> Dict[str, float]:
+    return {f"{model}|{endpoint}|{name}": value for name, value in values.items() if value}
+
+
+def _record_metrics(model: str, endpoint: str, status: str, prompt_tokens: int, completion_tokens: int, latency: float):
+    metrics.inc("llm_calls_total", model=model, endpoint=endpoint, status=status)
+    if prompt_tokens:
+        metrics.inc("llm_prompt_tokens_total", prompt_tokens, model=model, endpoint=endpoint)
+    if completion_tokens:
+        metrics.inc("llm_completion_tokens_total", completion_tokens, model=model, endpoint=endpoint)
+    if status != "cache_hit":
+        metrics.observe("llm_latency_seconds", latency, model=model, endpoint=endpoint)
+
+
+async def arecord_llm_call(model: str, endpoint: str, status: str, prompt: str = "", completion: str = "",
+                           latency: float = 0.0, system: Optional[str] = None):
+    """status: ok | timeout | error | cache_hit. system — статичный системный промпт, его токены
+    считаются один раз. Запись в Redis уходит в фоне и не задерживает ответ"""
+    prompt_tokens = completion_tokens = 0
+    if status != "cache_hit":
+        await aload_encoding(model)
+        prompt_tokens = count_tokens(prompt, model) + (count_static_tokens(system, model) if system else 0)
+        completion_tokens = count_tokens(completion, model)
+    _record_metrics(model, endpoint, status, prompt_tokens, completion_tokens, latency)
+    print(f"[LLM USAGE] {model} {endpoint} {status}: prompt={prompt_tokens} completion={completion_tokens} latency={latency:.2f}s")
+    fields = _usage_fields(model, endpoint, {
+        "calls": 1,
+        "cache_hits": 1 if status == "cache_hit" else 0,
+        "errors": 1 if status in ("timeout", "error") else 0,
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "latency_ms": int(latency * 1000),
+    })
+    task = asyncio.create_task(_astore_usage(USAGE_KEY.format(time.strftime("%Y-%m-%d")), fields))
+    _pending_writes.add(task)
+    task.add_done_callback(_pending_writes.discard)
+
+
+async def _astore_usage(key: str, fields: Dict[str, float]):
+    try:
+        async with async_redis_client.pipeline(transaction=False) as pipe:
+            for field, value in fields.items():
+                pipe.hincrby(key, field, value)
+            pipe.expire(key, USAGE_TTL)
+            await pipe.execute()
+    except Exception as e:
+        print(f"[LLM USAGE ERROR] Failed to store usage: {e}")
+
+
+def load_usage(days: List[str]) -> Dict[str, Dict[str, Dict[str, int]]]:
+    """Суточные агрегаты из Redis: {день: {"model|endpoint": {поле: значение}}}"""
+    result = {}
+    for day in days:
+        by_source: Dict[str, Dict[str, int]] = {}
+        for field, value in (redis_client.hgetall(USAGE_KEY.format(day)) or {}).items():
+            model, endpoint, name = field.rsplit("|", 2)
+            by_source.setdefault(f"{model}|{endpoint}", {})[name] = int(value)
+        result[day] = by_source
+    return result
+
@@ -0,0 +1,80 @@
+import threading
+from typing import Dict, Tuple
+
+LabelsKey = Tuple[Tuple[str, str], ...]
+
+
+def _labels_key(labels: Dict[str, object]) -> LabelsKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(labels: LabelsKey) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+class Metrics:
+    """Счётчики, гейджи и сводки (count/sum/max) процесса в формате Prometheus"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, Dict[LabelsKey, float]] = {}
+        self._gauges: Dict[str, Dict[LabelsKey, float]] = {}
+        self._summaries: Dict[str, Dict[LabelsKey, list]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges.setdefault(name, {})[_labels_key(labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _labels_key(labels)
+        with self._lock:
+            summary = self._summaries.setdefault(name, {}).setdefault(key, [0, 0.0, 0.0])
+            summary[0] += 1
+            summary[1] += value
+            summary[2] = max(summary[2], value)
+
+    def get(self, name: str, **labels) -> float:
+        with self._lock:
+            return self._counters.get(name, {}).get(_labels_key(labels), 0)
+
+    def snapshot(self) -> Dict[str, Dict[str, float]]:
+        """Все метрики словарём: {"name{labels}": value}"""
+        result = {}
+        with self._lock:
+            for name, series in list(self._counters.items()) + list(self._gauges.items()):
+                for labels, value in series.items():
+                    result[name + _format_labels(labels)] = value
+            for name, series in self._summaries.items():
+                for labels, (count, total, maximum) in series.items():
+                    result[f"{name}_count{_format_labels(labels)}"] = count
+                    result[f"{name}_sum{_format_labels(labels)}"] = total
+                    result[f"{name}_max{_format_labels(labels)}"] = maximum
+        return result
+
+    def render_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for kind, metrics in (("counter", self._counters), ("gauge", self._gauges)):
+                for name, series in sorted(metrics.items()):
+                    lines.append(f"# TYPE {name} {kind}")
+                    for labels, value in series.items():
+                        lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self._summaries.items()):
+                lines.append(f"# TYPE {name} summary")
+                for labels, (count, total, maximum) in series.items():
+                    lines.append(f"{name}_count{_format_labels(labels)} {count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+                    lines.append(f"{name}_max{_format_labels(labels)} {maximum}")
+        return "\n".join(lines) + "\n"
+
+
+# Глобальный реестр метрик процесса
+metrics = Metrics()
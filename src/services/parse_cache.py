@@ -1,103 +1,151 @@
+import re
 import json
 import hashlib
-from typing import Dict, Optional, Any
-from src.services.redis_client import redis_client
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Any, Tuple
+from src.services.cache_store import TrackedCache
+
+# Относительные даты подменяются конкретными, чтобы ключ не переживал смену дня
+RELATIVE_DAYS = {"сегодня": 0, "завтра": 1, "послезавтра": 2}
+# Слова, смысл которых зависит от текущей даты ("в пятницу", "на выходных", "через неделю"):
+# запрос с ними кэшируется только до конца дня
+_RELATIVE_WORD_RE = re.compile(
+    r"^(понедельник|вторник|сред[аеуы]|четверг|пятниц|суббот|воскресень|выходн|недел|месяц|через$)"
+)
+_PUNCT_RE = re.compile(r"[^\w\s-]")
+_LOOSE_HYPHEN_RE = re.compile(r"(?<!\w)-|-(?!\w)")
+
+def normalize_query(text: str, today: Optional[datetime] = None) -> Tuple[str, bool]:
+    """Нормализует текст запроса: регистр, пунктуация, пробелы, "завтра" -> дата.
+    Возвращает (текст, есть ли в нём относительные даты, включая дни недели и выходные)"""
+    today = today or datetime.now()
+    text = _LOOSE_HYPHEN_RE.sub(" ", _PUNCT_RE.sub(" ", text.lower().replace("ё", "е")))
+    words, relative = [], False
+    for word in text.split():
+        if word in RELATIVE_DAYS:
+            word = (today + timedelta(days=RELATIVE_DAYS[word])).strftime("%Y-%m-%d")
+            relative = True
+        elif _RELATIVE_WORD_RE.match(word):
+            relative = True
+        words.append(word)
+    return " ".join(words), relative
+
+def build_cache_query(user_text: str, context: str = "", today: Optional[datetime] = None) -> Tuple[str, bool]:
+    """Строка для ключа кэша: нормализованное сообщение + хэш контекста (состояния диалога).
+    Первые сообщения разных пользователей ("Москва Сочи") с пустым состоянием попадают в одну запись"""
+    text, relative = normalize_query(user_text, today)
+    context, context_relative = normalize_query(context, today)
+    context_hash = hashlib.md5(context.encode("utf-8")).hexdigest()[:12]
+    return f"{text}|{context_hash}", relative or context_relative
+
+def seconds_until_midnight(now: Optional[datetime] = None) -> int:
+    """TTL для записей с относительными датами: до начала следующего дня"""
+    now = now or datetime.now()
+    midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(int((midnight - now).total_seconds()), 1)
 
 class ParseCacheTool:
     """Кэш для результатов парсинга параметров в Redis"""
-    
+
     CACHE_TTL = 60 * 60 * 24  # 24 часа
     CACHE_PREFIX = "parse_cache:"
-    
+
     def __init__(self):
         self.name = "ParseCacheTool"
         self.description = "Кэширует результаты парсинга параметров в Redis."
-    
+        self._store = TrackedCache("parse", self.CACHE_PREFIX)
+
     def _generate_key(self, query: str) -> str:
         """Генерирует ключ кэша на основе запроса"""
         hash_obj = hashlib.md5(query.encode('utf-8'))
         return f"{self.CACHE_PREFIX}{hash_obj.hexdigest()}"
-    
+
+    @staticmethod
+    def _decode(cached_data) -> Optional[Dict[str, Any]]:
+        if cached_data:
+            if isinstance(cached_data, bytes):
+                return json.loads(cached_data.decode('utf-8'))
+            elif isinstance(cached_data, str):
+                return json.loads(cached_data)
+        return None
+
     def get(self, query: str) -> Optional[Dict[str, Any]]:
         """Получает кэшированные параметры"""
         try:
             key = self._generate_key(query)
-            cached_data = redis_client.get(key)
-            
-            if cached_data:
-                if isinstance(cached_data, bytes):
-                    return json.loads(cached_data.decode('utf-8'))
-                elif isinstance(cached_data, str):
-                    return json.loads(cached_data)
-            
+            return self._decode(self._store.get_many([key])[0])
+        except Exception as e:
+            print(f"[PARSE CACHE ERROR] Failed to get cached params: {e}")
             return None
+
+    async def aget(self, query: str) -> Optional[Dict[str, Any]]:
+        """Асинхронный вариант get"""
+        try:
+            key = self._generate_key(query)
+            return self._decode((await self._store.aget_many([key]))[0])
         except Exception as e:
             print(f"[PARSE CACHE ERROR] Failed to get cached params: {e}")
             return None
-    
-    def save(self, query: str, params: Dict[str, Any]) -> bool:
+
+    def save(self, query: str, params: Dict[str, Any], ttl: Optional[int] = None) -> bool:
         """Сохраняет параметры в кэш"""
         try:
             key = self._generate_key(query)
             params_json = json.dumps(params, ensure_ascii=False)
-            
-            redis_client.setex(key, self.CACHE_TTL, params_json)
+
+            self._store.set_many({key: params_json}, ttl or self.CACHE_TTL)
+            print(f"[PARSE CACHE] Saved params for query: {query[:30]}...")
+            return True
+        except Exception as e:
+            print(f"[PARSE CACHE ERROR] Failed to save params: {e}")
+            return False
+
+    async def asave(self, query: str, params: Dict[str, Any], ttl: Optional[int] = None) -> bool:
+        """Асинхронный вариант save"""
+        try:
+            key = self._generate_key(query)
+            await self._store.aset_many({key: json.dumps(params, ensure_ascii=False)}, ttl or self.CACHE_TTL)
             print(f"[PARSE CACHE] Saved params for query: {query[:30]}...")
             return True
         except Exception as e:
             print(f"[PARSE CACHE ERROR] Failed to save params: {e}")
             return False
-    
+
     def clear(self, query: str) -> bool:
         """Очищает кэш для конкретного запроса"""
         try:
             key = self._generate_key(query)
-            redis_client.delete(key)
+            self._store.delete([key])
             print(f"[PARSE CACHE] Cleared cache for query: {query[:30]}...")
             return True
         except Exception as e:
             print(f"[PARSE CACHE ERROR] Failed to clear cache: {e}")
             return False
-    
+
     def clear_all(self) -> bool:
         """Очищает весь кэш парсинга"""
         try:
-            pattern = f"{self.CACHE_PREFIX}*"
-            keys = redis_client.keys(pattern)
-            
-            if keys:
-                redis_client.delete(*keys)
-                print(f"[PARSE CACHE] Cleared {len(keys)} cached parse entries")
+            removed = self._store.clear()
+            if removed:
+                print(f"[PARSE CACHE] Cleared {removed} cached parse entries")
             else:
                 print("[PARSE CACHE] No cached parse entries found")
-            
+
             return True
         except Exception as e:
             print(f"[PARSE CACHE ERROR] Failed to clear all cache: {e}")
             return False
-    
+
     def get_stats(self) -> Dict[str, Any]:
-        """Получает статистику кэша"""
+        """Получает статистику кэша (счётчики ведутся при записи, без обхода ключей)"""
         try:
-            pattern = f"{self.CACHE_PREFIX}*"
-            keys = redis_client.keys(pattern)
-            
-            total_size = 0
-            for key in keys:
-                size = redis_client.memory_usage(key)
-                if size:
-                    total_size += size
-            
-            return {
-                "total_entries": len(keys),
-                "total_size_bytes": total_size,
-                "cache_prefix": self.CACHE_PREFIX,
-                "ttl_seconds": self.CACHE_TTL
-            }
+            stats = self._store.stats()
+            stats.update({"cache_prefix": self.CACHE_PREFIX, "ttl_seconds": self.CACHE_TTL})
+            return stats
         except Exception as e:
             print(f"[PARSE CACHE ERROR] Failed to get stats: {e}")
             return {"error": str(e)}
-    
+
     def __call__(self, query: str) -> Optional[Dict[str, Any]]:
         """Совместимость с интерфейсом агента"""
         return self.get(query)
@@ -0,0 +1,56 @@
+import os
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+# Когда проверять подписку в следующий раз: чем ближе вылет и чем чаще меняется цена, тем чаще.
+# Интервалы по дням до вылета: (не больше дней, минут между проверками)
+CHECK_INTERVALS = [(3, 30), (14, 60), (60, 180), (None, 720)]
+CHECK_MIN_MINUTES = int(os.getenv("PRICE_CHECK_MIN_MINUTES", 15))
+CHECK_MAX_MINUTES = int(os.getenv("PRICE_CHECK_MAX_MINUTES", 24 * 60))
+VOLATILITY_ALPHA = 0.3          # вес последнего изменения в скользящей волатильности
+VOLATILE_THRESHOLD = 0.05       # средние изменения цены больше 5% — проверяем вдвое чаще
+STABLE_AFTER = timedelta(days=7)  # цена не менялась неделю — проверяем вдвое реже
+
+
+def base_interval(departure: date, today: date) -> timedelta:
+    days_left = (departure - today).days
+    for max_days, minutes in CHECK_INTERVALS:
+        if max_days is None or days_left <= max_days:
+            return timedelta(minutes=minutes)
+    return timedelta(minutes=CHECK_INTERVALS[-1][1])
+
+
+def update_volatility(volatility: float, last_price: Optional[int], seen_price: Optional[int]) -> float:
+    """Экспоненциально сглаженное относительное изменение цены между проверками"""
+    if not last_price or seen_price is None:
+        return volatility
+    change = abs(seen_price - last_price) / last_price
+    return (1 - VOLATILITY_ALPHA) * volatility + VOLATILITY_ALPHA * change
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    try:
+        return datetime.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def next_check(flight: Dict[str, Any], seen_price: Optional[int], now: datetime) -> Tuple[str, float, Optional[str]]:
+    """(next_check_at, volatility, last_changed_at) для подписки после проверки с ценой seen_price"""
+    last_price = flight.get("last_seen_price")
+    volatility = update_volatility(flight.get("volatility") or 0.0, last_price, seen_price)
+    last_changed_at = flight.get("last_changed_at")
+    if seen_price is not None and last_price is not None and seen_price != last_price:
+        last_changed_at = now.isoformat()
+
+    try:
+        interval = base_interval(date.fromisoformat(flight["date"][:10]), now.date())
+    except ValueError:
+        interval = timedelta(minutes=CHECK_INTERVALS[-1][1])
+    if volatility > VOLATILE_THRESHOLD:
+        interval /= 2
+    changed = _parse_time(last_changed_at) or _parse_time(flight.get("created_at"))
+    if changed and now - changed > STABLE_AFTER:
+        interval *= 2
+    interval = min(max(interval, timedelta(minutes=CHECK_MIN_MINUTES)), timedelta(minutes=CHECK_MAX_MINUTES))
+    return (now + interval).isoformat(timespec="seconds"), volatility, last_changed_at
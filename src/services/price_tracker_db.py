@@ -1,21 +1,116 @@
+import re
 import sqlite3
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Tuple
 from datetime import datetime
 import threading
 import os
+from dotenv import load_dotenv
 
-DB_PATH = 'tracked_flights.db'
+load_dotenv()
+DB_PATH = os.getenv('TRACKED_FLIGHTS_DB', 'tracked_flights.db')
 
+# WAL: читатели не ждут писателя и друг друга; synchronous=NORMAL в WAL не теряет целостность,
+# а fsync делается на checkpoint, а не на каждый commit
+DB_PRAGMAS = (
+    "PRAGMA busy_timeout=5000",  # первым: переключение в WAL тоже может ждать другой процесс
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-16000",
+    "PRAGMA temp_store=MEMORY",
+)
+# Соединения живут всё время процесса, поэтому скомпилированные запросы берутся из кэша sqlite3
+DB_CACHED_STATEMENTS = 256
+
+# Запись идёт через одно общее соединение под замком, чтение — через соединение своего потока
 _db_lock = threading.Lock()
+_writer: Optional[sqlite3.Connection] = None
+_readers = threading.local()
 
 def get_db_connection():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, cached_statements=DB_CACHED_STATEMENTS)
     conn.row_factory = sqlite3.Row
+    for pragma in DB_PRAGMAS:
+        conn.execute(pragma)
     return conn
 
+def _write_conn() -> sqlite3.Connection:
+    """Общее соединение для записи; вызывать под _db_lock"""
+    global _writer
+    if _writer is None:
+        _writer = get_db_connection()
+    return _writer
+
+def _read_conn() -> sqlite3.Connection:
+    conn = getattr(_readers, "conn", None)
+    if conn is None:
+        conn = get_db_connection()
+        conn.execute("PRAGMA query_only=ON")
+        _readers.conn = conn
+    return conn
+
+def close_db():
+    """Закрывает соединение записи и соединение чтения текущего потока"""
+    global _writer
+    with _db_lock:
+        if _writer is not None:
+            _writer.close()
+            _writer = None
+    conn = getattr(_readers, "conn", None)
+    if conn is not None:
+        conn.close()
+        _readers.conn = None
+
+# Миграции схемы по порядку; номер применённой хранится в PRAGMA user_version
+MIGRATIONS = [
+    # 1: очередь проверок по времени (next_check_at) и данные для адаптивного интервала
+    [
+        "ALTER TABLE tracked_flights ADD COLUMN next_check_at TEXT",
+        "ALTER TABLE tracked_flights ADD COLUMN last_checked_at TEXT",
+        "ALTER TABLE tracked_flights ADD COLUMN last_seen_price INTEGER",
+        "ALTER TABLE tracked_flights ADD COLUMN last_changed_at TEXT",
+        "ALTER TABLE tracked_flights ADD COLUMN volatility REAL NOT NULL DEFAULT 0",
+        "CREATE INDEX IF NOT EXISTS idx_tracked_flights_next_check ON tracked_flights(next_check_at)",
+    ],
+    # 2: поиск подписок чата и конкретного рейса (find_flight, удаление) без полного прохода по таблице;
+    # префикс (chat_id) обслуживает выборки по чату
+    [
+        "CREATE INDEX IF NOT EXISTS idx_tracked_flights_chat_flight ON tracked_flights(chat_id, flight_number, date)",
+    ],
+]
+
+_ADD_COLUMN_RE = re.compile(r"ALTER TABLE (\w+) ADD COLUMN (\w+)", re.IGNORECASE)
+
+def migrate(conn):
+    """Применяет миграции по одной, каждую в BEGIN IMMEDIATE.
+
+    Процессы (uvicorn --workers, воркеры трекера) стартуют одновременно: версия перечитывается
+    под блокировкой записи, поэтому миграцию применяет только один из них. Уже существующие
+    колонки пропускаются, чтобы база, прерванная посреди старой неатомарной миграции, тоже доводилась.
+    """
+    while True:
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            if version >= len(MIGRATIONS):
+                conn.rollback()
+                return
+            for statement in MIGRATIONS[version]:
+                match = _ADD_COLUMN_RE.match(statement)
+                if match:
+                    columns = {row[1] for row in conn.execute(f'PRAGMA table_info({match.group(1)})')}
+                    if match.group(2) in columns:
+                        continue
+                conn.execute(statement)
+            conn.execute(f'PRAGMA user_version = {version + 1}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        print(f"[DB] Applied migration {version + 1}")
+
 def init_db():
     with _db_lock:
-        conn = get_db_connection()
+        conn = _write_conn()
         cursor = conn.cursor()
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS tracked_flights (
@@ -34,90 +129,132 @@ def init_db():
             )
         ''')
         conn.commit()
-        conn.close()
+        migrate(conn)
 
 def add_tracked_flights(chat_id: int, flights: List[Dict[str, Any]]):
+    """Все рейсы одной вставкой в одной транзакции"""
     now = datetime.utcnow().isoformat()
     print(f"[SUBSCRIBE] Добавление новых рейсов в подписку для chat_id={chat_id}: {len(flights)} рейсов")
+    rows = []
+    for flight in flights:
+        print(f"[SUBSCRIBE] {flight}")
+        rows.append((
+            chat_id,
+            flight.get('from_city'),
+            flight.get('to_city'),
+            flight.get('date'),
+            flight.get('flight_number'),
+            flight.get('airline'),
+            flight.get('departure_time'),
+            flight.get('arrival_time'),
+            flight.get('transfers'),
+            flight.get('current_price'),
+            now
+        ))
     with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        for flight in flights:
-            print(f"[SUBSCRIBE] {flight}")
-            cursor.execute('''
+        conn = _write_conn()
+        with conn:
+            conn.executemany('''
                 INSERT INTO tracked_flights (
                     chat_id, from_city, to_city, date, flight_number, airline, departure_time, arrival_time, transfers, current_price, created_at
                 ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                chat_id,
-                flight.get('from_city'),
-                flight.get('to_city'),
-                flight.get('date'),
-                flight.get('flight_number'),
-                flight.get('airline'),
-                flight.get('departure_time'),
-                flight.get('arrival_time'),
-                flight.get('transfers'),
-                flight.get('current_price'),
-                now
-            ))
-        conn.commit()
-        conn.close()
+            ''', rows)
 
 def get_tracked_flights() -> List[Dict[str, Any]]:
+    cursor = _read_conn().cursor()
+    cursor.execute('SELECT * FROM tracked_flights')
+    rows = cursor.fetchall()
+    return [dict(row) for row in rows]
+
+def get_due_tracked_flights(now: str, today: str) -> List[Dict[str, Any]]:
+    """Подписки, которым пора проверяться (next_check_at <= now); улетевшие не проверяются.
+    Новые подписки (next_check_at ещё не назначен) — сразу"""
+    cursor = _read_conn().cursor()
+    cursor.execute('''
+        SELECT * FROM tracked_flights
+        WHERE (next_check_at IS NULL OR next_check_at <= ?) AND substr(date, 1, 10) >= ?
+        ORDER BY next_check_at
+    ''', (now, today))
+    rows = cursor.fetchall()
+    return [dict(row) for row in rows]
+
+def get_still_due_tracked_flights(ids: Sequence[int], now: str) -> List[Dict[str, Any]]:
+    """Подписки из ids, которым всё ещё пора проверяться. Список подписок читается в начале
+    запуска, и за это время другой воркер мог проверить и перенести часть из них"""
+    if not ids:
+        return []
+    cursor = _read_conn().cursor()
+    cursor.execute(f'''
+        SELECT * FROM tracked_flights
+        WHERE id IN ({", ".join("?" * len(ids))}) AND (next_check_at IS NULL OR next_check_at <= ?)
+    ''', (*ids, now))
+    return [dict(row) for row in cursor.fetchall()]
+
+# Результат проверки: (flight_id, checked_at, next_check_at, seen_price, volatility, last_changed_at)
+RescheduleRow = Tuple[int, str, str, Optional[int], float, Optional[str]]
+
+_RESCHEDULE_SQL = '''
+    UPDATE tracked_flights
+    SET last_checked_at = ?, next_check_at = ?, last_seen_price = COALESCE(?, last_seen_price),
+        volatility = ?, last_changed_at = ?
+    WHERE id = ?
+'''
+_UPDATE_PRICE_SQL = 'UPDATE tracked_flights SET current_price = ? WHERE id = ?'
+
+def _reschedule_params(rows: Sequence[RescheduleRow]):
+    return [(checked_at, next_check_at, seen_price, volatility, last_changed_at, flight_id)
+            for flight_id, checked_at, next_check_at, seen_price, volatility, last_changed_at in rows]
+
+def save_check_results(price_updates: Sequence[Tuple[int, int]], reschedules: Sequence[RescheduleRow]):
+    """Новые цены (flight_id, price) и расписание проверок за запуск планировщика — одной транзакцией"""
+    if not price_updates and not reschedules:
+        return
     with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tracked_flights')
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        conn = _write_conn()
+        with conn:
+            if price_updates:
+                conn.executemany(_UPDATE_PRICE_SQL, [(price, flight_id) for flight_id, price in price_updates])
+            if reschedules:
+                conn.executemany(_RESCHEDULE_SQL, _reschedule_params(reschedules))
 
 def get_tracked_flights_for_chat(chat_id: int) -> List[Dict[str, Any]]:
-    with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('SELECT * FROM tracked_flights WHERE chat_id = ?', (chat_id,))
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+    cursor = _read_conn().cursor()
+    cursor.execute('SELECT * FROM tracked_flights WHERE chat_id = ?', (chat_id,))
+    rows = cursor.fetchall()
+    return [dict(row) for row in rows]
 
 def update_flight_price(flight_id: int, new_price: int):
-    with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('UPDATE tracked_flights SET current_price = ? WHERE id = ?', (new_price, flight_id))
-        conn.commit()
-        conn.close()
+    save_check_results([(flight_id, new_price)], [])
 
 def find_flight(chat_id: int, flight_number: str, date: str) -> Optional[Dict[str, Any]]:
+    cursor = _read_conn().cursor()
+    cursor.execute('''
+        SELECT * FROM tracked_flights WHERE chat_id = ? AND flight_number = ? AND date = ?
+    ''', (chat_id, flight_number, date))
+    row = cursor.fetchone()
+    return dict(row) if row else None
+
+def delete_tracked_flights(chat_id: int, keys: Sequence[Tuple[str, str]]) -> int:
+    """Удаляет подписки чата по списку (flight_number, date) одной транзакцией, возвращает число удалённых"""
+    if not keys:
+        return 0
     with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            SELECT * FROM tracked_flights WHERE chat_id = ? AND flight_number = ? AND date = ?
-        ''', (chat_id, flight_number, date))
-        row = cursor.fetchone()
-        conn.close()
-        return dict(row) if row else None
+        conn = _write_conn()
+        with conn:
+            cursor = conn.executemany('''
+                DELETE FROM tracked_flights WHERE chat_id = ? AND flight_number = ? AND date = ?
+            ''', [(chat_id, flight_number, date) for flight_number, date in keys])
+            return cursor.rowcount
 
 def delete_tracked_flight(chat_id: int, flight_number: str, date: str):
-    with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('''
-            DELETE FROM tracked_flights WHERE chat_id = ? AND flight_number = ? AND date = ?
-        ''', (chat_id, flight_number, date))
-        conn.commit()
-        conn.close()
+    delete_tracked_flights(chat_id, [(flight_number, date)])
 
 def delete_all_tracked_flights(chat_id: int):
     with _db_lock:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute('DELETE FROM tracked_flights WHERE chat_id = ?', (chat_id,))
-        conn.commit()
-        conn.close()
+        conn = _write_conn()
+        with conn:
+            cursor = conn.cursor()
+            cursor.execute('DELETE FROM tracked_flights WHERE chat_id = ?', (chat_id,))
 
 # Инициализация БД при импорте
 init_db() 
\ No newline at end of file
@@ -1,180 +1,376 @@
 import os
 from dotenv import load_dotenv
 load_dotenv()
-from apscheduler.schedulers.background import BackgroundScheduler
-from src.services.price_tracker_db import get_tracked_flights, update_flight_price
-from src.services.redis_client import redis_client
-import httpx
+from apscheduler.schedulers.asyncio import AsyncIOScheduler
+from src.services.price_tracker_db import get_due_tracked_flights, get_still_due_tracked_flights, save_check_results
+from src.services.price_check_policy import next_check
 import time
-import json
 import asyncio
 import traceback
-import inspect
-import tracemalloc
-from src.core.bot import get_unsubscribe_buttons
+from datetime import date as date_type, datetime
+from typing import Any, Dict, List, Optional, Set, Tuple
+from src.services.aviasales_api import execute_plan, is_direct_only, aviasales_limiter, AVIASALES_MAX_RETRIES
+from src.services.metrics import metrics
+from src.services.profiling import profiler
+from src.services.query_planner import PlannedQuery, plan_days
+from src.core.bot import get_unsubscribe_buttons, send_message
+from src.services.telegram_outbox import PRIORITY_NOTIFICATION
+from src.services.scheduler_checkpoint import RunCheckpoint
+from src.services.tracker_partition import RoutePartition
+from src.services.leader_election import LeaderElection
 
-TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
-TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+# Сколько маршрутов проверяется одновременно; общий темп запросов ограничивает aviasales_limiter
+SCHEDULER_CONCURRENCY = int(os.getenv("SCHEDULER_CONCURRENCY", 16))
+# Как часто забирать из очереди подписки, которым подошло время проверки (их интервалы адаптивные)
+SCHEDULER_INTERVAL_MINUTES = int(os.getenv("SCHEDULER_INTERVAL_MINUTES", 5))
+# Сколько при остановке ждать текущий запуск; недоделанный продолжится с чекпоинта
+SCHEDULER_STOP_TIMEOUT = float(os.getenv("SCHEDULER_STOP_TIMEOUT", 30))
+# Результаты проверок пишутся в БД пачками: одна транзакция на столько подписок (и в конце запуска)
+SCHEDULER_FLUSH_SIZE = int(os.getenv("SCHEDULER_FLUSH_SIZE", 1000))
+# Аренда лидера среди процессов веб-приложения: планировщик работает только у её владельца
+SCHEDULER_LEADER_KEY = "price_tracker:leader"
 
-CACHE_TTL = 60 * 25  # 25 минут
+# Одновременно идёт не больше одного запуска: медленный запуск не накладывается на следующий
+_run_lock = asyncio.Lock()
+_current_run: Optional[asyncio.Task] = None
 
-def get_price_cache_key(from_city, to_city, date, flight_number):
-    return f"price_check:{from_city}:{to_city}:{date}:{flight_number}"
+def subscription_route(flight: Dict[str, Any]) -> Tuple[str, str, bool]:
+    """Маршрут подписки: (откуда, куда, только прямые). Подписки одного маршрута проверяются одним набором запросов"""
+    return flight["from_city"].upper(), flight["to_city"].upper(), is_direct_only(flight.get("transfers"))
 
-async def check_and_notify_price_drop():
-    flights = get_tracked_flights()
-    print(f"[SCHEDULER] Found {len(flights)} tracked flights")
+def group_subscriptions(flights: List[Dict[str, Any]]) -> Dict[Tuple[str, str, bool], Dict[str, List[Dict[str, Any]]]]:
+    """{маршрут: {дата: [подписки]}}"""
+    groups: Dict[Tuple[str, str, bool], Dict[str, List[Dict[str, Any]]]] = {}
     for flight in flights:
-        chat_id = flight["chat_id"]
-        flight_number = flight["flight_number"]
-        date = flight["date"]
-        from_city = flight["from_city"]
-        to_city = flight["to_city"]
-        old_price = flight["current_price"]
-        subscribed_transfers = flight.get("transfers", None)
-        print(f"[SCHEDULER] Checking flight: {from_city}->{to_city} {date} {flight_number}, old_price={old_price}, transfers={subscribed_transfers}")
-        cache_key = get_price_cache_key(from_city, to_city, date, flight_number)
-        new_price = None
-        found_transfers = None
-        fresh_link = None
-        # Проверяем кэш в Redis
-        cached = redis_client.get(cache_key)
-        if cached:
-            print(f"[CACHE HIT] {cache_key}")
-            try:
-                if isinstance(cached, (str, bytes)):
-                    data = json.loads(cached)
-                    new_price = data.get("price")
-                    found_transfers = data.get("transfers")
-                    print(f"[CACHE] Retrieved price: {new_price}, transfers: {found_transfers}")
-                else:
-                    print(f"[CACHE ERROR] cached is not str/bytes: {type(cached)}")
-                    new_price = None
-            except Exception as e:
-                print(f"[CACHE ERROR] Failed to parse cached data: {e}")
-                new_price = None
+        groups.setdefault(subscription_route(flight), {}).setdefault(flight["date"], []).append(flight)
+    return groups
+
+def refresh_subscriptions(subscriptions_by_date: Dict[str, List[Dict[str, Any]]], cutoff: str) -> Dict[str, List[Dict[str, Any]]]:
+    """Перечитывает подписки маршрута после его захвата: уже проверенные другим воркером
+    (с новым next_check_at и current_price) отбрасываются, остальные берутся в свежем виде"""
+    ids = [flight["id"] for subscriptions in subscriptions_by_date.values() for flight in subscriptions]
+    fresh: Dict[str, List[Dict[str, Any]]] = {}
+    for flight in get_still_due_tracked_flights(ids, cutoff):
+        fresh.setdefault(flight["date"], []).append(flight)
+    return fresh
+
+def route_key(route: Tuple[str, str, bool]) -> str:
+    origin, destination, direct_only = route
+    return f"{origin}-{destination}:{'direct' if direct_only else 'any'}"
+
+def plan_route_dates(dates: List[str]) -> List[PlannedQuery]:
+    """Запросы на все даты маршрута: близкие даты одного месяца — одним месячным запросом"""
+    days, other = [], []
+    for value in dates:
+        try:
+            days.append(date_type.fromisoformat(value))
+        except ValueError:
+            other.append(PlannedQuery(value))
+    return plan_days(days) + other
+
+def _query_dates(query: PlannedQuery, dates: Set[str]) -> Set[str]:
+    """Даты подписок, которые покрывает запрос"""
+    if query.start and query.end:
+        return {d for d in dates if query.start <= d <= query.end}
+    return {query.departure_at} & dates
+
+async def fetch_route_prices(origin: str, destination: str, direct_only: bool, dates: List[str]) -> Tuple[Dict[str, List[Dict]], Set[str]]:
+    """Рейсы маршрута по датам вылета (в порядке цены внутри каждого запроса) и даты, цены на которые узнать не удалось.
+
+    Месячный запрос, упёршийся в limit, вернул только самые дешёвые рейсы месяца: пустые в нём
+    даты подписок перезапрашиваются по дням. Даты упавших запросов возвращаются как неизвестные
+    """
+    plan = plan_route_dates(dates)
+    options = dict(currency="rub", transfers=0 if direct_only else "any", limiter=aviasales_limiter, max_retries=AVIASALES_MAX_RETRIES)
+    wanted = set(dates)
+    by_day: Dict[str, List[Dict]] = {}
+    unknown: Set[str] = set()
+    refetch: Set[str] = set()
+    for result in await execute_plan(origin, destination, plan, **options):
+        for f in result.flights:
+            by_day.setdefault((f.get("departure_at") or "")[:10], []).append(f)
+        if not result.ok:
+            unknown |= _query_dates(result.query, wanted)
+        elif result.query.is_month and not result.complete:
+            refetch |= {d for d in _query_dates(result.query, wanted) if d not in by_day}
+    day_plan = [PlannedQuery(d, d, d) for d in sorted(refetch)]
+    if day_plan:
+        metrics.inc("scheduler_truncated_month_refetch_total", len(day_plan))
+        for result in await execute_plan(origin, destination, day_plan, **options):
+            for f in result.flights:
+                by_day.setdefault((f.get("departure_at") or "")[:10], []).append(f)
+            if not result.ok:
+                unknown.add(result.query.start)
+    print(f"[SCHEDULER] {origin}->{destination} direct={direct_only}: {len(dates)} dates, {len(plan) + len(day_plan)} Aviasales requests, {len(unknown)} dates unknown")
+    return by_day, unknown
+
+def match_flight(day_flights: List[Dict], flight_number: str) -> Optional[Dict]:
+    """Сначала точное совпадение по номеру рейса, иначе первый (самый дешёвый) рейс на эту дату"""
+    for f in day_flights:
+        if f.get("flight_number") == flight_number or not flight_number:
+            return f
+    return day_flights[0] if day_flights else None
+
+class CheckResults:
+    """Новые цены и расписание проверок за запуск, записываемые в БД пачками.
+
+    Маршрут отмечается в чекпоинте (и его захват освобождается) только после записи его результатов,
+    иначе после сбоя продолжение запуска пропустило бы маршрут с несохранёнными ценами.
+    """
+
+    def __init__(self, checkpoint: RunCheckpoint, partition: Optional[RoutePartition] = None, flush_size: int = SCHEDULER_FLUSH_SIZE):
+        self.checkpoint = checkpoint
+        self.partition = partition
+        self.flush_size = flush_size
+        self.prices: List[Tuple[int, int]] = []
+        self.reschedules: List[Tuple] = []
+        self.routes: List[str] = []
+        self.flushes = 0
+        self._lock = asyncio.Lock()
+
+    def add_price(self, flight_id: int, price: int):
+        self.prices.append((flight_id, price))
+
+    def add_reschedule(self, row: Tuple):
+        self.reschedules.append(row)
+
+    async def route_done(self, key: str):
+        self.routes.append(key)
+        if len(self.reschedules) >= self.flush_size:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            prices, reschedules, routes = self.prices, self.reschedules, self.routes
+            self.prices, self.reschedules, self.routes = [], [], []
+            if prices or reschedules:
+                save_check_results(prices, reschedules)
+                self.flushes += 1
+                metrics.inc("scheduler_db_flushes_total")
+                print(f"[SCHEDULER] Saved {len(prices)} price updates and {len(reschedules)} next checks for {len(routes)} routes")
+            await self.checkpoint.mark_done(*routes)
+            if self.partition is not None:
+                for key in routes:
+                    await self.partition.release(key)
+
+async def notify_if_cheaper(flight: Dict[str, Any], found: Optional[Dict], results: CheckResults):
+    chat_id = flight["chat_id"]
+    date = flight["date"]
+    from_city = flight["from_city"]
+    to_city = flight["to_city"]
+    old_price = flight["current_price"]
+    subscribed_transfers = flight.get("transfers", None)
+    new_price = found.get("price") if found else None
+    found_transfers = found.get("transfers", None) if found else None
+    fresh_link = found.get("link", None) if found else None
+    print(f"[SCHEDULER] {from_city}->{to_city} {date} {flight['flight_number']}: new_price={new_price}, old_price={old_price}, found_transfers={found_transfers}")
+    # --- БАГФИКС: Проверка на пересадки ---
+    if subscribed_transfers == 0 and (found_transfers is None or found_transfers > 0):
+        print(f"[SCHEDULER] Skipping notification: user subscribed to direct flights only, but found flight has stopovers.")
+        return
+    if new_price is not None and new_price < old_price:
+        print(f"[SCHEDULER] Price drop detected! Sending notification to chat_id={chat_id}")
+        results.add_price(flight["id"], new_price)
+        airline = flight.get("airline", "-")
+        depart = flight.get("departure_time", "-")[:10] if flight.get("departure_time") else date
+        origin_airport = flight.get("from_city", from_city)
+        dest_airport = flight.get("to_city", to_city)
+        transfers_count = found_transfers if found_transfers is not None else flight.get("transfers", 0)
+        # --- Всегда используем свежую ссылку, если она есть ---
+        link = fresh_link or ""
+        aviasales_url = f"https://www.aviasales.com{link}" if link else None
+        formatted_price = f"{new_price:,}".replace(",", " ")
+        formatted_old_price = f"{old_price:,}".replace(",", " ")
+        # Цена как гиперссылка, если есть ссылка
+        if aviasales_url:
+            price_md = f"[{formatted_price} RUB]({aviasales_url})"
         else:
-            print(f"[CACHE MISS] {cache_key}")
-            url = "https://api.travelpayouts.com/aviasales/v3/prices_for_dates"
-            token = os.getenv("AVIASALES_TOKEN")
-            params = {
-                "origin": from_city,
-                "destination": to_city,
-                "departure_at": date,
-                "one_way": "true",
-                "currency": "rub",
-                "token": token,
-                "limit": 5,
-                "sorting": "price"
-            }
-            print(f"[DEBUG] Aviasales request: url={url}, params={{...}}")
+            price_md = f"{formatted_price} RUB (ссылка не найдена)"
+        flight_card = f"{origin_airport} - {dest_airport} от {price_md}\n- Дата вылета: {depart}\n- {airline}, {transfers_count} пересадки"
+        text = f"🔥 Новый билет по вашей подписке! Цены стали ниже.\n\n{flight_card}\n\n💰 {formatted_price} руб. (было {formatted_old_price} руб.)"
+        print(f"[SCHEDULER] Sending message: {text[:100]}...")
+        await send_message(chat_id, text, reply_markup=get_unsubscribe_buttons(), priority=PRIORITY_NOTIFICATION)
+        print(f"[SCHEDULER] Message queued for chat_id={chat_id}")
+    else:
+        print(f"[SCHEDULER] No price drop for this flight")
+
+async def check_route(route: Tuple[str, str, bool], subscriptions_by_date: Dict[str, List[Dict[str, Any]]], results: CheckResults):
+    """Один набор запросов к Aviasales на маршрут, затем сравнение для каждого подписчика"""
+    origin, destination, direct_only = route
+    prices_by_day, unknown_dates = await fetch_route_prices(origin, destination, direct_only, list(subscriptions_by_date))
+    for date, subscriptions in subscriptions_by_date.items():
+        if date in unknown_dates:
+            # Цены на дату неизвестны: не трогаем подписки, они остаются в очереди до следующего запуска
+            continue
+        day_flights = prices_by_day.get(date, [])
+        for flight in subscriptions:
+            found = match_flight(day_flights, flight["flight_number"])
+            await notify_if_cheaper(flight, found, results)
+            schedule_next_check(flight, found, results)
+
+def schedule_next_check(flight: Dict[str, Any], found: Optional[Dict], results: CheckResults):
+    """Назначает следующую проверку по дням до вылета и изменчивости цены"""
+    seen_price = found.get("price") if found else None
+    if is_direct_only(flight.get("transfers")) and found and (found.get("transfers") or 0) > 0:
+        seen_price = None
+    now = datetime.utcnow()
+    next_check_at, volatility, last_changed_at = next_check(flight, seen_price, now)
+    results.add_reschedule((flight["id"], now.isoformat(timespec="seconds"), next_check_at, seen_price, volatility, last_changed_at))
+
+async def check_and_notify_price_drop(checkpoint: Optional[RunCheckpoint] = None, partition: Optional[RoutePartition] = None):
+    """Проверяет подписки, которым подошло время. С partition — только маршруты этого воркера"""
+    started = time.monotonic()
+    calls_before, throttled_before, waited_before = aviasales_limiter.acquired, aviasales_limiter.throttled, aviasales_limiter.waited
+    checkpoint = checkpoint or RunCheckpoint(partition.worker_id if partition else "default")
+    now = datetime.utcnow()
+    # Прерванный запуск продолжается со своей отсечкой и без уже проверенных маршрутов
+    cutoff = await checkpoint.begin(now.isoformat(timespec="seconds"))
+    flights = get_due_tracked_flights(cutoff, now.date().isoformat())
+    groups = group_subscriptions(flights)
+    pending = {route: subs for route, subs in groups.items() if route_key(route) not in checkpoint.done}
+    if checkpoint.resumed:
+        print(f"[SCHEDULER] Resuming interrupted run {checkpoint.run_id} (cutoff {cutoff}): {len(checkpoint.done)} routes already checked")
+        metrics.inc("scheduler_runs_resumed_total")
+    if partition is not None:
+        # Состав воркеров фиксируется на весь запуск, чтобы владение маршрутами не менялось посреди него
+        members = await partition.heartbeat()
+        total_routes = len(pending)
+        pending = {route: subs for route, subs in pending.items() if partition.owns(route_key(route))}
+        print(f"[SCHEDULER] Worker {partition.worker_id} owns {len(pending)} of {total_routes} routes ({len(members)} workers)")
+    print(f"[SCHEDULER] {len(flights)} tracked flights due for check on {len(pending)} routes")
+    semaphore = asyncio.Semaphore(SCHEDULER_CONCURRENCY)
+    results = CheckResults(checkpoint, partition)
+    failed = 0
+    claimed_elsewhere = 0
+
+    async def run_route(route, subscriptions_by_date):
+        nonlocal failed, claimed_elsewhere
+        key = route_key(route)
+        async with semaphore:
+            if partition is not None and not await partition.claim(key):
+                # Маршрут сейчас проверяет другой воркер (состав только что поменялся)
+                claimed_elsewhere += 1
+                return
             try:
-                async with httpx.AsyncClient() as client:
-                    resp = await client.get(url, params=params)
-                    data = resp.json()
-                    if data.get("success") and data.get("data"):
-                        # Сначала ищем точное совпадение по номеру рейса
-                        for f in data["data"]:
-                            if (f.get("flight_number") == flight_number or not flight_number) and f.get("departure_at", "")[:10] == date:
-                                new_price = f.get("price")
-                                found_transfers = f.get("transfers", None)
-                                fresh_link = f.get("link", None)
-                                print(f"[AVIASALES] Found exact match flight {f.get('flight_number')}, price: {new_price}, transfers: {found_transfers}, link: {fresh_link}")
-                                redis_client.setex(cache_key, CACHE_TTL, json.dumps({"price": new_price, "link": fresh_link, "transfers": found_transfers}))
-                                break
-                        # Если точного совпадения нет, берем первый рейс с подходящей датой
-                        if new_price is None:
-                            for f in data["data"]:
-                                if f.get("departure_at", "")[:10] == date:
-                                    new_price = f.get("price")
-                                    found_transfers = f.get("transfers", None)
-                                    fresh_link = f.get("link", None)
-                                    print(f"[AVIASALES] Found flight with same date {f.get('flight_number')}, price: {new_price}, transfers: {found_transfers}, link: {fresh_link}")
-                                    redis_client.setex(cache_key, CACHE_TTL, json.dumps({"price": new_price, "link": fresh_link, "transfers": found_transfers}))
-                                    break
+                if partition is not None:
+                    # Пока состав менялся, маршрут мог проверить другой воркер: второй раз не уведомляем
+                    subscriptions_by_date = refresh_subscriptions(subscriptions_by_date, cutoff)
+                if subscriptions_by_date:
+                    await check_route(route, subscriptions_by_date, results)
+            except asyncio.CancelledError:
+                if partition is not None:
+                    await asyncio.shield(partition.release(key))
+                raise
             except Exception as e:
-                print(f"[SCHEDULER ERROR] Unexpected exception: {e}; content={getattr(resp, 'content', None)}")
-                data = {}
-        print(f"[SCHEDULER] Final comparison: new_price={new_price}, old_price={old_price}, found_transfers={found_transfers}")
-        # --- БАГФИКС: Проверка на пересадки ---
-        if subscribed_transfers == 0 and (found_transfers is None or found_transfers > 0):
-            print(f"[SCHEDULER] Skipping notification: user subscribed to direct flights only, but found flight has stopovers.")
-            continue
-        if new_price is not None and new_price < old_price:
-            print(f"[SCHEDULER] Price drop detected! Sending notification to chat_id={chat_id}")
-            update_flight_price(flight["id"], new_price)
-            airline = flight.get("airline", "-")
-            depart = flight.get("departure_time", "-")[:10] if flight.get("departure_time") else date
-            origin_airport = flight.get("from_city", from_city)
-            dest_airport = flight.get("to_city", to_city)
-            transfers_count = found_transfers if found_transfers is not None else flight.get("transfers", 0)
-            # --- Всегда используем свежую ссылку, если она есть ---
-            link = fresh_link
-            if not link and cached and isinstance(cached, (str, bytes)):
-                try:
-                    data = json.loads(cached)
-                    link = data.get("link")
-                except Exception:
-                    link = None
-            if not link:
-                link = ""
-            aviasales_url = f"https://www.aviasales.com{link}" if link else None
-            formatted_price = f"{new_price:,}".replace(",", " ")
-            formatted_old_price = f"{old_price:,}".replace(",", " ")
-            # Цена как гиперссылка, если есть ссылка
-            if aviasales_url:
-                price_md = f"[{formatted_price} RUB]({aviasales_url})"
-            else:
-                price_md = f"{formatted_price} RUB (ссылка не найдена)"
-            flight_card = f"{origin_airport} - {dest_airport} от {price_md}\n- Дата вылета: {depart}\n- {airline}, {transfers_count} пересадки"
-            text = f"🔥 Новый билет по вашей подписке! Цены стали ниже.\n\n{flight_card}\n\n💰 {formatted_price} руб. (было {formatted_old_price} руб.)"
-            print(f"[SCHEDULER] Sending message: {text[:100]}...")
-            await send_telegram_message(chat_id, text, reply_markup=get_unsubscribe_buttons())
-            print(f"[SCHEDULER] Message sent successfully to chat_id={chat_id}")
-        else:
-            print(f"[SCHEDULER] No price drop for this flight")
-
-async def send_telegram_message(chat_id, text, reply_markup=None):
-    payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
-    if reply_markup is not None:
-        payload["reply_markup"] = reply_markup
-    async with httpx.AsyncClient() as client:
-        await client.post(
-            TELEGRAM_API_URL,
-            json=payload
-        )
-
-def run_async_job():
-    # Диагностика памяти перед запуском задачи
+                # Упавшие маршруты не отмечаются: их подписки остаются в очереди и проверятся в следующий раз
+                failed += 1
+                print(f"[SCHEDULER ERROR] Route {route} failed: {e}")
+                traceback.print_exc()
+                if partition is not None:
+                    await partition.release(key)
+                return
+        await results.route_done(key)
+
     try:
-        snapshot1 = tracemalloc.take_snapshot()
-        asyncio.run(check_and_notify_price_drop())
-        snapshot2 = tracemalloc.take_snapshot()
-        top_stats = snapshot2.compare_to(snapshot1, 'lineno')
-        print("[TRACEMALLOC] Top 10 memory changes:")
-        for stat in top_stats[:10]:
-            print(stat)
-    except RuntimeError:
-        # Если tracemalloc не запущен, просто выполняем задачу без диагностики
-        print("[SCHEDULER] tracemalloc not started, running job without memory diagnostics")
-        asyncio.run(check_and_notify_price_drop())
-
-def start_scheduler():
-    scheduler = BackgroundScheduler()
-    # Каждые 30 минут
+        await asyncio.gather(*(run_route(route, subs) for route, subs in pending.items()))
+    finally:
+        # Проверенное до остановки или сбоя тоже сохраняется
+        await asyncio.shield(results.flush())
+    await checkpoint.finish()
+
+    duration = time.monotonic() - started
+    calls = aviasales_limiter.acquired - calls_before
+    throttled = aviasales_limiter.throttled - throttled_before
+    waited = aviasales_limiter.waited - waited_before
+    metrics.observe("scheduler_run_seconds", duration)
+    metrics.inc("scheduler_aviasales_calls_total", calls)
+    metrics.inc("scheduler_aviasales_throttled_total", throttled)
+    metrics.set_gauge("scheduler_last_run_routes", len(pending))
+    print(
+        f"[SCHEDULER] Run finished in {duration:.1f}s: {len(pending)} routes ({failed} failed, {claimed_elsewhere} claimed by other workers), "
+        f"{calls} Aviasales calls, {throttled} throttled (429), {waited:.1f}s waiting for rate limit, {results.flushes} DB writes"
+    )
+
+async def run_async_job(partition: Optional[RoutePartition] = None):
+    global _current_run
+    if _run_lock.locked():
+        print("[SCHEDULER] Previous run is still in progress, skipping this one")
+        metrics.inc("scheduler_runs_skipped_total")
+        return
+    async with _run_lock:
+        _current_run = asyncio.current_task()
+        try:
+            # Пик памяти за запуск виден в /admin/profile/jobs (подробно — при включённом tracemalloc)
+            async with profiler.job("price_tracker"):
+                await check_and_notify_price_drop(partition=partition)
+        except Exception as e:
+            print(f"[SCHEDULER ERROR] Run failed: {e}")
+            traceback.print_exc()
+        finally:
+            _current_run = None
+
+def start_scheduler(partition: Optional[RoutePartition] = None) -> AsyncIOScheduler:
+    """Запускает планировщик в текущем event loop: задача использует пулы соединений приложения.
+    С partition (отдельные воркеры, src/tracker_worker.py) проверяются только маршруты этого воркера"""
+    scheduler = AsyncIOScheduler()
+    # Каждые SCHEDULER_INTERVAL_MINUTES минут проверяются только подписки, которым подошло время.
+    # Первый запуск сразу после старта, чтобы без задержки доделать прерванный
     scheduler.add_job(
         run_async_job,
         'interval',
-        minutes=30,  # Было hours=3
+        minutes=SCHEDULER_INTERVAL_MINUTES,
         id='price_tracker_job',
-        replace_existing=True
+        replace_existing=True,
+        max_instances=1,
+        coalesce=True,
+        next_run_time=datetime.now(),
+        kwargs={"partition": partition},
     )
     scheduler.start()
-    print("[SCHEDULER] Started price tracker scheduler (interval: 30 minutes)")
-
-# Для запуска вручную (например, из main.py)
-if __name__ == "__main__":
-    tracemalloc.start()
-    start_scheduler()
-    while True:
-        time.sleep(60) 
\ No newline at end of file
+    print(f"[SCHEDULER] Started price tracker scheduler (interval: {SCHEDULER_INTERVAL_MINUTES} minutes)")
+    return scheduler
+
+async def stop_scheduler(scheduler: AsyncIOScheduler, timeout: float = SCHEDULER_STOP_TIMEOUT):
+    """Останавливает планировщик и даёт текущему запуску timeout секунд, затем прерывает его"""
+    scheduler.shutdown(wait=False)
+    run = _current_run
+    if run is not None and not run.done():
+        done, _ = await asyncio.wait({run}, timeout=timeout)
+        if not done:
+            run.cancel()
+            await asyncio.gather(run, return_exceptions=True)
+            print("[SCHEDULER] Run interrupted on shutdown, the next start resumes it from the checkpoint")
+    print("[SCHEDULER] Price tracker scheduler stopped")
+
+class LeaderScheduler:
+    """Планировщик веб-приложения под выборами лидера.
+
+    Из всех процессов (uvicorn --workers N, несколько контейнеров) проверку цен ведёт только лидер,
+    остальные обслуживают вебхуки. Потерявший аренду лидер прерывает запуск сразу —
+    новый лидер продолжит его с чекпоинта.
+    """
+
+    def __init__(self):
+        self.scheduler: Optional[AsyncIOScheduler] = None
+        self.election = LeaderElection(SCHEDULER_LEADER_KEY, self._on_elected, self._on_demoted)
+        self._stopping = False
+
+    async def start(self):
+        await self.election.start()
+
+    async def stop(self):
+        # Аренда продлевается, пока дорабатывает текущий запуск, и освобождается после него
+        self._stopping = True
+        if self.scheduler:
+            scheduler, self.scheduler = self.scheduler, None
+            await stop_scheduler(scheduler)
+        await self.election.stop()
+
+    async def _on_elected(self):
+        if not self._stopping:
+            self.scheduler = start_scheduler()
+
+    async def _on_demoted(self):
+        if self.scheduler:
+            scheduler, self.scheduler = self.scheduler, None
+            await stop_scheduler(scheduler, timeout=0)
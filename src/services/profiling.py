@@ -0,0 +1,224 @@
+import os
+import sys
+import time
+import json
+import asyncio
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import asynccontextmanager
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+from src.services.metrics import metrics
+
+# Куда складываются результаты профилирования (скачиваются через /admin/profile/files)
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_MAX_SECONDS = float(os.getenv("PROFILE_MAX_SECONDS", 120))
+CPU_SAMPLE_INTERVAL = float(os.getenv("PROFILE_CPU_INTERVAL", 0.01))
+HEAP_TRACE_FRAMES = int(os.getenv("PROFILE_HEAP_FRAMES", 25))
+HEAP_DIFF_TOP = 50
+LOOP_LAG_INTERVAL = 0.1
+
+
+class ProfilerBusy(Exception):
+    """Профилирование этого вида уже идёт"""
+
+
+def _rss_bytes() -> Optional[int]:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+def _frame_stack(frame) -> List[str]:
+    stack = []
+    while frame is not None:
+        code = frame.f_code
+        stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+        frame = frame.f_back
+    stack.reverse()
+    return stack
+
+
+def _percentile(values: List[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * share))]
+
+
+class Profiler:
+    """Профилирование по запросу: ничего не стоит, пока его не включили.
+
+    - cpu(): семплирование стеков всех потоков N секунд, результат в формате folded stacks
+      (flamegraph.pl, speedscope);
+    - heap_start() / heap_snapshot() / heap_stop(): tracemalloc включается только на время
+      исследования, каждый снимок сохраняется и сравнивается с предыдущим;
+    - loop_lag(): насколько event loop опаздывает будить задачи в течение N секунд;
+    - job(): пиковая память задачи за запуск (по tracemalloc, если он включён) и RSS после неё.
+    """
+
+    def __init__(self, directory: str = PROFILE_DIR):
+        self.directory = directory
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._cpu_lock = threading.Lock()
+        self._lag_running = False
+        self._last_heap: Optional[str] = None
+
+    def _path(self, kind: str, suffix: str) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        name = f"{kind}-{datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')}.{suffix}"
+        return os.path.join(self.directory, name)
+
+    def files(self) -> List[Dict[str, Any]]:
+        if not os.path.isdir(self.directory):
+            return []
+        result = []
+        for name in sorted(os.listdir(self.directory)):
+            path = os.path.join(self.directory, name)
+            if os.path.isfile(path):
+                result.append({"name": name, "bytes": os.path.getsize(path)})
+        return result
+
+    def file_path(self, name: str) -> Optional[str]:
+        """Путь к файлу результатов; имена с путями и чужие файлы не отдаются"""
+        if os.path.basename(name) != name or name.startswith("."):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    # --- CPU ---
+
+    def cpu(self, seconds: float, interval: float = CPU_SAMPLE_INTERVAL) -> Dict[str, Any]:
+        """Семплирует стеки всех потоков, кроме своего. Блокирующий вызов: запускать в отдельном потоке"""
+        if not self._cpu_lock.acquire(blocking=False):
+            raise ProfilerBusy("CPU profile is already running")
+        try:
+            seconds = min(seconds, PROFILE_MAX_SECONDS)
+            own = threading.get_ident()
+            names = {t.ident: t.name for t in threading.enumerate()}
+            stacks: Counter = Counter()
+            samples = 0
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                for ident, frame in sys._current_frames().items():
+                    if ident != own:
+                        stacks[";".join([names.get(ident, str(ident))] + _frame_stack(frame))] += 1
+                samples += 1
+                time.sleep(interval)
+            path = self._path("cpu", "folded")
+            with open(path, "w") as f:
+                for stack, count in stacks.most_common():
+                    f.write(f"{stack} {count}\n")
+        finally:
+            self._cpu_lock.release()
+        print(f"[PROFILE] CPU profile: {samples} samples in {seconds:g}s -> {path}")
+        return {"file": os.path.basename(path), "samples": samples, "stacks": len(stacks)}
+
+    # --- Heap ---
+
+    def heap_start(self, frames: int = HEAP_TRACE_FRAMES) -> Dict[str, Any]:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+            self._last_heap = None
+            print(f"[PROFILE] tracemalloc started ({frames} frames)")
+        return {"tracing": True}
+
+    def heap_snapshot(self) -> Dict[str, Any]:
+        """Сохраняет снимок кучи и текстовый diff с предыдущим снимком (или топ аллокаций для первого)"""
+        if not tracemalloc.is_tracing():
+            raise ProfilerBusy("tracemalloc is not running, call heap_start first")
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+        ))
+        snapshot_path = self._path("heap", "snapshot")
+        snapshot.dump(snapshot_path)
+        if self._last_heap and os.path.isfile(self._last_heap):
+            title = f"diff against {os.path.basename(self._last_heap)}"
+            stats = snapshot.compare_to(tracemalloc.Snapshot.load(self._last_heap), "lineno")
+        else:
+            title = "top allocations"
+            stats = snapshot.statistics("lineno")
+        current, peak = tracemalloc.get_traced_memory()
+        report_path = self._path("heap", "txt")
+        with open(report_path, "w") as f:
+            f.write(f"{title}; traced {current} bytes, peak {peak} bytes\n")
+            for stat in stats[:HEAP_DIFF_TOP]:
+                f.write(f"{stat}\n")
+        self._last_heap = snapshot_path
+        print(f"[PROFILE] Heap snapshot -> {snapshot_path}, report -> {report_path}")
+        return {"snapshot": os.path.basename(snapshot_path), "report": os.path.basename(report_path), "traced_bytes": current, "peak_bytes": peak}
+
+    def heap_stop(self) -> Dict[str, Any]:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            print("[PROFILE] tracemalloc stopped")
+        self._last_heap = None
+        return {"tracing": False}
+
+    # --- Event loop ---
+
+    async def loop_lag(self, seconds: float, interval: float = LOOP_LAG_INTERVAL) -> Dict[str, Any]:
+        """Запаздывание event loop: насколько позже заказанного просыпается sleep(interval)"""
+        if self._lag_running:
+            raise ProfilerBusy("Event loop lag monitor is already running")
+        self._lag_running = True
+        try:
+            seconds = min(seconds, PROFILE_MAX_SECONDS)
+            lags = []
+            deadline = time.monotonic() + seconds
+            while time.monotonic() < deadline:
+                started = time.monotonic()
+                await asyncio.sleep(interval)
+                lag = max(0.0, time.monotonic() - started - interval)
+                lags.append(lag)
+                metrics.observe("event_loop_lag_seconds", lag)
+        finally:
+            self._lag_running = False
+        result = {
+            "samples": len(lags),
+            "mean": sum(lags) / len(lags) if lags else 0.0,
+            "p50": _percentile(lags, 0.5),
+            "p99": _percentile(lags, 0.99),
+            "max": max(lags, default=0.0),
+        }
+        path = self._path("loop-lag", "json")
+        with open(path, "w") as f:
+            json.dump({**result, "interval": interval, "lags": lags}, f)
+        result["file"] = os.path.basename(path)
+        print(f"[PROFILE] Event loop lag over {seconds:g}s: p99={result['p99'] * 1000:.1f}ms max={result['max'] * 1000:.1f}ms")
+        return result
+
+    # --- Задачи ---
+
+    @asynccontextmanager
+    async def job(self, name: str):
+        """Память задачи за запуск. Пик по tracemalloc считается, только если трассировка включена"""
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+            traced_before = tracemalloc.get_traced_memory()[0]
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            stats = self.jobs.setdefault(name, {"runs": 0, "max_rss_bytes": 0, "max_peak_bytes": 0})
+            stats["runs"] += 1
+            stats["last_seconds"] = round(time.monotonic() - started, 3)
+            rss = _rss_bytes()
+            if rss is not None:
+                stats["last_rss_bytes"] = rss
+                stats["max_rss_bytes"] = max(stats["max_rss_bytes"], rss)
+                metrics.set_gauge("job_rss_bytes", rss, job=name)
+            if tracing and tracemalloc.is_tracing():
+                peak = tracemalloc.get_traced_memory()[1] - traced_before
+                stats["last_peak_bytes"] = peak
+                stats["max_peak_bytes"] = max(stats["max_peak_bytes"], peak)
+                metrics.set_gauge("job_memory_peak_bytes", stats["max_peak_bytes"], job=name)
+
+
+# Общий профилировщик процесса
+profiler = Profiler()
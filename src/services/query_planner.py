@@ -0,0 +1,102 @@
+import os
+import re
+import calendar
+from datetime import date as date_type, datetime, timedelta
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union
+
+# Сегмент диапазона внутри одного месяца, начиная с этой длины, запрашивается одним
+# месячным запросом (departure_at=YYYY-MM) вместо запросов по дням
+PLANNER_MONTH_MIN_DAYS = int(os.getenv("PLANNER_MONTH_MIN_DAYS", 5))
+# Лимит для месячного запроса: он должен покрывать весь месяц, а не 5 самых дешёвых билетов
+PLANNER_MONTH_LIMIT = int(os.getenv("PLANNER_MONTH_LIMIT", 100))
+DAY_QUERY_LIMIT = 5
+
+
+class PlannedQuery(NamedTuple):
+    """Один запрос к /v3/prices_for_dates и окно дат, до которого обрезается его ответ"""
+    departure_at: Optional[str]  # YYYY-MM-DD, YYYY-MM или None (без даты)
+    start: Optional[str] = None  # YYYY-MM-DD включительно, None — без фильтрации
+    end: Optional[str] = None
+    limit: int = DAY_QUERY_LIMIT
+
+    @property
+    def is_month(self) -> bool:
+        return bool(self.departure_at) and len(self.departure_at) == 7
+
+
+def _parse_day(value: str) -> date_type:
+    return datetime.strptime(value, "%Y-%m-%d").date()
+
+
+def parse_date_range(date: Optional[Union[str, dict]]) -> Optional[Tuple[date_type, date_type]]:
+    """Диапазон дат из параметра поиска: {"from","to"}, "A - B", "YYYY-MM" или один день"""
+    if isinstance(date, dict) and "from" in date and "to" in date:
+        date_str = f"{date['from']} - {date['to']}"
+    elif isinstance(date, str):
+        date_str = date.strip()
+    else:
+        return None
+    match = re.fullmatch(r"(\d{4}-\d{2}-\d{2})\s*-\s*(\d{4}-\d{2}-\d{2})", date_str)
+    if match:
+        start, end = _parse_day(match.group(1)), _parse_day(match.group(2))
+        return (start, end) if start <= end else (end, start)
+    if re.fullmatch(r"\d{4}-\d{2}-\d{2}", date_str):
+        day = _parse_day(date_str)
+        return day, day
+    if re.fullmatch(r"\d{4}-\d{2}", date_str):
+        year, month = int(date_str[:4]), int(date_str[5:7])
+        return date_type(year, month, 1), date_type(year, month, calendar.monthrange(year, month)[1])
+    return None
+
+
+def days_in_range(start: date_type, end: date_type) -> List[date_type]:
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def plan_days(days: Iterable[date_type], month_min_days: Optional[int] = None) -> List[PlannedQuery]:
+    """Минимальный набор запросов, покрывающий заданные дни.
+
+    Дни группируются по месяцам: если в месяце нужно не меньше month_min_days дней, делается
+    один месячный запрос с локальной фильтрацией по окну, иначе — запросы по дням.
+    Например, 2025-07-30..2025-09-02 -> 07-30, 07-31, 2025-08, 09-01, 09-02.
+    """
+    threshold = month_min_days if month_min_days is not None else PLANNER_MONTH_MIN_DAYS
+    by_month: Dict[Tuple[int, int], List[date_type]] = {}
+    for day in sorted(set(days)):
+        by_month.setdefault((day.year, day.month), []).append(day)
+    queries = []
+    for (year, month), month_days in by_month.items():
+        if len(month_days) >= threshold:
+            queries.append(PlannedQuery(
+                f"{year:04d}-{month:02d}",
+                month_days[0].isoformat(),
+                month_days[-1].isoformat(),
+                PLANNER_MONTH_LIMIT,
+            ))
+        else:
+            for day in month_days:
+                queries.append(PlannedQuery(day.isoformat(), day.isoformat(), day.isoformat()))
+    return queries
+
+
+def plan_queries(date: Optional[Union[str, dict]], month_min_days: Optional[int] = None) -> List[PlannedQuery]:
+    """Минимальный набор запросов для параметра даты из поиска (дата, диапазон, месяц или any)"""
+    if date is None or date == "any":
+        return [PlannedQuery(None)]
+    date_range = parse_date_range(date)
+    if date_range is None:
+        if isinstance(date, str):
+            # Список дат через запятую или неизвестный формат — как раньше, по дням / как есть
+            days = [d.strip() for d in re.split(r",|;| ", date) if re.fullmatch(r"\d{4}-\d{2}-\d{2}", d.strip())]
+            if days:
+                return [PlannedQuery(d, d, d) for d in days]
+            return [PlannedQuery(date)]
+        return [PlannedQuery(None)]
+    return plan_days(days_in_range(*date_range), month_min_days)
+
+
+def filter_to_window(flights: List[Dict], start: Optional[str], end: Optional[str]) -> List[Dict]:
+    """Оставляет рейсы с датой вылета внутри [start, end]"""
+    if not start or not end:
+        return flights
+    return [f for f in flights if start <= (f.get("departure_at") or "")[:10] <= end]
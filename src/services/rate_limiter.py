@@ -0,0 +1,65 @@
+import time
+import random
+import asyncio
+from typing import Optional
+
+
+class TokenBucket:
+    """Асинхронный token bucket: не больше rate запросов в секунду в среднем и не больше capacity подряд.
+
+    pause() останавливает выдачу токенов всем ожидающим (например, после 429 от сервера).
+    Счётчики acquired / throttled / waited накапливаются за всё время жизни и нужны для статистики запусков.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = max(rate, 0.001)
+        self.capacity = max(capacity or rate, 1)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock: Optional[asyncio.Lock] = None
+        self.acquired = 0
+        self.throttled = 0
+        self.waited = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens: float = 1) -> float:
+        """Ждёт токен и возвращает время ожидания в секундах"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        started = time.monotonic()
+        # Под замком ждущие обслуживаются по очереди, без гонки за один и тот же токен
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    await asyncio.sleep(self._paused_until - now)
+                    continue
+                self._refill(now)
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    break
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.waited += waited
+        return waited
+
+    def pause(self, seconds: float):
+        """Сервер попросил подождать: токены не выдаются seconds секунд"""
+        self.throttled += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+        self._tokens = 0
+
+
+def backoff_delay(attempt: int, base: float = 1.0, cap: float = 60.0, retry_after: Optional[str] = None) -> float:
+    """Задержка перед повтором: Retry-After сервера, иначе экспонента с джиттером"""
+    if retry_after:
+        try:
+            return min(float(retry_after), cap)
+        except ValueError:
+            pass
+    return min(cap, base * (2 ** attempt)) * (0.5 + random.random() / 2)
@@ -1,12 +1,33 @@
 from redis import Redis
+from redis.asyncio import Redis as AsyncRedis, BlockingConnectionPool
 from dotenv import load_dotenv
 import os, logging
 
 load_dotenv()
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Соединений в асинхронном пуле на процесс. Должно хватать на воркеры очереди
+# (каждый держит соединение на время блокирующего XREADGROUP) плюс обычные запросы
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 64))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 5))
+
+# Синхронный клиент — только для скриптов (scripts/cache_manager.py и т.п.)
 try:
     redis_client = Redis.from_url(REDIS_URL, decode_responses=True)
     redis_client.ping()
     logging.info("✅ Redis connected %s", REDIS_URL)
 except Exception as e:
     raise RuntimeError(f"Redis connection error: {e}")
+
+# Асинхронный клиент для всего, что выполняется в event loop приложения
+async_redis_pool = BlockingConnectionPool.from_url(
+    REDIS_URL,
+    max_connections=REDIS_MAX_CONNECTIONS,
+    timeout=REDIS_POOL_TIMEOUT,
+    decode_responses=True,
+)
+async_redis_client = AsyncRedis(connection_pool=async_redis_pool)
+
+
+async def close_async_redis():
+    """Закрывает соединения асинхронного пула (при остановке приложения или после разового запуска)"""
+    await async_redis_pool.disconnect()
@@ -0,0 +1,51 @@
+import uuid
+from typing import Optional
+from src.services.redis_client import async_redis_client
+
+# Захватить ключ, если он свободен, или продлить, если он уже наш
+_ACQUIRE_SCRIPT = """
+local owner = redis.call('GET', KEYS[1])
+if owner == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[1], ARGV[2])
+    return 1
+end
+if not owner then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+# Удалить ключ, только если он принадлежит нам
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLease:
+    """Аренда ключа в Redis с TTL: владеет один процесс, при его падении ключ истекает сам"""
+
+    def __init__(self, key: str, ttl_ms: int, owner: Optional[str] = None):
+        self.key = key
+        self.ttl_ms = ttl_ms
+        self.owner = owner or uuid.uuid4().hex
+        self.is_held = False
+
+    async def acquire(self) -> bool:
+        """Захватывает или продлевает аренду. Вызывать чаще, чем раз в ttl"""
+        try:
+            self.is_held = bool(await async_redis_client.eval(_ACQUIRE_SCRIPT, 1, self.key, self.owner, self.ttl_ms))
+        except Exception as e:
+            print(f"[LEASE ERROR] Failed to acquire {self.key}: {e}")
+            self.is_held = False
+        return self.is_held
+
+    async def release(self):
+        try:
+            await async_redis_client.eval(_RELEASE_SCRIPT, 1, self.key, self.owner)
+        except Exception as e:
+            print(f"[LEASE ERROR] Failed to release {self.key}: {e}")
+        self.is_held = False
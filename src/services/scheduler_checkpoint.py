@@ -0,0 +1,66 @@
+import os
+import uuid
+from typing import Optional, Set
+from src.services.redis_client import async_redis_client
+
+CHECKPOINT_KEY = "price_tracker:checkpoint:{}"
+# Незавершённый запуск старше этого считается брошенным и начинается заново
+CHECKPOINT_TTL = int(os.getenv("SCHEDULER_CHECKPOINT_TTL", 6 * 3600))
+
+
+class RunCheckpoint:
+    """Прогресс запуска проверки цен в Redis.
+
+    Хранит момент отсечки запуска (какие подписки считались «пора проверять») и проверенные маршруты.
+    Если процесс упал или был остановлен посреди запуска, следующий запуск берёт ту же отсечку
+    и пропускает уже проверенные маршруты. После успешного завершения чекпоинт удаляется.
+    Недоступный Redis не мешает проверке: запуск просто идёт без чекпоинта.
+    """
+
+    def __init__(self, name: str = "default"):
+        self.key = CHECKPOINT_KEY.format(name)
+        self.done_key = f"{self.key}:done"
+        self.run_id: Optional[str] = None
+        self.cutoff: Optional[str] = None
+        self.done: Set[str] = set()
+        self.resumed = False
+
+    async def begin(self, now: str) -> str:
+        """Продолжает прерванный запуск или начинает новый. Возвращает отсечку запуска"""
+        try:
+            saved = await async_redis_client.hgetall(self.key)
+            if saved.get("cutoff"):
+                self.run_id, self.cutoff = saved.get("run_id"), saved["cutoff"]
+                self.done = set(await async_redis_client.smembers(self.done_key))
+                self.resumed = True
+                return self.cutoff
+            self.run_id, self.cutoff = uuid.uuid4().hex, now
+            async with async_redis_client.pipeline(transaction=True) as pipe:
+                pipe.delete(self.done_key)
+                pipe.hset(self.key, mapping={"run_id": self.run_id, "cutoff": now})
+                pipe.expire(self.key, CHECKPOINT_TTL)
+                await pipe.execute()
+        except Exception as e:
+            print(f"[CHECKPOINT ERROR] Failed to load {self.key}: {e}")
+            self.run_id, self.cutoff = None, now
+        return self.cutoff
+
+    async def mark_done(self, *items: str):
+        self.done.update(items)
+        if self.run_id is None or not items:
+            return
+        try:
+            async with async_redis_client.pipeline(transaction=True) as pipe:
+                pipe.sadd(self.done_key, *items)
+                pipe.expire(self.done_key, CHECKPOINT_TTL)
+                await pipe.execute()
+        except Exception as e:
+            print(f"[CHECKPOINT ERROR] Failed to save progress for {len(items)} items: {e}")
+
+    async def finish(self):
+        if self.run_id is None:
+            return
+        try:
+            await async_redis_client.delete(self.key, self.done_key)
+        except Exception as e:
+            print(f"[CHECKPOINT ERROR] Failed to clear {self.key}: {e}")
@@ -0,0 +1,248 @@
+import os
+import time
+import asyncio
+import itertools
+import traceback
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from dotenv import load_dotenv
+from src.services.http_clients import get_http_client, TELEGRAM
+from src.services.rate_limiter import TokenBucket, backoff_delay
+from src.services.metrics import metrics
+
+load_dotenv()
+TELEGRAM_TOKEN = os.getenv("TELEGRAM_TOKEN")
+TELEGRAM_API_URL = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+
+# Лимиты Telegram: около 30 сообщений в секунду на бота и 1 в секунду в один чат
+TELEGRAM_GLOBAL_RATE = float(os.getenv("TELEGRAM_GLOBAL_RATE", 25))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv("TELEGRAM_CHAT_INTERVAL", 1.0))
+TELEGRAM_SEND_WORKERS = int(os.getenv("TELEGRAM_SEND_WORKERS", 4))
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", 5))
+TELEGRAM_DRAIN_TIMEOUT = float(os.getenv("TELEGRAM_DRAIN_TIMEOUT", 10))
+
+# Чем меньше число, тем раньше уходит сообщение: ответы пользователю обгоняют уведомления планировщика
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NOTIFICATION = 1
+PRIORITY_LABELS = {PRIORITY_INTERACTIVE: "interactive", PRIORITY_NOTIFICATION: "notification"}
+
+PostFunc = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+class OutgoingMessage:
+    __slots__ = ("chat_id", "payload", "priority", "attempts")
+
+    def __init__(self, chat_id: int, payload: Dict[str, Any], priority: int):
+        self.chat_id = chat_id
+        self.payload = payload
+        self.priority = priority
+        self.attempts = 0
+
+
+def retry_after_seconds(data: Any, headers: Optional[Dict[str, str]] = None) -> Optional[float]:
+    """retry_after из ответа 429: {"ok": false, "error_code": 429, "parameters": {"retry_after": 5}}"""
+    value = None
+    if isinstance(data, dict):
+        value = (data.get("parameters") or {}).get("retry_after")
+    if value is None and headers:
+        value = headers.get("Retry-After")
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+async def post_message(payload: Dict[str, Any]):
+    return await get_http_client(TELEGRAM).post(TELEGRAM_API_URL, json=payload)
+
+
+class TelegramOutbox:
+    """Очередь исходящих сообщений Telegram.
+
+    Общий token bucket держит темп бота, а сообщения одного чата уходят по порядку не чаще раза
+    в chat_interval секунд. Готовые к отправке чаты разбираются по приоритету первого сообщения.
+    На 429 сообщение возвращается в начало очереди своего чата, а отправка во все чаты замирает
+    на retry_after; на 5xx и ошибки сети оно повторяется с экспоненциальной паузой.
+    Пока очередь не запущена (скрипты, тесты), send() отправляет сразу с теми же повторами.
+    """
+
+    def __init__(self, rate: float = TELEGRAM_GLOBAL_RATE, chat_interval: float = TELEGRAM_CHAT_INTERVAL,
+                 workers: int = TELEGRAM_SEND_WORKERS, max_retries: int = TELEGRAM_MAX_RETRIES, post: PostFunc = post_message):
+        self.limiter = TokenBucket(rate, rate)
+        self.chat_interval = chat_interval
+        self.workers = max(1, workers)
+        self.max_retries = max_retries
+        self._post = post
+        self._chats: Dict[int, Deque[OutgoingMessage]] = {}
+        self._busy: set = set()  # чаты, стоящие в _ready, ждущие таймера или отправляемые воркером
+        self._next_allowed: Dict[int, float] = {}
+        self._timers: Dict[int, asyncio.TimerHandle] = {}
+        self._ready: Optional[asyncio.PriorityQueue] = None
+        self._seq = itertools.count()
+        self._pending = 0
+        self._idle: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    async def start(self):
+        self._ready = asyncio.PriorityQueue()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        print(f"[OUTBOX] Started {self.workers} Telegram senders ({self.limiter.rate:g} msg/s, {self.chat_interval:g}s per chat)")
+
+    async def stop(self, timeout: float = TELEGRAM_DRAIN_TIMEOUT):
+        """Дожидается отправки накопленных сообщений (не дольше timeout), затем останавливает воркеры"""
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            print(f"[OUTBOX] {self._pending} messages not sent in {timeout}s, dropped")
+        for handle in self._timers.values():
+            handle.cancel()
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._timers.clear()
+        self._chats.clear()
+        self._busy.clear()
+        self._pending = 0
+        print("[OUTBOX] Telegram senders stopped")
+
+    async def send(self, chat_id: int, payload: Dict[str, Any], priority: int = PRIORITY_INTERACTIVE):
+        """Ставит сообщение в очередь. Без запущенной очереди отправляет сразу"""
+        message = OutgoingMessage(chat_id, payload, priority)
+        if not self.running:
+            await self._send_now(message)
+            return
+        queue = self._chats.setdefault(chat_id, deque())
+        # Внутри чата приоритетное сообщение встаёт перед менее приоритетными, порядок среди равных сохраняется
+        position = len(queue)
+        while position > 0 and queue[position - 1].priority > priority:
+            position -= 1
+        queue.insert(position, message)
+        self._pending += 1
+        self._idle.clear()
+        metrics.set_gauge("telegram_outbox_pending", self._pending)
+        if chat_id not in self._busy:
+            self._busy.add(chat_id)
+            self._schedule(chat_id)
+
+    def _schedule(self, chat_id: int):
+        delay = self._next_allowed.get(chat_id, 0) - time.monotonic()
+        if delay > 0:
+            self._timers[chat_id] = asyncio.get_running_loop().call_later(delay, self._make_ready, chat_id)
+        else:
+            self._make_ready(chat_id)
+
+    def _make_ready(self, chat_id: int):
+        # Приоритет берётся в момент готовности: за время ожидания в чат мог прийти ответ пользователю
+        self._timers.pop(chat_id, None)
+        queue = self._chats.get(chat_id)
+        if queue:
+            self._ready.put_nowait((queue[0].priority, next(self._seq), chat_id))
+
+    async def _worker(self):
+        while True:
+            _, _, chat_id = await self._ready.get()
+            try:
+                await self._send_next(chat_id)
+            except Exception as e:
+                # Непредвиденная ошибка не должна останавливать отправителя
+                print(f"[OUTBOX ERROR] Sender failed on chat_id={chat_id}: {e}")
+                traceback.print_exc()
+                metrics.inc("telegram_outbox_errors_total")
+
+    async def _send_next(self, chat_id: int):
+        queue = self._chats[chat_id]
+        message = queue.popleft()
+        retry_in = None
+        try:
+            await self.limiter.acquire()
+            retry_in = await self._attempt(message)
+        finally:
+            # При непредвиденной ошибке сообщение отбрасывается, а очередь чата продолжается
+            self._next_allowed[chat_id] = time.monotonic() + max(self.chat_interval, retry_in or 0)
+            if retry_in is not None:
+                queue.appendleft(message)
+            else:
+                self._finish_message()
+            self._reschedule_chat(chat_id)
+
+    def _finish_message(self):
+        self._pending = max(0, self._pending - 1)
+        metrics.set_gauge("telegram_outbox_pending", self._pending)
+        if not self._pending:
+            self._idle.set()
+            self._forget_idle_chats()
+
+    def _reschedule_chat(self, chat_id: int):
+        queue = self._chats.get(chat_id)
+        if queue:
+            self._schedule(chat_id)
+        else:
+            self._chats.pop(chat_id, None)
+            self._busy.discard(chat_id)
+
+    def _forget_idle_chats(self):
+        now = time.monotonic()
+        for chat_id in [c for c, at in self._next_allowed.items() if at <= now and c not in self._busy]:
+            del self._next_allowed[chat_id]
+
+    async def _send_now(self, message: OutgoingMessage):
+        while True:
+            retry_in = await self._attempt(message)
+            if retry_in is None:
+                return
+            await asyncio.sleep(retry_in)
+
+    async def _attempt(self, message: OutgoingMessage) -> Optional[float]:
+        """Одна попытка отправки. None — сообщение обработано (отправлено или отброшено), иначе пауза до повтора"""
+        label = PRIORITY_LABELS.get(message.priority, str(message.priority))
+        message.attempts += 1
+        can_retry = message.attempts <= self.max_retries
+        try:
+            resp = await self._post(message.payload)
+        except Exception as e:
+            print(f"[OUTBOX ERROR] chat_id={message.chat_id} attempt {message.attempts}: {e}")
+            if can_retry:
+                metrics.inc("telegram_retries_total", reason="network")
+                return backoff_delay(message.attempts - 1)
+            metrics.inc("telegram_messages_total", priority=label, status="failed")
+            return None
+
+        if resp.status_code == 200:
+            metrics.inc("telegram_messages_total", priority=label, status="sent")
+            return None
+        try:
+            data = resp.json()
+        except ValueError:
+            data = {}
+        if resp.status_code == 429 and can_retry:
+            retry_in = retry_after_seconds(data, resp.headers) or backoff_delay(message.attempts - 1)
+            print(f"[OUTBOX] 429 for chat_id={message.chat_id}, retry in {retry_in:.0f}s")
+            metrics.inc("telegram_retries_total", reason="429")
+            # Flood control Telegram распространяется на весь бот: останавливаем отправку во все чаты
+            self.limiter.pause(retry_in)
+            return retry_in
+        if resp.status_code >= 500 and can_retry:
+            metrics.inc("telegram_retries_total", reason="5xx")
+            return backoff_delay(message.attempts - 1)
+        # 400 (разметка), 403 (бот заблокирован) и исчерпанные повторы не лечатся повтором
+        description = data.get("description") if isinstance(data, dict) else None
+        print(f"[OUTBOX ERROR] chat_id={message.chat_id} not sent: {resp.status_code} {description}")
+        metrics.inc("telegram_messages_total", priority=label, status="failed")
+        return None
+
+
+# Общая очередь процесса: ответы бота и уведомления планировщика
+telegram_outbox = TelegramOutbox()
@@ -0,0 +1,97 @@
+import os
+import time
+import socket
+import asyncio
+import hashlib
+from typing import Dict, List, Optional
+from src.services.redis_client import async_redis_client
+from src.services.redis_lease import RedisLease
+from src.services.metrics import metrics
+
+# Живые воркеры трекера: ZSET member=worker_id, score=время последнего heartbeat
+MEMBERS_KEY = "price_tracker:workers"
+CLAIM_KEY = "price_tracker:claim:{}"
+
+TRACKER_HEARTBEAT_SECONDS = float(os.getenv("TRACKER_HEARTBEAT_SECONDS", 10))
+# Воркер без heartbeat дольше этого считается ушедшим, его маршруты переходят к остальным
+TRACKER_MEMBER_TTL_SECONDS = float(os.getenv("TRACKER_MEMBER_TTL_SECONDS", 30))
+# Захват маршрута на время проверки: страховка от двойной проверки, пока воркеры по-разному видят состав
+TRACKER_ROUTE_CLAIM_TTL_MS = int(os.getenv("TRACKER_ROUTE_CLAIM_TTL_MS", 10 * 60 * 1000))
+
+
+def rendezvous_owner(key: str, members: List[str]) -> Optional[str]:
+    """Владелец ключа по rendezvous hashing: при уходе или приходе воркера переезжают только его ключи"""
+    if not members:
+        return None
+    return max(members, key=lambda member: hashlib.md5(f"{member}|{key}".encode()).digest())
+
+
+class RoutePartition:
+    """Доля маршрутов одного воркера трекера.
+
+    Воркеры отмечаются в Redis heartbeat'ом, каждый проверяет маршруты, для которых он владелец
+    по rendezvous hashing среди живых воркеров. Перед проверкой маршрут захватывается арендой,
+    поэтому в момент перебалансировки он не проверяется дважды.
+    """
+
+    def __init__(self, worker_id: Optional[str] = None):
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self.members: List[str] = [self.worker_id]
+        self._claims: Dict[str, RedisLease] = {}
+        self._stopping = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self.heartbeat()
+        self._task = asyncio.create_task(self._keep_alive())
+
+    async def stop(self):
+        """Выходит из состава сразу, не дожидаясь TTL, чтобы маршруты перешли к остальным"""
+        self._stopping.set()
+        if self._task:
+            await self._task
+        try:
+            await async_redis_client.zrem(MEMBERS_KEY, self.worker_id)
+        except Exception as e:
+            print(f"[PARTITION ERROR] Failed to leave {MEMBERS_KEY}: {e}")
+        print(f"[PARTITION] Worker {self.worker_id} left")
+
+    async def heartbeat(self) -> List[str]:
+        """Продлевает членство, убирает ушедших и обновляет состав. Без Redis остаётся прежний состав"""
+        now = time.time()
+        try:
+            async with async_redis_client.pipeline(transaction=True) as pipe:
+                pipe.zadd(MEMBERS_KEY, {self.worker_id: now})
+                pipe.zremrangebyscore(MEMBERS_KEY, "-inf", now - TRACKER_MEMBER_TTL_SECONDS)
+                pipe.zrange(MEMBERS_KEY, 0, -1)
+                members = sorted((await pipe.execute())[-1])
+        except Exception as e:
+            print(f"[PARTITION ERROR] Heartbeat failed: {e}")
+            return self.members
+        if members != self.members:
+            print(f"[PARTITION] Workers changed: {len(self.members)} -> {len(members)} ({', '.join(members)})")
+            metrics.set_gauge("tracker_workers", len(members))
+        self.members = members
+        return members
+
+    async def _keep_alive(self):
+        while not self._stopping.is_set():
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=TRACKER_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                await self.heartbeat()
+
+    def owns(self, key: str) -> bool:
+        return rendezvous_owner(key, self.members) == self.worker_id
+
+    async def claim(self, key: str) -> bool:
+        lease = RedisLease(CLAIM_KEY.format(key), TRACKER_ROUTE_CLAIM_TTL_MS, self.worker_id)
+        if not await lease.acquire():
+            return False
+        self._claims[key] = lease
+        return True
+
+    async def release(self, key: str):
+        lease = self._claims.pop(key, None)
+        if lease is not None:
+            await lease.release()
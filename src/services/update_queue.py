@@ -0,0 +1,174 @@
+import os
+import json
+import socket
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dotenv import load_dotenv
+from src.services.redis_client import async_redis_client
+from src.services.redis_lease import RedisLease
+
+load_dotenv()
+
+# Обновления Telegram кладутся в Redis Stream, разбитый на шарды по chat_id.
+# Каждый шард в каждый момент читает один процесс (аренда в Redis) одним воркером по порядку,
+# поэтому сообщения одного чата обрабатываются строго последовательно, а разные шарды — параллельно.
+WEBHOOK_QUEUE_ENABLED = os.getenv("WEBHOOK_QUEUE_ENABLED", "true").lower() == "true"
+WEBHOOK_QUEUE_SHARDS = int(os.getenv("WEBHOOK_QUEUE_SHARDS", 16))
+WEBHOOK_QUEUE_MAXLEN = int(os.getenv("WEBHOOK_QUEUE_MAXLEN", 100000))
+WEBHOOK_DRAIN_TIMEOUT = float(os.getenv("WEBHOOK_DRAIN_TIMEOUT", 25))
+
+# Telegram повторяет недоставленные обновления; update_id помним дольше окна повторов
+UPDATE_SEEN_TTL = int(os.getenv("UPDATE_SEEN_TTL", 60 * 60 * 24))
+
+STREAM_KEY = "tg:updates:{}"
+UPDATE_SEEN_KEY = "tg:update_seen:{}"
+LEASE_KEY = "tg:updates:lease:{}"
+CONSUMER_GROUP = "bot-workers"
+LEASE_TTL_MS = 30000
+READ_BLOCK_MS = 1000
+
+UpdateHandler = Callable[[Dict[str, Any]], Awaitable[Any]]
+
+
+def extract_chat_id(update: Dict[str, Any]) -> Optional[int]:
+    """chat_id из обычного сообщения или callback-кнопки"""
+    if not isinstance(update, dict):
+        return None
+    message = update.get("message") or update.get("edited_message")
+    if not message and isinstance(update.get("callback_query"), dict):
+        message = update["callback_query"].get("message")
+    chat_id = ((message or {}).get("chat") or {}).get("id") if isinstance(message, dict) else None
+    return chat_id if isinstance(chat_id, int) else None
+
+
+def is_valid_update(update: Any) -> bool:
+    return isinstance(update, dict) and isinstance(update.get("update_id"), int) and extract_chat_id(update) is not None
+
+
+def _stream_entries(response: Any) -> List[Any]:
+    """Записи из ответа XREADGROUP: формат отличается в RESP2/RESP3 и версиях redis-py"""
+    if not response:
+        return []
+    items = response.items() if isinstance(response, dict) else response
+    entries = []
+    for _, value in items:
+        if value and isinstance(value[0], list) and value[0] and isinstance(value[0][0], (list, tuple)):
+            value = value[0]
+        entries.extend(value or [])
+    return entries
+
+
+def shard_for(chat_id: int) -> int:
+    return chat_id % WEBHOOK_QUEUE_SHARDS
+
+
+async def mark_update_seen(update_id: int) -> bool:
+    """Атомарно отмечает update_id как принятый. False — это повтор уже принятого обновления"""
+    return bool(await async_redis_client.set(UPDATE_SEEN_KEY.format(update_id), 1, nx=True, ex=UPDATE_SEEN_TTL))
+
+
+async def enqueue_update(update: Dict[str, Any]) -> str:
+    """Кладёт обновление в шард его чата"""
+    stream = STREAM_KEY.format(shard_for(extract_chat_id(update)))
+    return await async_redis_client.xadd(
+        stream,
+        {"update": json.dumps(update, ensure_ascii=False)},
+        maxlen=WEBHOOK_QUEUE_MAXLEN,
+        approximate=True,
+    )
+
+
+class UpdateWorkerPool:
+    """Пул воркеров, разбирающих очередь обновлений Telegram"""
+
+    def __init__(self, handler: UpdateHandler, shards: int = WEBHOOK_QUEUE_SHARDS):
+        self.handler = handler
+        self.shards = shards
+        self.consumer = f"{socket.gethostname()}:{os.getpid()}"
+        self.leases = [RedisLease(LEASE_KEY.format(shard), LEASE_TTL_MS, self.consumer) for shard in range(shards)]
+        self._stopping = asyncio.Event()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        for shard in range(self.shards):
+            try:
+                await async_redis_client.xgroup_create(STREAM_KEY.format(shard), CONSUMER_GROUP, id="0", mkstream=True)
+            except Exception as e:
+                if "BUSYGROUP" not in str(e):
+                    raise
+        self._tasks = [asyncio.create_task(self._run_shard(shard)) for shard in range(self.shards)]
+        self._tasks.append(asyncio.create_task(self._keep_leases()))
+        print(f"[QUEUE] Started {self.shards} update workers as {self.consumer}")
+
+    async def stop(self, timeout: float = WEBHOOK_DRAIN_TIMEOUT):
+        """Перестаёт брать новые обновления и дожидается текущих. Неподтверждённые останутся в очереди"""
+        self._stopping.set()
+        if self._tasks:
+            done, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for task in pending:
+                task.cancel()
+            if pending:
+                print(f"[QUEUE] {len(pending)} workers did not finish in {timeout}s, cancelled")
+        for lease in self.leases:
+            if lease.is_held:
+                await lease.release()
+        print("[QUEUE] Update workers stopped")
+
+    async def _keep_leases(self):
+        while not self._stopping.is_set():
+            for lease in self.leases:
+                await lease.acquire()
+            try:
+                await asyncio.wait_for(self._stopping.wait(), timeout=LEASE_TTL_MS / 3000)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _handle(self, stream: str, entry_id: str, fields: Dict[str, str]):
+        try:
+            await self.handler(json.loads(fields["update"]))
+        except Exception as e:
+            # Ошибки обработки не должны стопорить шард: логируем и подтверждаем
+            print(f"[QUEUE ERROR] Failed to process {stream} {entry_id}: {e}")
+        await async_redis_client.xack(stream, CONSUMER_GROUP, entry_id)
+
+    async def _claim_pending(self, stream: str):
+        """Забирает неподтверждённые записи предыдущего владельца шарда и обрабатывает их по порядку.
+        Берутся только записи, простаивающие дольше аренды: их владелец заведомо перестал работать с шардом"""
+        start_id = "0-0"
+        while not self._stopping.is_set():
+            result = await async_redis_client.xautoclaim(stream, CONSUMER_GROUP, self.consumer, LEASE_TTL_MS, start_id, count=100)
+            start_id, entries = result[0], result[1]
+            for entry_id, fields in entries:
+                if fields:
+                    await self._handle(stream, entry_id, fields)
+                else:
+                    await async_redis_client.xack(stream, CONSUMER_GROUP, entry_id)
+            if start_id in ("0-0", b"0-0") or not entries:
+                break
+
+    async def _run_shard(self, shard: int):
+        stream = STREAM_KEY.format(shard)
+        lease = self.leases[shard]
+        next_claim = 0.0
+        loop = asyncio.get_running_loop()
+        while not self._stopping.is_set():
+            try:
+                if not lease.is_held:
+                    next_claim = 0.0
+                    await asyncio.sleep(READ_BLOCK_MS / 1000)
+                    continue
+                # Сразу после захвата шарда и затем раз в срок аренды: записи, которые бывший владелец
+                # не успел подтвердить, становятся доступны только после LEASE_TTL_MS простоя
+                if loop.time() >= next_claim:
+                    await self._claim_pending(stream)
+                    next_claim = loop.time() + LEASE_TTL_MS / 1000
+                response = await async_redis_client.xreadgroup(
+                    CONSUMER_GROUP, self.consumer, {stream: ">"}, count=1, block=READ_BLOCK_MS
+                )
+                for entry_id, fields in _stream_entries(response):
+                    await self._handle(stream, entry_id, fields)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"[QUEUE ERROR] Shard {shard}: {e}")
+                await asyncio.sleep(1)
@@ -0,0 +1,53 @@
+"""
+Отдельный воркер проверки цен. Запускается в любом количестве процессов:
+
+    python -m src.tracker_worker
+
+Воркеры делят маршруты между собой через Redis (src/services/tracker_partition.py),
+при подключении или остановке воркера доли перераспределяются сами.
+Веб-приложение при этом запускается с SCHEDULER_ENABLED=false.
+"""
+
+import os
+import signal
+import asyncio
+from dotenv import load_dotenv
+
+from src.services.price_tracker_scheduler import start_scheduler, stop_scheduler
+from src.services.tracker_partition import RoutePartition
+from src.services.http_clients import init_http_clients, close_http_clients
+from src.services.telegram_outbox import telegram_outbox
+from src.services.redis_client import close_async_redis
+from src.services.price_tracker_db import close_db
+
+load_dotenv()
+# Постоянный id (например, имя контейнера) позволяет после рестарта продолжить прерванный запуск
+TRACKER_WORKER_ID = os.getenv("TRACKER_WORKER_ID") or None
+
+
+async def run_worker():
+    await init_http_clients()
+    await telegram_outbox.start()
+    partition = RoutePartition(TRACKER_WORKER_ID)
+    await partition.start()
+    scheduler = start_scheduler(partition)
+    print(f"[WORKER] Price tracker worker {partition.worker_id} started")
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stopping.set)
+    try:
+        await stopping.wait()
+    finally:
+        await stop_scheduler(scheduler)
+        await partition.stop()
+        await telegram_outbox.stop()
+        await close_http_clients()
+        await close_async_redis()
+        close_db()
+        print(f"[WORKER] Price tracker worker {partition.worker_id} stopped")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_worker())
@@ -0,0 +1,59 @@
+import asyncio
+from src.services import aviasales_api
+
+
+def test_execute_plan_keeps_plan_order_and_isolates_errors(monkeypatch):
+    in_flight = 0
+    max_in_flight = 0
+
+    async def fake_fetch(origin, destination, departure_at, currency, transfers, limit, limiter=None, max_retries=0):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        # Более ранние даты отвечают позже, чтобы проверить детерминированный порядок
+        await asyncio.sleep(0.01 * (5 - int(departure_at[-1])))
+        in_flight -= 1
+        if departure_at.endswith("3"):
+            raise RuntimeError("boom")
+        return [{"departure_at": departure_at}]
+
+    monkeypatch.setattr(aviasales_api, "fetch_prices_for_date", fake_fetch)
+    plan = [aviasales_api.PlannedQuery(f"2025-08-0{i}") for i in range(1, 6)]
+    results = asyncio.run(aviasales_api.execute_plan("MOW", "AER", plan, concurrency=2))
+
+    assert [r.query.departure_at for r in results] == [q.departure_at for q in plan]
+    assert [r.ok for r in results] == [True, True, False, True, True]
+    flights = [f for r in results for f in r.flights]
+    assert [f["departure_at"] for f in flights] == ["2025-08-01", "2025-08-02", "2025-08-04", "2025-08-05"]
+    assert max_in_flight == 2
+
+
+class FakeResponse:
+    def __init__(self, status_code, data):
+        self.status_code = status_code
+        self._data = data
+        self.headers = {}
+
+    def json(self):
+        return self._data
+
+
+class FakeClient:
+    def __init__(self, response):
+        self.response = response
+
+    async def get(self, url, params=None):
+        return self.response
+
+
+def test_error_responses_are_not_empty_results(monkeypatch):
+    plan = [aviasales_api.PlannedQuery("2025-08", "2025-08-25", "2025-08-31", 100)]
+    for response in (FakeResponse(429, {"success": False}), FakeResponse(502, None), FakeResponse(200, {"success": False, "error": "quota"})):
+        monkeypatch.setattr(aviasales_api, "get_http_client", lambda upstream, r=response: FakeClient(r))
+        [result] = asyncio.run(aviasales_api.execute_plan("MOW", "AER", plan))
+        assert (result.ok, result.complete, result.flights) == (False, False, [])
+
+    ok = FakeResponse(200, {"success": True, "data": []})
+    monkeypatch.setattr(aviasales_api, "get_http_client", lambda upstream: FakeClient(ok))
+    [result] = asyncio.run(aviasales_api.execute_plan("MOW", "AER", plan))
+    assert (result.ok, result.complete) == (True, True)
@@ -0,0 +1,61 @@
+from src.services.city_index import CityIndex, declensions, _is_exact, _learn_from_redis, _learned_value, city_index
+
+
+def make_index():
+    index = CityIndex()
+    index.add_city({"code": "MOW", "name": "Москва", "name_en": "Moscow", "country_name": "Россия"})
+    index.add_city({"code": "LED", "name": "Санкт-Петербург", "name_en": "Saint Petersburg", "country_name": "Россия", "aliases": ["Питер"]})
+    index.add_city({"code": "AER", "name": "Сочи", "name_en": "Sochi", "country_name": "Россия"})
+    index.add_city({"code": "ROV", "name": "Ростов-на-Дону", "name_en": "Rostov-on-Don", "country_name": "Россия"})
+    index.add_city({"code": "MCT", "name": "Маскат", "name_en": "Muscat", "country_name": "Оман"})
+    return index
+
+
+def test_declensions():
+    assert "москвы" in declensions("Москва")
+    assert "санкт-петербурга" in declensions("Санкт-Петербург")
+    assert "ростова-на-дону" in declensions("Ростов-на-Дону")
+    assert declensions("Сочи") == []
+
+
+def test_lookup_forms():
+    index = make_index()
+    assert index.lookup("из Москвы")[0] == "MOW"
+    assert index.lookup("в Сочи")[0] == "AER"
+    assert index.lookup("Питер")[0] == "LED"
+    assert index.lookup("Moscow")[0] == "MOW"
+    assert index.lookup("moskva")[0] == "MOW"
+    assert index.lookup("Ростова-на-Дону")[0] == "ROV"
+
+
+def test_typos_only_suggested():
+    index = make_index()
+    # Опечатки не решаются в lookup: сначала спрашиваем автокомплит
+    assert index.lookup("Масква") is None
+    assert index.suggest("Масква")[0] == "MOW"
+    assert index.suggest("Санкт-Петрбург")[0] == "LED"
+    assert index.suggest("Абракадабра") is None
+
+
+def test_unknown_names_are_not_guessed():
+    # Страны и города вне снапшота не должны подменяться похожим известным городом
+    index = CityIndex.from_snapshot()
+    for name in ["Италия", "Греция", "Камрань", "Казахстан", "Далат", "Лион", "Бар", "Катманду"]:
+        assert index.lookup(name) is None, name
+        assert index.suggest(name) is None, name
+
+
+def test_learn():
+    index = make_index()
+    assert index.lookup("Хошимин") is None
+    index.learn("Хошимин", "SGN", "Хошимин", "Вьетнам")
+    assert index.lookup("хошимин") == ("SGN", "Хошимин", "Вьетнам")
+
+
+def test_only_exact_autocomplete_answers_are_learned():
+    assert _is_exact("хошимин", "Хошимин")
+    assert not _is_exact("Абракадабра", "Москва")
+    assert not _is_exact("Хошимин", None)
+    # Догадки, сохранённые в Redis раньше, при загрузке пропускаются
+    _learn_from_redis({"абракадабра": _learned_value("MOW", "Москва", "Россия")})
+    assert city_index.lookup("Абракадабра") is None
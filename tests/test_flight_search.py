@@ -0,0 +1,73 @@
+import asyncio
+from src.services import flight_search
+from src.services.aviasales_api import PlanResult
+
+
+class StubFlightCache:
+    def __init__(self, days):
+        self.days = dict(days)
+        self.saved = {}
+
+    async def aget_days(self, origin, destination, days, direct_only, currency="rub"):
+        return {day: self.days.get(day) for day in days}
+
+    async def asave_days(self, origin, destination, flights_by_day, direct_only, currency="rub"):
+        self.saved.update(flights_by_day)
+        return True
+
+
+def _flight(day, price):
+    return {"departure_at": f"{day}T10:00:00+03:00", "price": price}
+
+
+def test_only_missing_days_are_fetched(monkeypatch):
+    # 08-01 в кэше с рейсом, 08-02 закэширован пустым, 08-03 и 08-04 в кэше нет
+    cache = StubFlightCache({"2030-08-01": [_flight("2030-08-01", 4000)], "2030-08-02": []})
+    plans = []
+
+    async def fake_execute_plan(origin, destination, plan, **options):
+        plans.append([q.departure_at for q in plan])
+        return [
+            PlanResult(q, [_flight(q.start, 5000)] if q.start == "2030-08-03" else [], True, True)
+            for q in plan
+        ]
+
+    monkeypatch.setattr(flight_search, "flight_cache", cache)
+    monkeypatch.setattr(flight_search, "execute_plan", fake_execute_plan)
+    flights = asyncio.run(flight_search.search_flights("MOW", "AER", {"from": "2030-08-01", "to": "2030-08-04"}))
+
+    assert plans == [["2030-08-03", "2030-08-04"]]
+    assert [f["price"] for f in flights] == [4000, 5000]
+    assert cache.saved == {"2030-08-03": [_flight("2030-08-03", 5000)], "2030-08-04": []}
+
+
+def test_failed_queries_are_not_cached_as_empty(monkeypatch):
+    cache = StubFlightCache({})
+
+    async def fake_execute_plan(origin, destination, plan, **options):
+        return [PlanResult(q, [], False, False) for q in plan]
+
+    monkeypatch.setattr(flight_search, "flight_cache", cache)
+    monkeypatch.setattr(flight_search, "execute_plan", fake_execute_plan)
+    assert asyncio.run(flight_search.search_flights("MOW", "AER", "2030-08-01")) == []
+    assert cache.saved == {}
+
+
+def test_truncated_month_query_is_refetched_by_day(monkeypatch):
+    cache = StubFlightCache({})
+    plans = []
+
+    async def fake_execute_plan(origin, destination, plan, **options):
+        plans.append([q.departure_at for q in plan])
+        if plan[0].is_month:
+            # 100 самых дешёвых билетов месяца — все вне окна
+            return [PlanResult(plan[0], [], True, False)]
+        return [PlanResult(q, [_flight(q.start, 6000)] if q.start == "2030-08-30" else [], True, True) for q in plan]
+
+    monkeypatch.setattr(flight_search, "flight_cache", cache)
+    monkeypatch.setattr(flight_search, "execute_plan", fake_execute_plan)
+    flights = asyncio.run(flight_search.search_flights("MOW", "AER", {"from": "2030-08-25", "to": "2030-08-31"}))
+
+    assert plans == [["2030-08"], [f"2030-08-{d}" for d in range(25, 32)]]
+    assert [f["price"] for f in flights] == [6000]
+    assert len(cache.saved) == 7 and cache.saved["2030-08-25"] == []
@@ -0,0 +1,28 @@
+from src.services.llm_usage import _record_metrics, _static_tokens, _usage_fields, count_static_tokens, count_tokens
+from src.services.metrics import metrics
+
+
+def test_count_tokens():
+    assert count_tokens("", "gpt-3.5-turbo-1106") == 0
+    assert count_tokens("Москва Сочи 15 августа", "gpt-3.5-turbo-1106") > 0
+
+
+def test_record_metrics():
+    _record_metrics("test-model", "parser", "ok", 120, 30, 0.5)
+    _record_metrics("test-model", "parser", "cache_hit", 0, 0, 0.0)
+    assert metrics.get("llm_calls_total", model="test-model", endpoint="parser", status="ok") == 1
+    assert metrics.get("llm_calls_total", model="test-model", endpoint="parser", status="cache_hit") == 1
+    assert metrics.get("llm_prompt_tokens_total", model="test-model", endpoint="parser") == 120
+    assert metrics.snapshot()['llm_latency_seconds_count{endpoint="parser",model="test-model"}'] == 1
+
+
+def test_usage_fields_skip_zero_values():
+    fields = _usage_fields("gpt", "parser", {"calls": 1, "cache_hits": 0, "prompt_tokens": 50})
+    assert fields == {"gpt|parser|calls": 1, "gpt|parser|prompt_tokens": 50}
+
+
+def test_static_tokens_counted_once():
+    first = count_static_tokens("Системный промпт", "gpt-3.5-turbo-1106")
+    assert first == count_tokens("Системный промпт", "gpt-3.5-turbo-1106")
+    assert ("gpt-3.5-turbo-1106", "Системный промпт") in _static_tokens
+    assert count_static_tokens("Системный промпт", "gpt-3.5-turbo-1106") == first
@@ -0,0 +1,17 @@
+from src.services.metrics import Metrics
+
+
+def test_counters_and_summaries():
+    m = Metrics()
+    m.inc("telegram_updates_total", status="accepted")
+    m.inc("telegram_updates_total", status="duplicate")
+    m.inc("telegram_updates_total", status="accepted")
+    m.observe("llm_latency_seconds", 0.5, model="gpt")
+    m.observe("llm_latency_seconds", 1.5, model="gpt")
+
+    assert m.get("telegram_updates_total", status="accepted") == 2
+    snapshot = m.snapshot()
+    assert snapshot['llm_latency_seconds_count{model="gpt"}'] == 2
+    assert snapshot['llm_latency_seconds_max{model="gpt"}'] == 1.5
+    text = m.render_prometheus()
+    assert 'telegram_updates_total{status="duplicate"} 1' in text
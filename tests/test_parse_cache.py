@@ -0,0 +1,16 @@
+from datetime import datetime
+from src.services.parse_cache import build_cache_query, normalize_query
+
+TODAY = datetime(2024, 7, 10, 15, 0)
+
+
+def test_relative_days_replaced_with_dates():
+    assert normalize_query("Москва - Сочи завтра!", TODAY) == ("москва сочи 2024-07-11", True)
+    assert normalize_query("Москва Сочи 15 августа", TODAY) == ("москва сочи 15 августа", False)
+
+
+def test_weekdays_and_weekends_are_relative():
+    for text in ("Москва Сочи в пятницу", "Москва Сочи в субботу", "Москва Сочи на выходных",
+                 "Москва Сочи на следующей неделе", "Москва Сочи через 3 дня"):
+        assert normalize_query(text, TODAY)[1], text
+    assert build_cache_query("в среду", "from=Москва; to=Сочи", TODAY)[1]
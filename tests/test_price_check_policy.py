@@ -0,0 +1,33 @@
+from datetime import date, datetime, timedelta
+from src.services.price_check_policy import base_interval, next_check, update_volatility
+
+NOW = datetime(2025, 7, 10, 12, 0)
+
+
+def test_base_interval_depends_on_days_to_departure():
+    today = NOW.date()
+    assert base_interval(date(2025, 7, 11), today) == timedelta(minutes=30)
+    assert base_interval(date(2025, 7, 20), today) == timedelta(hours=1)
+    assert base_interval(date(2025, 8, 20), today) == timedelta(hours=3)
+    assert base_interval(date(2026, 1, 10), today) == timedelta(hours=12)
+
+
+def test_volatility_is_smoothed():
+    assert update_volatility(0.0, 10000, 9000) == 0.3 * 0.1
+    assert update_volatility(0.2, None, 9000) == 0.2
+
+
+def test_next_check_adapts():
+    fresh = {"date": "2025-08-20", "created_at": NOW.isoformat(), "last_seen_price": 10000, "volatility": 0.0}
+    at, volatility, changed = next_check(fresh, 10000, NOW)
+    assert at == (NOW + timedelta(hours=3)).isoformat(timespec="seconds")
+    assert changed is None
+
+    volatile = dict(fresh, volatility=0.2)
+    at, _, changed = next_check(volatile, 8000, NOW)
+    assert at == (NOW + timedelta(minutes=90)).isoformat(timespec="seconds")
+    assert changed == NOW.isoformat()
+
+    stale = dict(fresh, created_at=(NOW - timedelta(days=30)).isoformat())
+    at, _, _ = next_check(stale, 10000, NOW)
+    assert at == (NOW + timedelta(hours=6)).isoformat(timespec="seconds")
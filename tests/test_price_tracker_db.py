@@ -0,0 +1,114 @@
+import os
+import tempfile
+
+# Импорт модуля создаёт базу: не трогаем рабочую tracked_flights.db
+os.environ.setdefault("TRACKED_FLIGHTS_DB", os.path.join(tempfile.mkdtemp(), "tracked_flights.db"))
+
+import pytest
+from src.services import price_tracker_db as db
+
+
+@pytest.fixture
+def fresh_db(tmp_path, monkeypatch):
+    db.close_db()
+    monkeypatch.setattr(db, "DB_PATH", str(tmp_path / "tracked.db"))
+    db.init_db()
+    yield db
+    db.close_db()
+
+
+def _flight(number, date="2030-08-15"):
+    return {"from_city": "MOW", "to_city": "LED", "date": date, "flight_number": number, "current_price": 5000}
+
+
+def test_schema_is_migrated_to_wal_with_indexes(fresh_db):
+    conn = fresh_db.get_db_connection()
+    assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert conn.execute("PRAGMA user_version").fetchone()[0] == len(fresh_db.MIGRATIONS)
+    plan = conn.execute(
+        "EXPLAIN QUERY PLAN SELECT * FROM tracked_flights WHERE chat_id = ? AND flight_number = ? AND date = ?",
+        (1, "SU1", "2030-08-15"),
+    ).fetchall()
+    assert "idx_tracked_flights_chat_flight" in " ".join(row[-1] for row in plan)
+    conn.close()
+
+
+def test_writes_are_visible_to_readers(fresh_db):
+    fresh_db.add_tracked_flights(1, [_flight("SU1"), _flight("SU2")])
+    assert {f["flight_number"] for f in fresh_db.get_tracked_flights_for_chat(1)} == {"SU1", "SU2"}
+
+    found = fresh_db.find_flight(1, "SU1", "2030-08-15")
+    fresh_db.update_flight_price(found["id"], 4000)
+    assert fresh_db.find_flight(1, "SU1", "2030-08-15")["current_price"] == 4000
+
+    fresh_db.delete_tracked_flight(1, "SU1", "2030-08-15")
+    assert fresh_db.find_flight(1, "SU1", "2030-08-15") is None
+    fresh_db.delete_all_tracked_flights(1)
+    assert fresh_db.get_tracked_flights_for_chat(1) == []
+
+
+def test_batch_writes(fresh_db):
+    fresh_db.add_tracked_flights(1, [_flight(f"SU{i}") for i in range(5)])
+    flights = {f["flight_number"]: f for f in fresh_db.get_tracked_flights_for_chat(1)}
+    assert len(flights) == 5
+
+    fresh_db.save_check_results(
+        [(flights["SU0"]["id"], 3000)],
+        [(f["id"], "2030-08-01T10:00:00", "2030-08-01T11:00:00", 4500, 0.1, None) for f in flights.values()],
+    )
+    updated = fresh_db.find_flight(1, "SU0", "2030-08-15")
+    assert updated["current_price"] == 3000
+    assert updated["next_check_at"] == "2030-08-01T11:00:00"
+    assert updated["last_seen_price"] == 4500
+
+    deleted = fresh_db.delete_tracked_flights(1, [("SU1", "2030-08-15"), ("SU2", "2030-08-15"), ("XX", "2030-08-15")])
+    assert deleted == 2
+    assert len(fresh_db.get_tracked_flights_for_chat(1)) == 3
+
+
+def test_concurrent_migrations(tmp_path, monkeypatch):
+    import sqlite3
+    import threading
+
+    path = str(tmp_path / "race.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE tracked_flights (id INTEGER PRIMARY KEY, chat_id INTEGER, flight_number TEXT, date TEXT)")
+    # Колонка уже есть, а версия не записана — как после прерванной старой миграции
+    conn.execute("ALTER TABLE tracked_flights ADD COLUMN next_check_at TEXT")
+    conn.commit()
+    conn.close()
+
+    monkeypatch.setattr(db, "DB_PATH", path)
+    errors = []
+
+    def run():
+        try:
+            connection = db.get_db_connection()
+            db.migrate(connection)
+            connection.close()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=run) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    check = db.get_db_connection()
+    assert check.execute("PRAGMA user_version").fetchone()[0] == len(db.MIGRATIONS)
+    columns = {row[1] for row in check.execute("PRAGMA table_info(tracked_flights)")}
+    assert {"next_check_at", "last_seen_price", "volatility"} <= columns
+    check.close()
+
+
+def test_still_due_skips_rows_checked_by_another_worker(fresh_db):
+    fresh_db.add_tracked_flights(1, [_flight("SU1"), _flight("SU2")])
+    flights = {f["flight_number"]: f for f in fresh_db.get_tracked_flights_for_chat(1)}
+    fresh_db.save_check_results(
+        [(flights["SU1"]["id"], 3000)],
+        [(flights["SU1"]["id"], "2030-08-01T10:00:00", "2030-08-01T16:00:00", 3000, 0.1, None)],
+    )
+    due = fresh_db.get_still_due_tracked_flights([f["id"] for f in flights.values()], "2030-08-01T10:00:00")
+    assert [f["flight_number"] for f in due] == ["SU2"]
+    assert fresh_db.get_still_due_tracked_flights([], "2030-08-01T10:00:00") == []
@@ -0,0 +1,60 @@
+import asyncio
+from src.services import price_tracker_scheduler as scheduler
+from src.services.aviasales_api import PlanResult
+
+
+def _sub(flight_id, date, flight_number="SU1", transfers="any"):
+    return {"id": flight_id, "from_city": "mow", "to_city": "aer", "date": date, "flight_number": flight_number, "transfers": transfers}
+
+
+def _flight(day, number="SU1", price=5000):
+    return {"departure_at": f"{day}T10:00:00+03:00", "flight_number": number, "price": price}
+
+
+def test_group_subscriptions_by_route_and_date():
+    groups = scheduler.group_subscriptions([
+        _sub(1, "2030-08-01"), _sub(2, "2030-08-01", "SU2"), _sub(3, "2030-08-02"), _sub(4, "2030-08-01", transfers=0),
+    ])
+    assert set(groups) == {("MOW", "AER", False), ("MOW", "AER", True)}
+    assert [f["id"] for f in groups[("MOW", "AER", False)]["2030-08-01"]] == [1, 2]
+    assert list(groups[("MOW", "AER", True)]) == ["2030-08-01"]
+
+
+def test_plan_route_dates():
+    plan = scheduler.plan_route_dates([f"2030-08-0{i}" for i in range(1, 7)] + ["2030-09-10", "когда-нибудь"])
+    assert [q.departure_at for q in plan] == ["2030-08", "2030-09-10", "когда-нибудь"]
+    assert (plan[0].start, plan[0].end) == ("2030-08-01", "2030-08-06")
+
+
+def test_match_flight_prefers_flight_number():
+    flights = [_flight("2030-08-01", "SU1", 4000), _flight("2030-08-01", "SU2", 5000)]
+    assert scheduler.match_flight(flights, "SU2")["price"] == 5000
+    assert scheduler.match_flight(flights, "XX9")["price"] == 4000
+    assert scheduler.match_flight([], "SU1") is None
+
+
+def test_truncated_month_is_refetched_by_day(monkeypatch):
+    plans = []
+
+    async def fake_execute_plan(origin, destination, plan, **options):
+        plans.append([q.departure_at for q in plan])
+        results = []
+        for query in plan:
+            if query.departure_at == "2030-08":
+                # Упёрся в limit: из окна попал только один день
+                results.append(PlanResult(query, [_flight("2030-08-01")], True, False))
+            elif query.departure_at == "2030-08-03":
+                results.append(PlanResult(query, [_flight("2030-08-03")], True, True))
+            elif query.departure_at in ("2030-08-04", "2030-09-10"):
+                results.append(PlanResult(query, [], False, False))
+            else:
+                results.append(PlanResult(query, [], True, True))
+        return results
+
+    monkeypatch.setattr(scheduler, "execute_plan", fake_execute_plan)
+    dates = [f"2030-08-0{i}" for i in range(1, 7)] + ["2030-09-10"]
+    by_day, unknown = asyncio.run(scheduler.fetch_route_prices("MOW", "AER", False, dates))
+
+    assert plans == [["2030-08", "2030-09-10"], ["2030-08-02", "2030-08-03", "2030-08-04", "2030-08-05", "2030-08-06"]]
+    assert sorted(by_day) == ["2030-08-01", "2030-08-03"]
+    assert unknown == {"2030-08-04", "2030-09-10"}
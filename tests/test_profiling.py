@@ -0,0 +1,69 @@
+import asyncio
+import threading
+import time
+import tracemalloc
+from src.services.profiling import Profiler
+
+
+def _busy_loop(stop):
+    while not stop.is_set():
+        sum(range(1000))
+
+
+def test_cpu_profile_writes_folded_stacks(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    stop = threading.Event()
+    worker = threading.Thread(target=_busy_loop, args=(stop,), name="busy")
+    worker.start()
+    try:
+        result = profiler.cpu(0.2, interval=0.005)
+    finally:
+        stop.set()
+        worker.join()
+    content = (tmp_path / result["file"]).read_text()
+    assert result["samples"] > 0
+    assert "busy;" in content and "_busy_loop" in content
+
+
+def test_heap_snapshots_are_diffed(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    profiler.heap_start()
+    try:
+        first = profiler.heap_snapshot()
+        data = [bytearray(1000) for _ in range(100)]
+        second = profiler.heap_snapshot()
+    finally:
+        profiler.heap_stop()
+    assert not tracemalloc.is_tracing()
+    assert (tmp_path / first["snapshot"]).exists()
+    assert "diff against" in (tmp_path / second["report"]).read_text()
+    assert len(data) == 100
+
+
+def test_loop_lag_and_job_memory(tmp_path):
+    profiler = Profiler(str(tmp_path))
+
+    async def run():
+        async def blocker():
+            await asyncio.sleep(0.05)
+            time.sleep(0.1)
+
+        task = asyncio.create_task(blocker())
+        result = await profiler.loop_lag(0.3, interval=0.02)
+        await task
+        async with profiler.job("test"):
+            await asyncio.sleep(0)
+        return result
+
+    result = asyncio.run(run())
+    assert result["max"] >= 0.05
+    assert profiler.jobs["test"]["runs"] == 1
+
+
+def test_file_path_rejects_traversal(tmp_path):
+    profiler = Profiler(str(tmp_path))
+    (tmp_path / "cpu-1.folded").write_text("a 1\n")
+    assert profiler.file_path("cpu-1.folded")
+    assert profiler.file_path("../secret") is None
+    assert profiler.file_path("missing") is None
+    assert [f["name"] for f in profiler.files()] == ["cpu-1.folded"]
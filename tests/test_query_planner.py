@@ -0,0 +1,24 @@
+from src.services.query_planner import plan_queries, filter_to_window
+
+
+def test_two_month_range_uses_two_month_queries():
+    plan = plan_queries({"from": "2025-07-01", "to": "2025-08-31"})
+    assert [q.departure_at for q in plan] == ["2025-07", "2025-08"]
+    assert (plan[1].start, plan[1].end) == ("2025-08-01", "2025-08-31")
+
+
+def test_short_edges_use_day_queries():
+    plan = plan_queries({"from": "2025-07-30", "to": "2025-09-02"})
+    assert [q.departure_at for q in plan] == ["2025-07-30", "2025-07-31", "2025-08", "2025-09-01", "2025-09-02"]
+
+
+def test_single_day_month_and_any():
+    assert [q.departure_at for q in plan_queries("2025-08-15")] == ["2025-08-15"]
+    assert [q.departure_at for q in plan_queries("2025-02")] == ["2025-02"]
+    assert plan_queries("2025-02")[0].end == "2025-02-28"
+    assert [q.departure_at for q in plan_queries("any")] == [None]
+
+
+def test_filter_to_window():
+    flights = [{"departure_at": "2025-08-09T10:00:00+03:00"}, {"departure_at": "2025-08-10T10:00:00+03:00"}]
+    assert filter_to_window(flights, "2025-08-10", "2025-08-20") == flights[1:]
@@ -0,0 +1,34 @@
+import asyncio
+import time
+from src.services.rate_limiter import TokenBucket, backoff_delay
+
+
+def test_token_bucket_limits_rate():
+    async def run():
+        bucket = TokenBucket(rate=20, capacity=2)
+        started = time.monotonic()
+        for _ in range(6):
+            await bucket.acquire()
+        return time.monotonic() - started, bucket
+
+    elapsed, bucket = asyncio.run(run())
+    # 2 токена сразу, остальные 4 — по 1/20 секунды
+    assert elapsed >= 0.18
+    assert bucket.acquired == 6
+
+
+def test_pause_blocks_acquire():
+    async def run():
+        bucket = TokenBucket(rate=100, capacity=10)
+        bucket.pause(0.1)
+        return await bucket.acquire(), bucket
+
+    waited, bucket = asyncio.run(run())
+    assert waited >= 0.09
+    assert bucket.throttled == 1
+
+
+def test_backoff_delay():
+    assert backoff_delay(0, retry_after="7") == 7
+    assert 2 <= backoff_delay(2, base=1.0) <= 4
+    assert backoff_delay(10, cap=30) <= 30
@@ -0,0 +1,60 @@
+from datetime import date
+from src.core.rule_parser import parse_query
+from src.services.city_index import CityIndex
+
+TODAY = date(2025, 7, 10)  # четверг
+
+
+def make_index():
+    index = CityIndex()
+    index.add_city({"code": "MOW", "name": "Москва", "name_en": "Moscow", "country_name": "Россия"})
+    index.add_city({"code": "LED", "name": "Санкт-Петербург", "name_en": "Saint Petersburg", "country_name": "Россия", "aliases": ["Питер"]})
+    index.add_city({"code": "AER", "name": "Сочи", "name_en": "Sochi", "country_name": "Россия"})
+    index.add_city({"code": "BKK", "name": "Бангкок", "name_en": "Bangkok", "country_name": "Таиланд"})
+    return index
+
+
+def parse(text):
+    return parse_query(text, today=TODAY, index=make_index())
+
+
+def test_city_city_date():
+    parsed = parse("Москва Сочи 15.08")
+    assert parsed == {"from": "Москва", "to": "Сочи", "date": "2025-08-15", "transfers": "any", "need_clarify": []}
+
+
+def test_prepositions_and_cases():
+    parsed = parse("билеты в Сочи из Питера без пересадок")
+    assert (parsed["from"], parsed["to"], parsed["transfers"]) == ("Санкт-Петербург", "Сочи", 0)
+    assert parsed["need_clarify"] == ["date"]
+
+
+def test_date_grammar():
+    assert parse("Москва Бангкок в августе")["date"] == {"from": "2025-08-01", "to": "2025-08-31"}
+    assert parse("Москва Бангкок конец августа")["date"] == {"from": "2025-08-16", "to": "2025-08-31"}
+    assert parse("Москва Бангкок июль-август")["date"] == {"from": "2025-07-10", "to": "2025-08-31"}
+    assert parse("Москва Сочи завтра")["date"] == "2025-07-11"
+    assert parse("Москва Сочи в пятницу")["date"] == "2025-07-11"
+    assert parse("Москва Сочи в четверг")["date"] == "2025-07-17"
+    assert parse("Москва Сочи 5 марта")["date"] == "2026-03-05"
+    assert parse("Москва Сочи с 10 по 20 августа")["date"] == {"from": "2025-08-10", "to": "2025-08-20"}
+
+
+def test_past_day_range_rolls_over_to_next_year():
+    assert parse("Москва Сочи с 1 по 5 июля")["date"] == {"from": "2026-07-01", "to": "2026-07-05"}
+    # Начавшийся диапазон — с сегодняшнего дня
+    assert parse("Москва Сочи с 5 по 15 июля")["date"] == {"from": "2025-07-10", "to": "2025-07-15"}
+
+
+def test_date_only_follow_up():
+    parsed = parse("конец августа")
+    assert (parsed["from"], parsed["to"]) == ("any", "any")
+    assert parsed["date"] == {"from": "2025-08-16", "to": "2025-08-31"}
+
+
+def test_ambiguous_input_goes_to_llm():
+    assert parse("Москва Сочи когда-нибудь осенью") is None
+    assert parse("Сочи") is None
+    assert parse("Москва Москва") is None
+    assert parse("Москва Сочи 31.02") is None
+    assert parse("привет") is None
@@ -0,0 +1,143 @@
+import asyncio
+import time
+from src.services.telegram_outbox import TelegramOutbox, retry_after_seconds, PRIORITY_INTERACTIVE, PRIORITY_NOTIFICATION
+
+
+class FakeResponse:
+    def __init__(self, status_code, data=None):
+        self.status_code = status_code
+        self._data = data or {"ok": status_code == 200}
+        self.headers = {}
+
+    def json(self):
+        return self._data
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({"ok": False, "error_code": 429, "parameters": {"retry_after": 5}}) == 5
+    assert retry_after_seconds({"ok": False}, {"Retry-After": "3"}) == 3
+    assert retry_after_seconds({"ok": False}) is None
+
+
+def test_interactive_replies_go_before_notifications():
+    sent = []
+
+    async def post(payload):
+        sent.append(payload["text"])
+        return FakeResponse(200)
+
+    async def run():
+        outbox = TelegramOutbox(rate=1000, chat_interval=0, workers=1, post=post)
+        await outbox.start()
+        # Воркер занят первым уведомлением, остальное копится в очереди
+        for chat_id in range(1, 4):
+            await outbox.send(chat_id, {"chat_id": chat_id, "text": f"notify {chat_id}"}, PRIORITY_NOTIFICATION)
+        await outbox.send(99, {"chat_id": 99, "text": "reply"}, PRIORITY_INTERACTIVE)
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert sent.index("reply") <= 1
+    assert sorted(sent) == ["notify 1", "notify 2", "notify 3", "reply"]
+
+
+def test_per_chat_spacing_and_order():
+    sent = []
+
+    async def post(payload):
+        sent.append((payload["text"], time.monotonic()))
+        return FakeResponse(200)
+
+    async def run():
+        outbox = TelegramOutbox(rate=1000, chat_interval=0.05, workers=4, post=post)
+        await outbox.start()
+        for i in range(3):
+            await outbox.send(1, {"chat_id": 1, "text": str(i)})
+        await outbox.stop()
+
+    asyncio.run(run())
+    assert [text for text, _ in sent] == ["0", "1", "2"]
+    assert sent[2][1] - sent[0][1] >= 0.09
+
+
+def test_429_is_retried_after_retry_after():
+    calls = []
+
+    async def post(payload):
+        calls.append(time.monotonic())
+        if len(calls) == 1:
+            return FakeResponse(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.1}})
+        return FakeResponse(200)
+
+    async def run():
+        outbox = TelegramOutbox(rate=1000, chat_interval=0, workers=2, post=post)
+        await outbox.start()
+        await outbox.send(1, {"chat_id": 1, "text": "hi"})
+        await outbox.stop()
+        return outbox
+
+    outbox = asyncio.run(run())
+    assert len(calls) == 2
+    assert calls[1] - calls[0] >= 0.09
+    assert outbox.pending == 0
+
+
+def test_client_errors_are_not_retried():
+    calls = []
+
+    async def post(payload):
+        calls.append(payload)
+        return FakeResponse(403, {"ok": False, "description": "Forbidden: bot was blocked by the user"})
+
+    asyncio.run(TelegramOutbox(post=post).send(1, {"chat_id": 1, "text": "hi"}))
+    assert len(calls) == 1
+
+
+def test_429_pauses_all_chats():
+    calls = []
+
+    async def post(payload):
+        calls.append((payload["chat_id"], time.monotonic()))
+        if len(calls) == 1:
+            return FakeResponse(429, {"ok": False, "error_code": 429, "parameters": {"retry_after": 0.2}})
+        return FakeResponse(200)
+
+    async def run():
+        outbox = TelegramOutbox(rate=1000, chat_interval=0, workers=1, post=post)
+        await outbox.start()
+        await outbox.send(1, {"chat_id": 1, "text": "a"})
+        await outbox.send(2, {"chat_id": 2, "text": "b"})
+        await outbox.stop()
+
+    asyncio.run(run())
+    first = calls[0][1]
+    # Другой чат тоже ждёт retry_after
+    assert all(at - first >= 0.19 for _, at in calls[1:])
+
+
+def test_sender_survives_unexpected_errors():
+    sent = []
+
+    async def post(payload):
+        sent.append(payload["text"])
+        return FakeResponse(200)
+
+    async def run():
+        outbox = TelegramOutbox(rate=1000, chat_interval=0, workers=1, max_retries=0, post=post)
+        # Ошибка вне _attempt: отправитель должен продолжить работу
+        original = outbox._attempt
+
+        async def flaky(message):
+            if message.payload["text"] == "crash":
+                raise KeyError("bug")
+            return await original(message)
+
+        outbox._attempt = flaky
+        await outbox.start()
+        await outbox.send(1, {"chat_id": 1, "text": "crash"})
+        await outbox.send(1, {"chat_id": 1, "text": "after"})
+        await outbox.stop()
+        return outbox
+
+    outbox = asyncio.run(run())
+    assert sent == ["after"]
+    assert outbox.pending == 0
@@ -0,0 +1,17 @@
+from src.services.tracker_partition import rendezvous_owner
+
+
+def test_rendezvous_moves_only_leaving_worker_keys():
+    keys = [f"MOW-{i:03d}:any" for i in range(300)]
+    workers = ["w1", "w2", "w3", "w4"]
+    before = {key: rendezvous_owner(key, workers) for key in keys}
+    assert set(before.values()) == set(workers)
+
+    after = {key: rendezvous_owner(key, ["w1", "w2", "w4"]) for key in keys}
+    moved = {key for key in keys if before[key] != after[key]}
+    assert moved == {key for key in keys if before[key] == "w3"}
+
+    # Новый воркер забирает ключи только себе, остальные остаются на месте
+    joined = {key: rendezvous_owner(key, workers + ["w5"]) for key in keys}
+    assert all(joined[key] in (before[key], "w5") for key in keys)
+    assert rendezvous_owner("MOW-001:any", []) is None
@@ -0,0 +1,66 @@
+import asyncio
+import json
+from src.services import update_queue
+from src.services.update_queue import UpdateWorkerPool, _stream_entries, extract_chat_id, is_valid_update
+
+
+def test_extract_chat_id_and_validation():
+    message = {"update_id": 1, "message": {"chat": {"id": 42}, "text": "hi"}}
+    callback = {"update_id": 2, "callback_query": {"data": "x", "message": {"chat": {"id": 43}}}}
+    assert extract_chat_id(message) == 42
+    assert extract_chat_id(callback) == 43
+    assert extract_chat_id({"update_id": 3, "edited_message": {"chat": {"id": 44}}}) == 44
+    assert extract_chat_id({"update_id": 4, "message": {"chat": {"id": "42"}}}) is None
+    assert extract_chat_id(None) is None
+    assert is_valid_update(message) and is_valid_update(callback)
+    assert not is_valid_update({"message": {"chat": {"id": 42}}})
+    assert not is_valid_update({"update_id": 5, "poll": {}})
+
+
+def test_stream_entries_resp2_and_resp3():
+    entries = [("1-0", {"update": "{}"}), ("2-0", {"update": "{}"})]
+    # RESP2: [[stream, [entry, ...]]]
+    assert _stream_entries([["tg:updates:0", entries]]) == entries
+    # RESP3: {stream: [[entry, ...]]}
+    assert _stream_entries({"tg:updates:0": [entries]}) == entries
+    assert _stream_entries(None) == [] and _stream_entries([]) == []
+
+
+class FakeRedis:
+    def __init__(self, pending):
+        self.pending = pending
+        self.claims = []
+        self.acked = []
+
+    async def xautoclaim(self, stream, group, consumer, min_idle_time, start_id, count=None):
+        self.claims.append((min_idle_time, start_id))
+        if start_id == "0-0":
+            return ["5-0", self.pending, []]
+        return ["0-0", [], []]
+
+    async def xack(self, stream, group, entry_id):
+        self.acked.append(entry_id)
+
+
+def test_claim_pending_processes_and_acks(monkeypatch):
+    handled = []
+
+    async def handler(update):
+        handled.append(update["update_id"])
+        if update["update_id"] == 2:
+            raise RuntimeError("boom")
+
+    pending = [
+        ("1-0", {"update": json.dumps({"update_id": 1})}),
+        ("2-0", {"update": json.dumps({"update_id": 2})}),
+        ("3-0", None),  # запись удалена из стрима (MAXLEN), осталась только в PEL
+    ]
+    fake = FakeRedis(pending)
+    monkeypatch.setattr(update_queue, "async_redis_client", fake)
+    asyncio.run(UpdateWorkerPool(handler, shards=1)._claim_pending("tg:updates:0"))
+
+    assert handled == [1, 2]
+    # Ошибка обработчика не оставляет запись в PEL навсегда
+    assert fake.acked == ["1-0", "2-0", "3-0"]
+    # Чужие записи забираются, только простояв дольше аренды шарда
+    assert fake.claims == [(update_queue.LEASE_TTL_MS, "0-0"), (update_queue.LEASE_TTL_MS, "5-0")]